@@ -2,41 +2,136 @@ from __future__ import annotations
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
+import asyncio
+import logging
 import os
 import hmac
 import hashlib
 import json
+import time
 from typing import Annotated
 
 from fastapi import FastAPI, Header, HTTPException, Request, status
-from telegram import Bot
+from telegram import Update
+from telegram.ext import ExtBot
 
-from bot.domain.services.onboarding_service import send_instruction_package
 from bot.domain.services import user_service
 from bot.db.repository.subscription_repo import SubscriptionRepo
+from bot.db.repository.webhook_event_repo import WebhookEventRepo
+from bot.domain.services.webhook_dedupe import WebhookDedupe, lava_event_key
 from bot.domain.services.payment_service import PaymentService
+from bot.integration.telegram.outbound import OutboundDispatcher
+from bot.integration.lava.client import lava
+from bot.domain.services.admin_notify import admin_notifier, PAYMENT, card_button
+from bot.lifecycle import shutdown
+from bot.domain.services.event_log import event_log
+from bot.db.events import EventKind
+from bot.db import outbox as outbox_store
+from bot.db.connection import get_conn
+from bot.db.subscriptions import init_db
+from bot.domain.services.outbox import outbox
+from bot.latency import StageLatency
+
+logger = logging.getLogger(__name__)
 
 BOT_TOKEN           = os.getenv("TOKEN")
 ADMIN_ID            = int(os.getenv("ADMIN_ID", "0"))
 LAVA_WEBHOOK_SECRET = os.getenv("LAVA_WEBHOOK_SECRET")
 DB_PATH             = os.getenv("DB_PATH", "data/bot.sqlite3")
 
+# Если задан публичный URL — бот работает в режиме вебхука в этом же процессе:
+# один event loop, один пул HTTP-соединений к Telegram и один слой БД.
+TG_WEBHOOK_URL      = os.getenv("TELEGRAM_WEBHOOK_URL", "").rstrip("/")
+TG_WEBHOOK_SECRET   = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+TG_WEBHOOK_PATH     = "/telegram/webhook"
+
 if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN не задан в .env")
 if not LAVA_WEBHOOK_SECRET:
     raise RuntimeError("LAVA_WEBHOOK_SECRET не задан в .env")
 
 app = FastAPI(title="Lava webhook backend")
-bot = Bot(BOT_TOKEN)
+
+application = None
+if TG_WEBHOOK_URL:
+    from bot.main import build_application
+
+    application = build_application(polling=False)
+    bot = application.bot
+else:
+    bot = ExtBot(BOT_TOKEN, rate_limiter=OutboundDispatcher(rate=float(os.getenv("OUTBOUND_RATE", "25"))))
 
 repo: SubscriptionRepo
 psvc: PaymentService
+dedupe: WebhookDedupe
+
+# Этапы приёма вебхука Lava (verify/dedupe/persist/ack) и фоновой обработки (confirm).
+# Отправки в Telegram — в метриках outbox по видам эффектов.
+webhook_latency = StageLatency()
 
 @app.on_event("startup")
 async def startup_event():
-    global repo, psvc
+    global repo, psvc, dedupe
     repo = await SubscriptionRepo.open(DB_PATH)
     psvc = PaymentService(repo)
+    dedupe = WebhookDedupe(await WebhookEventRepo.open(DB_PATH, db=repo.db))
+    await lava.open()
+
+    init_db()
+    outbox.register(outbox_store.LAVA_PAYMENT, _process_lava_payment)
+    if application is None:
+        await bot.initialize()
+        admin_notifier.start(bot, ADMIN_ID)
+        shutdown.on_drain("admin_digest", admin_notifier.stop)
+        event_log.start()
+        shutdown.on_drain("event_log", event_log.stop)
+        outbox.start(bot)
+        shutdown.on_drain("outbox", outbox.stop)
+    else:
+        await application.initialize()
+        # run_polling/run_webhook здесь не используются, поэтому хуки вызываем сами
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await application.bot.set_webhook(
+            url=f"{TG_WEBHOOK_URL}{TG_WEBHOOK_PATH}",
+            secret_token=TG_WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if application is None:
+        await shutdown.drain()
+        await bot.shutdown()
+    else:
+        await application.stop()        # DrainingApplication: сначала shutdown.drain()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+    await lava.close()
+    await repo.close()
+
+
+@app.post(TG_WEBHOOK_PATH, status_code=200)
+async def telegram_webhook(
+    request: Request,
+    x_telegram_secret: Annotated[str | None, Header(alias="X-Telegram-Bot-Api-Secret-Token")] = None,
+):
+    if application is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Telegram webhook is disabled")
+    if TG_WEBHOOK_SECRET and not hmac.compare_digest(x_telegram_secret or "", TG_WEBHOOK_SECRET):
+        raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid secret token")
+
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid JSON body")
+
+    # Обработка идёт в фоне внутри Application — Telegram получает ответ сразу.
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return {"ok": True}
 
 
 def verify_signature(secret: str, body: bytes, header_sig: str) -> bool:
@@ -48,36 +143,91 @@ async def lava_webhook(
     request: Request,
     x_lava_signature: Annotated[str, Header(alias="X-Lava-Signature")],
 ):
+    received = time.perf_counter()
     body = await request.body()
 
-    if not verify_signature(LAVA_WEBHOOK_SECRET, body, x_lava_signature):
-        raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid signature")
+    with webhook_latency.stage("verify"):
+        if not verify_signature(LAVA_WEBHOOK_SECRET, body, x_lava_signature):
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid signature")
 
-    try:
-        payload = json.loads(body)
-    except json.JSONDecodeError:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid JSON body")
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid JSON body")
 
     if payload.get("status") != "success":
         return {"ok": True}
+
+    # Повтор того же события от Lava: ответ 200 без подписок и Telegram.
+    key = lava_event_key(payload, body)
+    with webhook_latency.stage("dedupe"):
+        fresh = await dedupe.begin(key)
+    if not fresh:
+        return {"ok": True, "duplicate": True}
+
+    # Ответ Lava — сразу после записи события в outbox; подтверждение платежа
+    # и сообщения пользователю выполняет воркер outbox с повторами.
     try:
-        user_id = await psvc.confirm_payment(payload)
-    except Exception as e:
-        print("[webhook] confirm_payment error:", e)
-        return {"ok": False}
+        with webhook_latency.stage("persist"):
+            await asyncio.to_thread(_persist_lava_event, key, payload)
+    except Exception:
+        logger.exception("lava webhook: persist of %s failed", key)
+        await dedupe.failed(key)
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Try again later")
+    await dedupe.done(key)
+    outbox.wake()
+
+    webhook_latency.observe("ack", time.perf_counter() - received)
+    return {"ok": True}
 
+
+def _persist_lava_event(key: str, payload: dict) -> None:
+    conn = get_conn()
     try:
-        await bot.send_message(user_id, "✅ Платёж прошёл! Доступ активирован.")
-        await send_instruction_package(bot, user_id)
-
-        tg_user = f"[{user_id}](tg://user?id={user_id})"
-        if ADMIN_ID:
-            await bot.send_message(
-            ADMIN_ID,
-            f"✅ Платёж от пользователя {tg_user} подтверждён Lava.",
-            parse_mode="Markdown",
-        )
-    except Exception as e:
-        print("[webhook] telegram notification error:", e)
+        with conn:
+            outbox_store.enqueue(conn, outbox_store.LAVA_PAYMENT, None, {"key": key, "event": payload})
+    finally:
+        conn.close()
 
-    return {"ok": True}
+
+def _enqueue_payment_notices(user_id: int) -> None:
+    conn = get_conn()
+    try:
+        with conn:
+            # Инструкции — только после сообщения об оплате (см. "then" в NOTICE).
+            outbox_store.enqueue(conn, outbox_store.NOTICE, user_id, {
+                "text": "✅ Платёж прошёл! Доступ активирован.",
+                "then": outbox_store.INSTRUCTIONS,
+            })
+    finally:
+        conn.close()
+
+
+async def _process_lava_payment(bot, _user_id, row: dict) -> None:
+    """Эффект outbox: подтверждение платежа, затем сообщения — отдельными строками outbox.
+
+    Повтор после сбоя безопасен: mark_paid меняет только pending-строку,
+    а платёж с тем же ключом события (contractId или хэш тела) в payments
+    не задваивается.
+    """
+    key, payload = row["key"], row["event"]
+    with webhook_latency.stage("confirm"):
+        user_id = await psvc.confirm_payment(payload, event_key=key)
+    await asyncio.to_thread(_enqueue_payment_notices, user_id)
+    outbox.wake()
+    event_log.record(user_id, EventKind.PAID, psvc.revenue_fields(payload)["amount"] or None)
+    admin_notifier.notify(
+        PAYMENT,
+        f'<a href="tg://user?id={user_id}">{user_id}</a> — платёж подтверждён Lava',
+        [card_button(user_id)],
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "webhook": webhook_latency.stats(),
+        "dedupe": dedupe.stats(),
+        "outbox": outbox.stats(),
+        "lava": {**lava.stats(), **psvc.stats()},
+    }
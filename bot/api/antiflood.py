@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from typing import Dict, Iterable, Tuple
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+
+class AntiFlood:
+    """Пред-хендлер (group=-1): ограничивает частоту апдейтов от одного пользователя.
+
+    * token bucket на пользователя: ``burst`` апдейтов подряд, дальше ``rate`` в секунду;
+    * повторное нажатие той же inline-кнопки в течение ``dup_window`` секунд отбрасывается.
+
+    Отброшенный callback закрывается дешёвым ``q.answer()``, остальные апдейты
+    просто не доходят до хендлеров (ApplicationHandlerStop).
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = 1.0,
+        burst: int = 5,
+        dup_window: float = 1.5,
+        exempt: Iterable[int] = (),
+        max_tracked: int = 50_000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.dup_window = dup_window
+        self.exempt = set(exempt)
+        self.max_tracked = max_tracked
+        self._buckets: Dict[int, Tuple[float, float]] = {}   # uid -> (tokens, ts)
+        self._last_cb: Dict[int, Tuple[str, float]] = {}     # uid -> (data, ts)
+        self.passed = 0
+        self.dropped: Counter[str] = Counter()
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self.check, block=True)
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if not user or user.id in self.exempt:
+            return
+
+        now = time.monotonic()
+        q = update.callback_query
+        if q is not None:
+            data = q.data or ""
+            last = self._last_cb.get(user.id)
+            self._last_cb[user.id] = (data, now)
+            if last and last[0] == data and now - last[1] < self.dup_window:
+                await self._drop(update, "duplicate_callback")
+
+        tokens, ts = self._buckets.get(user.id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - ts) * self.rate)
+        if tokens < 1.0:
+            self._buckets[user.id] = (tokens, now)
+            await self._drop(update, "rate_limited")
+        self._buckets[user.id] = (tokens - 1.0, now)
+
+        self.passed += 1
+        if len(self._buckets) > self.max_tracked:
+            self._prune(now)
+
+    async def _drop(self, update: Update, reason: str) -> None:
+        self.dropped[reason] += 1
+        logger.debug("antiflood: drop %s from user=%s", reason, update.effective_user.id)
+        if update.callback_query is not None:
+            try:
+                await update.callback_query.answer()
+            except TelegramError:
+                pass
+        raise ApplicationHandlerStop
+
+    def _prune(self, now: float) -> None:
+        # Ведро, простоявшее дольше времени полного восполнения, ничем не отличается
+        # от нового — такие записи можно забыть.
+        full_after = self.burst / self.rate if self.rate else 0.0
+        self._buckets = {u: v for u, v in self._buckets.items() if now - v[1] < full_after}
+        self._last_cb = {u: v for u, v in self._last_cb.items() if now - v[1] < self.dup_window}
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "passed": self.passed,
+            "tracked_users": len(self._buckets),
+            **{f"dropped_{k}": v for k, v in sorted(self.dropped.items())},
+        }
@@ -1,4 +1,7 @@
-import logging, asyncio
+import asyncio
+import logging
+import tempfile
+from datetime import datetime
 from telegram import (
     Update,
     KeyboardButton,
@@ -10,8 +13,15 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 from bot.decorators import admin_only
 from bot.config import settings
-from bot.utils import fmt_table, send_long
-from bot.domain.services import user_service, payment_service, referral_service
+from bot.utils import fmt_table, send_long, allowed_price_amounts
+from bot.domain.services import user_service, referral_service
+from bot.domain.services.admin_notify import admin_notifier
+from bot.db import stats
+from bot.db.revenue import revenue_report
+from bot.db.connection import DB_PATH
+from bot.db.events import EventKind
+from bot.domain.services.event_log import event_log
+from bot.domain.services.outbox import outbox
 import os
 
 logger = logging.getLogger(__name__)
@@ -24,19 +34,12 @@ def _fmt_money_rub(amount: int | float) -> str:
         return str(amount)
 
 
-def _allowed_amounts_from_env() -> list[int]:
-    amounts: list[int] = []
-    for key, val in os.environ.items():
-        if key.startswith("LAVA_LINK_") and val:
-            tail = key.removeprefix("LAVA_LINK_")
-            if tail.isdigit():
-                amounts.append(int(tail))
-    return sorted(set(amounts))
-
-
 @admin_only(settings.ADMIN_ID)
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    total, paid, money = payment_service.global_stats()
+    # Счётчики ведут триггеры (bot/db/stats.py) — здесь только чтение по ключу.
+    c = stats.global_stats()
+    total, paid, trials = c["users_total"], c["active_paid"], c["active_trials"]
+    money = " · ".join(_money(cur, amount) for cur, amount in stats.revenue_by_currency(c)) or _money("RUB", 0)
     leaders = referral_service.top(5)
 
     ref_lines = [f"{i+1}. <code>{uid}</code> — {cnt}" for i, (uid, cnt) in enumerate(leaders)] or ["-"]
@@ -45,72 +48,204 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     text = (
         "📊 <b>Общая статистика</b>\n"
         f"• Пользователей всего: <b>{total}</b>\n"
-        f"• Оплатили: <b>{paid}</b> ({percent})\n"
-        f"• Сумма платежей: <b>{_fmt_money_rub(money)} ₽</b>\n"
+        f"• Активных подписок: <b>{paid}</b> ({percent})\n"
+        f"• Активных фритрайлов: <b>{trials}</b>\n"
+        f"• Сумма платежей: <b>{money}</b>\n"
         f"• <u>ТОП-5 рефералов</u> (по числу приглашённых):\n" + "\n".join(ref_lines)
     )
     await update.message.reply_text(text, parse_mode=ParseMode.HTML)
 
 
+REVENUE_DAY_LINES = 14
+
+
+def _money(currency: str, amount: int) -> str:
+    return f"{_fmt_money_rub(amount)} {'₽' if currency == 'RUB' else currency}"
+
+
+@admin_only(settings.ADMIN_ID)
+async def revenue_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/revenue [дней] — выручка из revenue_daily (по умолчанию за 30 дней)."""
+    try:
+        days = int(context.args[0]) if context.args else 30
+    except ValueError:
+        await update.message.reply_text("Использование: /revenue [дней]")
+        return
+    days = max(1, min(days, 3650))
+
+    rep = await asyncio.to_thread(revenue_report, days)
+    if not rep.total:
+        await update.message.reply_text(f"За {days} дн. платежей нет.")
+        return
+
+    def section(title: str, rows, empty: str = "—") -> list[str]:
+        return [f"<u>{title}</u>"] + [
+            f"• {value or empty}: {n} шт. — <b>{_money(cur, amount)}</b>" for value, cur, n, amount in rows
+        ]
+
+    lines = [f"💰 <b>Выручка за {days} дн.</b>"]
+    lines += [f"• Итого: {n} шт. — <b>{_money(cur, amount)}</b>" for cur, (n, amount) in rep.total.items()]
+    lines += section("По офферам", rep.by_offer, "без оффера")
+    lines += section("По периодичности", rep.by_periodicity, "разово")
+    lines += section("По источнику", rep.by_source)
+    lines += section(f"По дням (последние {min(days, REVENUE_DAY_LINES)})", rep.by_day[:REVENUE_DAY_LINES])
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+def _metric_sources(application):
+    yield "Обработка апдейтов", application.update_processor
+    yield "Состояние пользователей", application.persistence
+    yield "Антифлуд", application.bot_data.get("antiflood")
+    yield "Исходящие сообщения", application.bot.rate_limiter
+    yield "Сводки админу", admin_notifier
+    yield "Журнал событий", event_log
+    yield "Очередь побочных эффектов", outbox
+    yield "Ники пользователей", application.bot_data.get("usernames")
+
+
+@admin_only(settings.ADMIN_ID)
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    lines = ["⚙️ <b>Метрики бота</b>"]
+    lines.append(f"• Очередь апдейтов: <b>{context.application.update_queue.qsize()}</b>")
+
+    for title, source in _metric_sources(context.application):
+        stats = getattr(source, "stats", None)
+        if not stats:
+            continue
+        lines.append(f"<u>{title}</u>")
+        lines += [f"• {k}: <b>{v}</b>" for k, v in stats().items()]
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+@admin_only(settings.ADMIN_ID)
+async def tree_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/tree <uid> — реферальная структура пользователя; без аргумента — топ по всей структуре."""
+    if not context.args:
+        leaders = referral_service.top_downline(10)
+        lines = [f"{i+1}. <code>{uid}</code> — {total}" for i, (uid, total) in enumerate(leaders)] or ["-"]
+        await update.message.reply_text(
+            "🌳 <b>ТОП-10 по размеру структуры</b> (все уровни)\n" + "\n".join(lines),
+            parse_mode=ParseMode.HTML,
+        )
+        return
+
+    try:
+        uid = int(context.args[0])
+    except ValueError:
+        await update.message.reply_text("Использование: /tree <uid>")
+        return
+
+    t = referral_service.tree(uid)
+    if t is None:
+        await update.message.reply_text("Пользователь не найден в реферальном дереве.")
+        return
+
+    upline = " → ".join(f"<code>{a}</code>" for a in t.upline) or "—"
+    depths = "\n".join(f"  уровень {d}: <b>{n}</b>" for d, n in t.by_depth) or "  —"
+    direct = ", ".join(f"<code>{d}</code>" for d in t.direct) or "—"
+    more = len(t.direct) < (t.by_depth[0][1] if t.by_depth else 0)
+    text = (
+        f"🌳 <b>Структура</b> <code>{uid}</code>\n"
+        f"• Пригласили (вверх): {upline}\n"
+        f"• Всего в структуре: <b>{t.downline_total}</b>\n"
+        f"• По уровням:\n{depths}\n"
+        f"• Прямые рефералы: {direct}{' …' if more else ''}"
+    )
+    await update.message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+@admin_only(settings.ADMIN_ID)
+async def funnel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/funnel [дней] — конверсия по шагам онбординга и недельное удержание."""
+    from bot.domain.services.funnel import funnel_report
+
+    try:
+        days = int(context.args[0]) if context.args else 7
+    except ValueError:
+        await update.message.reply_text("Использование: /funnel [дней]")
+        return
+
+    await event_log.flush()
+    msg = await update.message.reply_text("⏳ Считаю воронку…")
+    try:
+        text = await funnel_report(str(DB_PATH), max(1, days))
+    except Exception as e:
+        logger.exception("funnel report failed")
+        await msg.edit_text(f"Не удалось посчитать воронку: {e}")
+        return
+    await msg.edit_text(text, parse_mode=ParseMode.HTML)
+
+
 @admin_only(settings.ADMIN_ID)
 async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Всё из БД: ники ведёт UsernameTracker (bot/api/usernames.py), рефералов — триггеры.
     limit = int(context.args[0]) if context.args else 20
-    rows = user_service.list(limit)  
-    refs = user_service.referral_counts()
+    rows = user_service.list(limit)
 
-    chats_or_exc = await asyncio.gather(
-        *(context.bot.get_chat(r[0]) for r in rows),
-        return_exceptions=True,
-    )
-    users = {}
-    for item in chats_or_exc:
-        if hasattr(item, "id"):  
-            users[item.id] = item
-        else:
-            logger.debug("get_chat failed for one of users in /list: %r", item)
-
-    data = []
-    for tg_id, role, paid, price, parent, inst, joined in rows:
-        username = "-"
-        c = users.get(tg_id)
-        if c and getattr(c, "username", None):
-            username = c.username
-
-        data.append((
+    data = [
+        (
             tg_id,
-            username,
+            username or "-",
             inst or "-",
             role,
             paid,
             price or "-",
             str(parent) if parent else "-",
-            refs.get(tg_id, 0),
+            refs,
             (joined.replace("T", " ")[:19] if isinstance(joined, str) else str(joined)),
-        ))
+        )
+        for tg_id, username, role, paid, price, parent, inst, refs, joined in rows
+    ]
 
     headers = ["TG_ID", "USER", "INST", "ROLE", "PAID", "PRICE", "PARENT", "REFS", "JOINED"]
     await send_long(context.bot, settings.ADMIN_ID, fmt_table(data, headers))
 
 
 @admin_only(settings.ADMIN_ID)
-async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [csv|xlsx] [role=..] [paid=1|0] [from=YYYY-MM-DD] [to=YYYY-MM-DD] — выгрузка одним файлом."""
+    from bot.domain.services.export import ExportFilter, export_users
+
     try:
-        uid, amount = int(context.args[0]), int(context.args[1])
-    except (IndexError, ValueError):
-        await update.message.reply_text("Использование: /price <uid> <amount>")
+        fmt, flt = ExportFilter.parse(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"Непонятный параметр: {e}\n"
+            "Использование: /export [csv|xlsx] [role=new|old|...] [paid=1|0] [from=YYYY-MM-DD] [to=YYYY-MM-DD]"
+        )
         return
 
+    fd, path = tempfile.mkstemp(prefix="users_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        try:
+            n = await asyncio.to_thread(export_users, path, fmt, flt)
+        except ImportError:
+            await update.message.reply_text("Для XLSX нужен пакет openpyxl. Используйте /export csv.")
+            return
+        with open(path, "rb") as fh:
+            await context.bot.send_document(
+                update.effective_chat.id,
+                document=fh,
+                filename=f"users_{datetime.utcnow():%Y%m%d_%H%M}.{fmt}",
+                caption=f"Пользователей: {n}",
+            )
+    finally:
+        os.unlink(path)
+
+
+async def _apply_price(bot, uid: int, amount: int) -> str:
+    """Назначает цену «Старичку» и отправляет ему оффер. Возвращает ответ для админа."""
     if amount <= 0:
-        await update.message.reply_text("Сумма должна быть положительным целым числом.")
-        return
+        return "Сумма должна быть положительным целым числом."
 
-    allowed = _allowed_amounts_from_env()
+    allowed = allowed_price_amounts()
     if allowed and amount not in allowed:
-        await update.message.reply_text(
+        return (
             "⚠️ Для этой суммы нет ссылки в .env.\n"
             "Доступные опции: " + ", ".join(f"{x}₽" for x in allowed)
         )
-        return
 
     user_service.set_field(uid, "price_offer", amount)
 
@@ -120,23 +255,30 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         hint = ""
         if allowed:
             hint = "\nДоступные опции: " + ", ".join(f"{x}₽" for x in allowed)
-        await update.message.reply_text(f"⚠️ LAVA_LINK_{amount} не найден в .env{hint}")
+        return f"⚠️ LAVA_LINK_{amount} не найден в .env{hint}"
+
+    await notify_old_price_ready(bot, uid, amount)
+    event_log.record(uid, EventKind.PRICE_SET, amount)
+    return f"Ссылка на {amount} ₽ отправлена пользователю {uid} ✅"
+
+
+@admin_only(settings.ADMIN_ID)
+async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        uid, amount = int(context.args[0]), int(context.args[1])
+    except (IndexError, ValueError):
+        await update.message.reply_text("Использование: /price <uid> <amount>")
         return
 
-    """btn = KeyboardButton(
-        text=f"💳 Оплатить {amount}₽",
-        web_app=WebAppInfo(url=lava_link),
-    )
-    markup = ReplyKeyboardMarkup([[btn]], resize_keyboard=True, one_time_keyboard=True)"""
-    """await context.bot.send_message(
-        uid,
-        f"Стоимость подписки: {amount} ₽. Нажмите кнопку для оплаты:",
-        reply_markup=markup,
-    )"""
+    await update.message.reply_text(await _apply_price(context.bot, uid, amount))
 
-    # Сообщаем админу и уведомляем пользователя
-    await update.message.reply_text(f"Ссылка на {amount} ₽ отправлена пользователю ✅")
-    await notify_old_price_ready(context.bot, uid, amount)
+
+@admin_only(settings.ADMIN_ID)
+async def price_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, uid: int, amount: int) -> None:
+    """price:<uid>:<amount> — кнопка-ярлык из сводки модерации."""
+    q = update.callback_query
+    await q.answer()
+    await q.message.reply_text(await _apply_price(context.bot, uid, amount))
 
 
 """await update.effective_message.reply_text(
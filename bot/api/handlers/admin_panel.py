@@ -1,21 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.error import BadRequest
 
-from bot.db.connection import get_conn
+from bot.db.outbox import batch_progress
+from bot.db.search import find_by_username, find_users
 
 
 from bot.config import settings
 from bot.decorators import admin_only
 from bot.domain.services.admin_service import (
+    BULK_ACTIONS,
+    BulkRequest,
+    count_bulk_targets,
     load_user_card,
     render_user_card,
     exec_action,
+    run_bulk,
 )
 
 ADMIN_ONLY = admin_only(settings.ADMIN_ID)
+FIND_LIMIT = 10
+BULK_PROGRESS_INTERVAL = 3.0
+BULK_PROGRESS_TIMEOUT = 600.0
 
 
 def _confirm_keyboard(uid: int, action: str) -> InlineKeyboardMarkup:
@@ -47,21 +57,35 @@ async def whois(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     username = context.args[0].lstrip("@")
-    conn = get_conn()
-    try:
-        row = conn.execute(
-            "SELECT tg_user_id FROM users WHERE LOWER(username)=LOWER(?) LIMIT 1",
-            (username,),
-        ).fetchone()
-    finally:
-        conn.close()
-
-    if not row:
+    uid = await asyncio.to_thread(find_by_username, username)
+
+    if uid is None:
+        await update.message.reply_text("Не найдено.")
+        return
+
+    await update.message.reply_text(
+        f"ID @{username}: <code>{uid}</code>", parse_mode="HTML"
+    )
+
+
+@ADMIN_ONLY
+async def find_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/find <ник, инста или часть id> — кнопки открывают карточку пользователя."""
+    if not context.args:
+        await update.message.reply_text("Формат: /find <ник | инста | id>")
+        return
+
+    found = await asyncio.to_thread(find_users, " ".join(context.args), FIND_LIMIT)
+    if not found:
         await update.message.reply_text("Не найдено.")
         return
 
+    rows = []
+    for uid, username, inst_nick, role in found:
+        label = " · ".join(x for x in (f"@{username}" if username else None, inst_nick, role) if x)
+        rows.append([InlineKeyboardButton(f"{uid} {label}"[:60], callback_data=f"adm:{uid}:open")])
     await update.message.reply_text(
-        f"ID @{username}: <code>{row['tg_user_id']}</code>", parse_mode="HTML"
+        f"Найдено: {len(found)}", reply_markup=InlineKeyboardMarkup(rows)
     )
 
 
@@ -82,24 +106,12 @@ async def admin_open(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 
 @ADMIN_ONLY
-async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE, uid: int, action: str) -> None:
+    """adm:<uid>:<action> — действия из карточки пользователя."""
     q = update.callback_query
-    data = q.data or ""
     await q.answer()
 
-    if not data.startswith("adm:"):
-        return
-
-    try:
-        _, uid_s, *rest = data.split(":")
-        uid = int(uid_s)
-    except Exception:
-        return
-
-    if not rest:
-        return
-
-    if rest[0] == "delete" and rest[1] == "ask":
+    if action == "delete:ask":
         await _safe_edit(
             q,
             f"Удалить пользователя <code>{uid}</code> со всеми данными?\n"
@@ -108,7 +120,17 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         return
 
-    if rest[0] == "menu":
+    if action == "open":
+        # Карточка отдельным сообщением — например, из сводки или результатов поиска.
+        card = load_user_card(uid)
+        if not card:
+            await q.message.reply_text("Пользователь не найден в БД.")
+            return
+        text, kb = render_user_card(card)
+        await q.message.reply_text(text, reply_markup=kb, parse_mode="HTML")
+        return
+
+    if action == "menu":
         card = load_user_card(uid)
         if not card:
             await _safe_edit(q, "Пользователь не найден.", None)
@@ -117,7 +139,6 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await _safe_edit(q, text, kb)
         return
 
-    action = ":".join(rest)
     result_text = await exec_action(context.bot, action, uid)
 
     card = load_user_card(uid)
@@ -127,3 +148,74 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     text, kb = render_user_card(card)
     await _safe_edit(q, text + f"\n\n<b>Готово:</b> {result_text}", kb)
+
+
+BULK_USAGE = (
+    "Формат: /bulk <действие> <id id,id ... | all | role=.. paid=0|1 from=ГГГГ-ММ-ДД to=..> [silent]\n"
+    "Действия: " + ", ".join(BULK_ACTIONS)
+)
+
+
+@ADMIN_ONLY
+async def bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/bulk — массовое действие; перед применением показывает число целей и ждёт подтверждения."""
+    try:
+        req = BulkRequest.parse(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"{BULK_USAGE}\n\nНе понял: {e}")
+        return
+
+    n = await asyncio.to_thread(count_bulk_targets, req)
+    if not n:
+        await update.message.reply_text("Под условие не попал ни один пользователь.")
+        return
+
+    # В user_data — только аргументы: цели пересчитываются при подтверждении.
+    context.user_data["bulk"] = list(context.args)
+    kb = InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"Применить к {n}", callback_data="bulk:run")],
+        [InlineKeyboardButton("Отмена", callback_data="bulk:cancel")],
+    ])
+    notify = "с уведомлением" if req.notify else "без уведомлений"
+    await update.message.reply_text(
+        f"<b>{req.action}</b> для {n} польз. ({notify}). Применить?", reply_markup=kb, parse_mode="HTML"
+    )
+
+
+@ADMIN_ONLY
+async def bulk_run_cb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    q = update.callback_query
+    await q.answer()
+    args = context.user_data.pop("bulk", None)
+    if args is None:
+        await _safe_edit(q, "Нет ожидающего массового действия.", None)
+        return
+
+    req = BulkRequest.parse(args)
+    await _safe_edit(q, f"<b>{req.action}</b>: применяю…", None)
+    res = await run_bulk(req)
+    await _safe_edit(q, res.summary(), None)
+    if res.batch:
+        # Следить за рассылкой в фоне, чтобы не держать очередь апдейтов админа.
+        context.application.create_task(_bulk_progress(q, res), name=f"bulk_progress:{res.batch}")
+
+
+async def _bulk_progress(q, res) -> None:
+    """Прогресс рассылки — по состоянию строк outbox этой операции."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BULK_PROGRESS_TIMEOUT
+    while True:
+        await asyncio.sleep(BULK_PROGRESS_INTERVAL)
+        progress = await asyncio.to_thread(batch_progress, res.batch)
+        finished = not progress["PENDING"]
+        await _safe_edit(q, res.summary(progress) + ("" if finished else "\n…"), None)
+        if finished or loop.time() > deadline:
+            return
+
+
+@ADMIN_ONLY
+async def bulk_cancel_cb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    q = update.callback_query
+    await q.answer()
+    context.user_data.pop("bulk", None)
+    await _safe_edit(q, "Массовое действие отменено.", None)
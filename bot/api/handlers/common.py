@@ -4,6 +4,8 @@ from telegram.ext import ContextTypes
 from bot.constants import IMAGE_FILE_IDS
 from bot.keyboards import INTRO_KB, MENU_KB
 from bot.domain.services import user_service
+from bot.domain.services.event_log import event_log
+from bot.db.events import EventKind
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +13,8 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     uid = update.effective_user.id
     ref_code = context.args[0] if context.args else None
 
-    user_service.register(uid, ref_code)
+    user_service.register(uid, ref_code, update.effective_user.username)
+    event_log.record(uid, EventKind.START)
 
     media = [InputMediaPhoto(fid) for fid in IMAGE_FILE_IDS]
     try:
@@ -1,25 +1,29 @@
 from __future__ import annotations
-from bot.keyboards import CHOICE_KB, ROLE_KB, MENU_KB
+from bot.keyboards import CHOICE_KB, ROLE_KB
 
 import os
+import html
 import logging
 from telegram.constants import ParseMode
 from telegram import (
     Update,
     KeyboardButton,
     ReplyKeyboardMarkup,
-    ReplyKeyboardRemove,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     WebAppInfo,
 )
 from telegram.ext import ContextTypes
-from telegram import Update
 
-from bot.db.subscriptions import safe_set_role, upsert_user_basic
 from bot.constants import Role, CallbackData, ABOUT_CHAT_ID, ABOUT_MESSAGE_ID
-from bot.domain.services import user_service
-from bot.config import settings
+from bot.domain.services import user_service, onboarding_fsm
+from bot.api.handlers.trial import send_new_user_offer
+from bot.utils import allowed_price_amounts
+from bot.domain.services.admin_notify import (
+    admin_notifier, MODERATION, card_button, price_buttons,
+)
+from bot.domain.services.event_log import event_log
+from bot.db.events import EventKind, ROLE_NEW, ROLE_OLD
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +32,7 @@ async def intro_done(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
     q = update.callback_query
     await q.answer()
+    event_log.record(q.from_user.id, EventKind.INTRO_DONE)
 
     await update.callback_query.message.reply_text(
         "Мы рады, что вы уделили нам время! Что дальше?",
@@ -63,6 +68,7 @@ async def want_join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     q = update.callback_query
     await q.answer()
+    event_log.record(q.from_user.id, EventKind.WANT_JOIN)
 
     await update.callback_query.message.reply_text(
         "Вы уже ведёте мотивационный блог или только начинаете?",
@@ -73,35 +79,30 @@ async def role_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     q = update.callback_query
     await q.answer()
     user = q.from_user
-    upsert_user_basic(user.id, user.username)
 
-    data = (q.data or "").lower()
-    role = "new" if "role_new" in data else "old"
-    safe_set_role(user.id, role)
+    is_new = (q.data or "").lower().startswith(CallbackData.ROLE_NEW.value)
+    state = onboarding_fsm.choose_role(user.id, user.username, new=is_new)
+    event_log.record(user.id, EventKind.ROLE, ROLE_NEW if is_new else ROLE_OLD)
 
-    uid = q.from_user.id
-    is_new = q.data.endswith("new")
+    if state.is_paid:
+        await q.message.reply_text("У тебя уже активная подписка ✅")
+        return
 
-    if is_new:
-        user_service.set_role(uid, Role.NEW_PENDING)
-    else:
-        user_service.set_role(uid, Role.OLD_PENDING)
+    if state.role == Role.NEW_PENDING:
+        await send_new_user_offer(context, user.id)
+    elif state.role == Role.OLD_PENDING:
         await q.message.reply_text("Отлично! Пришлите, пожалуйста, ваш ник Instagram")
 
 
 async def handle_instagram_nick(update: Update, context: ContextTypes.DEFAULT_TYPE):
     uid = update.effective_user.id
-    role = user_service.get_role(uid)
-    if role != Role.OLD_PENDING:
-        return  
-
     nickname = update.message.text.strip().lstrip("@")
     if " " in nickname or len(nickname) < 2:
         return
 
-    user_service.set_field(uid, "inst_nick", nickname)
+    if not onboarding_fsm.submit_nick(uid, nickname):
+        return
     await _ask_admin_to_check(uid, nickname, context)
-    user_service.set_role(uid, Role.OLD_PENDING)
 
 
 async def _send_payment_link(
@@ -134,9 +135,11 @@ async def _send_payment_link(
 
 
 async def _ask_admin_to_check(uid: int, nick: str, context):
-    await context.bot.send_message(settings.ADMIN_ID,f"👤 Пользователь {uid} на модерации.\n")
-    await context.bot.send_message(settings.ADMIN_ID,f"IG: @{nick}")
-    await context.bot.send_message(settings.ADMIN_ID,f"/price {uid} <amount>\n")
+    admin_notifier.notify(
+        MODERATION,
+        f"<code>{uid}</code> — IG: @{html.escape(nick)} · <code>/price {uid} &lt;amount&gt;</code>",
+        [*price_buttons(uid, allowed_price_amounts()), card_button(uid)],
+    )
     await context.bot.send_message(
         uid,
         "Ваш ник отправлен администратору на проверку. "
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import html
 import logging
 from typing import Dict, Any, Optional
 from telegram.error import BadRequest
@@ -11,14 +12,18 @@ from telegram.constants import ParseMode
 
 from bot.config import settings
 from bot.decorators import admin_only
-from bot.db.reels import create_reel, upsert_asset, list_reels, get_reel, delete_reel, set_reel_active
+from bot.db.reels import (
+    create_reel, upsert_asset, list_reels, get_reel, delete_reel, set_reel_active, reel_stats_report,
+)
 
 logger = logging.getLogger(__name__)
 
 ADMIN_ONLY = admin_only(settings.ADMIN_ID)
 
 # Состояния мастера
-VIDEO, PREVIEW, CAPTION, CONFIRM = range(4)
+from bot.constants import (
+    REEL_VIDEO as VIDEO, REEL_PREVIEW as PREVIEW, REEL_CAPTION as CAPTION, REEL_CONFIRM as CONFIRM,
+)
 
 
 def _kb_cancel() -> InlineKeyboardMarkup:
@@ -45,6 +50,13 @@ def _kb_list_item(reel_id: int, active: bool) -> InlineKeyboardMarkup:
 
 
 
+def _stats_line(sends: int, failures: int, last_sent_at: Optional[str], deactivated_at: Optional[str] = None) -> str:
+    line = f"Отправок: {sends}, ошибок: {failures}, последняя отправка: {(last_sent_at or '—')[:16]}"
+    if deactivated_at:
+        line += f"\n⚠️ Выключен автоматически {deactivated_at[:16]}"
+    return line
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Мастер добавления
 # ──────────────────────────────────────────────────────────────────────────────
@@ -233,58 +245,72 @@ async def reels_list(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         rid = r["id"]
         title = r["title"] or f"Reel #{rid}"
         active = bool(r["is_active"])
-        text = f"ID <code>{rid}</code> — <b>{title}</b>\nСтатус: {'🟢 активен' if active else '🔴 выключен'}"
+        text = (
+            f"ID <code>{rid}</code> — <b>{title}</b>\nСтатус: {'🟢 активен' if active else '🔴 выключен'}\n"
+            + _stats_line(r["sends"], r["failures"], r["last_sent_at"], r["deactivated_at"])
+        )
         await update.message.reply_text(
             text, parse_mode=ParseMode.HTML, reply_markup=_kb_list_item(rid, active)
         )
 
 
 @ADMIN_ONLY
-async def reels_manage_cb(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def reel_activate_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, reel_id: int) -> None:
     q = update.callback_query
-    data = q.data or ""
     await q.answer()
+    set_reel_active(reel_id, True)
+    await _render_reel_card(q.message, reel_id)
+    await _refresh_reels_summary(context, q.message.chat_id)
 
-    try:
-        _, action, rid_str = data.split(":")
-        reel_id = int(rid_str)
-    except Exception:
-        return
 
-    chat_id = q.message.chat_id
+@ADMIN_ONLY
+async def reel_deactivate_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, reel_id: int) -> None:
+    q = update.callback_query
+    await q.answer()
+    set_reel_active(reel_id, False)
+    await _render_reel_card(q.message, reel_id)
+    await _refresh_reels_summary(context, q.message.chat_id)
 
-    if action == "activate":
-        set_reel_active(reel_id, True)
-        await _render_reel_card(q.message, reel_id)
-        await _refresh_reels_summary(context, chat_id)
 
-    elif action == "deactivate":
-        set_reel_active(reel_id, False)
-        await _render_reel_card(q.message, reel_id)
-        await _refresh_reels_summary(context, chat_id)
+@ADMIN_ONLY
+async def reel_delete_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, reel_id: int) -> None:
+    q = update.callback_query
+    await q.answer()
+    chat_id = q.message.chat_id
+    delete_reel(reel_id)
+    # удалим карточку рилса из чата
+    try:
+        await q.message.delete()
+    except BadRequest:
+        pass
+    await _refresh_reels_summary(context, chat_id)
 
-    elif action == "delete":
-        delete_reel(reel_id)
-        # удалим карточку рилса из чата
-        try:
-            await q.message.delete()
-        except BadRequest:
-            pass
-        await _refresh_reels_summary(context, chat_id)
 
-    elif action == "show":
-        await _send_reel_preview(context.bot, chat_id, reel_id)
-        # карточку и сводку не меняем
+@ADMIN_ONLY
+async def reel_show_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, reel_id: int) -> None:
+    q = update.callback_query
+    await q.answer()
+    # карточку и сводку не меняем
+    await _send_reel_preview(context.bot, q.message.chat_id, reel_id)
 
 
 
 from bot.domain.services.reel_delivery_service import deliver_reels_daily
+from bot.lifecycle import shutdown
 
 @ADMIN_ONLY
 async def reels_send_now(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not shutdown.accepting:
+        await update.message.reply_text("⏳ Бот перезапускается, рассылка не запущена.")
+        return
     await update.message.reply_text("🚀 Запускаю разовую отправку…")
-    await deliver_reels_daily(context.application.bot)
-    await update.message.reply_text("✅ Готово.")
+
+    # Рассылка идёт в фоне, чтобы не держать очередь апдейтов админ-чата.
+    async def _run() -> None:
+        await deliver_reels_daily(context.application.bot)
+        await context.bot.send_message(update.effective_chat.id, "✅ Готово.")
+
+    context.application.create_task(_run(), update=update)
 
 
 from telegram.constants import ParseMode
@@ -332,9 +358,11 @@ async def _render_reel_card(message, reel_id: int) -> None:
     r = details["reel"]
     title = r.get("title") or f"Reel #{reel_id}"
     active = bool(r.get("is_active"))
+    st = details.get("stats") or {}
     text = (
         f"ID <code>{reel_id}</code> — <b>{title}</b>\n"
-        f"Статус: {'🟢 активен' if active else '🔴 выключен'}"
+        f"Статус: {'🟢 активен' if active else '🔴 выключен'}\n"
+        + _stats_line(st.get("sends", 0), st.get("failures", 0), st.get("last_sent_at"), st.get("deactivated_at"))
     )
     kb = _kb_list_item(reel_id, active)
     try:
@@ -373,3 +401,37 @@ async def _refresh_reels_summary(context: ContextTypes.DEFAULT_TYPE, chat_id: in
     except BadRequest:
         m = await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
         context.chat_data["reels_summary"] = {"message_id": m.message_id, "limit": limit}
+
+
+@ADMIN_ONLY
+async def reel_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/reel_stats [limit] — доставки и ошибки по рилсам, классы ошибок, круги по каталогу."""
+    try:
+        limit = int(context.args[0]) if context.args else 20
+    except ValueError:
+        limit = 20
+
+    rep = reel_stats_report(limit)
+    lines = [f"🎬 <b>Статистика рилсов</b> (активных: {rep['active']})"]
+    for r in rep["reels"]:
+        title = r["title"] or f"Reel #{r['id']}"
+        mark = "🟢" if r["is_active"] else ("⚠️" if r["deactivated_at"] else "🔴")
+        lines.append(
+            f"{mark} <b>{title}</b> (ID {r['id']}): {r['sends']} отпр., {r['failures']} ош., "
+            f"последняя {(r['last_sent_at'] or '—')[:16]}"
+        )
+        if r["failures"] and r["last_error"]:
+            lines.append(f"    └ {html.escape(r['last_error'][:120])}")
+
+    if rep["by_class"]:
+        lines.append("\n<u>Ошибки по классам</u>")
+        lines += [f"• {cls}: {n}" for cls, n in rep["by_class"]]
+
+    c = rep["cycles"]
+    if c["cycles"]:
+        avg_days = (c["avg_seconds"] or 0) / 86400
+        lines.append(
+            f"\n<u>Полный круг по каталогу</u>\n• пройдено кругов: {c['cycles']} ({c['users']} польз.)\n"
+            f"• в среднем: {avg_days:.1f} дн."
+        )
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
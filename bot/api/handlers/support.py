@@ -1,3 +1,4 @@
+import html
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -6,6 +7,7 @@ from telegram.constants import ParseMode
 
 from bot.config import settings
 from bot.decorators import admin_only
+from bot.domain.services.admin_notify import admin_notifier, SUPPORT, card_button
 
 logger = logging.getLogger(__name__)
 ADMIN_ID = settings.ADMIN_ID
@@ -18,12 +20,12 @@ async def support_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user = update.effective_user
     tg_user = f"@{user.username}" if user.username else user.first_name
 
-    await context.bot.send_message(
-        ADMIN_ID,
-        f"[Support] from {tg_user} (id={user.id}):\n{update.message.text}",
+    admin_notifier.notify(
+        SUPPORT,
+        f"{html.escape(tg_user or '')} (<code>{user.id}</code>): {html.escape(update.message.text)}\n"
+        f"   <code>/reply {user.id} </code>&lt;ответ&gt;",
+        [card_button(user.id)],
     )
-
-    await context.bot.send_message(ADMIN_ID, f"/reply {user.id} <ответ>")
     await update.message.reply_text(
         "Ваше сообщение отправлено администратору.\n"
         "Ожидайте ответ (не более 2 суток)."
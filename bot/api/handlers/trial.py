@@ -9,8 +9,11 @@ from telegram import (
 from bot.domain.services.onboarding_service import send_instruction_package
 from telegram.ext import ContextTypes
 from bot.constants import CallbackData
+from bot.integration.telegram.outbound import TRANSACTIONAL_ARGS
+from bot.domain.services.event_log import event_log
+from bot.db.events import EventKind
 from bot.db.subscriptions import (
-    upsert_user_basic, safe_set_role, is_paid,
+    upsert_user_basic, is_paid,
     start_free_trial, get_trial_info, get_role,
 )
 
@@ -41,18 +44,8 @@ def _pay_inline_kb(caption: str, role: str, amount: Optional[int], frontend_url:
         btn = InlineKeyboardButton(caption, callback_data=CallbackData.PAY_NOW.value)
     return InlineKeyboardMarkup([[btn]])
 
-async def offer_after_new_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    q = update.callback_query
-    await q.answer()
-    user = q.from_user
-    chat_id = user.id
-
-    upsert_user_basic(user.id, user.username)
-    safe_set_role(user.id, "new")
-
-    if is_paid(user.id):
-        return
-
+async def send_new_user_offer(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    """Оффер «Новичку»: фритрайл + оплата. Роль выставляет onboarding_fsm.choose_role."""
     await context.bot.send_message(chat_id=chat_id, text=TRIAL_MSG_NEW, reply_markup=_trial_kb())
 
     fe = context.application.bot_data.get("FRONTEND_URL")
@@ -68,6 +61,7 @@ async def notify_old_price_ready(bot, user_id: int, amount_rub: int, frontend_ur
         chat_id=user_id,
         text="🎁 Доступен фритрайл на 2 месяца. Нажмите кнопку ниже:",
         reply_markup=_trial_kb(),
+        rate_limit_args=TRANSACTIONAL_ARGS,
     )
 
     if not frontend_url:
@@ -83,6 +77,7 @@ async def notify_old_price_ready(bot, user_id: int, amount_rub: int, frontend_ur
         chat_id=user_id,
         text=PAY_MSG_OLD,
         reply_markup=kb,
+        rate_limit_args=TRANSACTIONAL_ARGS,
     )
 
 from datetime import datetime
@@ -103,6 +98,7 @@ async def start_free_trial_cb(update: Update, context: ContextTypes.DEFAULT_TYPE
         result = start_free_trial(user.id)
 
     if result == "STARTED":
+        event_log.record(user.id, EventKind.TRIAL_START)
         await q.message.reply_text(
             "Фритрайл активирован на 2 месяца 🎉\n"
             "Каждый день пришлю 1 рилс + описание. Можно перейти на платный план в любой момент."
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+_cache: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def resolve(target: str) -> Callable[..., Awaitable[Any]]:
+    """'package.module:attr' -> объект (модуль импортируется при первом обращении)."""
+    module_name, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def lazy(target: str) -> Callable[..., Awaitable[Any]]:
+    """Хендлер-заглушка: модуль с реальным хендлером импортируется при первом вызове.
+
+    Так старт бота не тянет все модули хендлеров (и их зависимости) сразу.
+    """
+    cached = _cache.get(target)
+    if cached is not None:
+        return cached
+
+    func = None
+
+    async def call(*args: Any, **kwargs: Any) -> Any:
+        nonlocal func
+        if func is None:
+            func = resolve(target)
+        return await func(*args, **kwargs)
+
+    call.__name__ = target.rpartition(":")[2]
+    call.__qualname__ = target
+    _cache[target] = call
+    return call
+
+
+async def preload(targets: Iterable[str] = ()) -> None:
+    """Догружает модули в фоне после старта, чтобы первый апдейт не платил за импорт."""
+    modules = sorted({t.partition(":")[0] for t in (*_cache, *targets)})
+
+    def _import_all() -> None:
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                logger.exception("lazy preload: failed to import %s", name)
+
+    await asyncio.to_thread(_import_all)
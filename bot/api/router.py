@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler, ContextTypes
+
+logger = logging.getLogger(__name__)
+
+SEP = ":"
+
+Handler = Callable[..., Awaitable[Any]]
+Converter = Callable[[str], Any]
+
+
+@dataclass(slots=True)
+class Route:
+    path: str
+    converters: Tuple[Converter, ...]
+    rest: bool
+    handlers: List[Handler] = field(default_factory=list)
+
+    def parse(self, tail: str) -> Tuple[Any, ...]:
+        convs = self.converters
+        if not convs:
+            if tail:
+                raise ValueError(f"{self.path}: unexpected args {tail!r}")
+            return ()
+        parts = tail.split(SEP, len(convs) - 1) if self.rest else tail.split(SEP)
+        if len(parts) != len(convs) or not tail:
+            raise ValueError(f"{self.path}: expected {len(convs)} args, got {tail!r}")
+        return tuple([conv(p) for conv, p in zip(convs, parts)])
+
+
+class CallbackRouter:
+    """Диспетчер callback_data вида ``prefix[:sub]:arg1:arg2...``.
+
+    Маршрут ищется по словарю префиксов (один-два lookup'а), аргументы
+    разбираются по типам из регистрации и передаются в хендлер позиционно:
+    ``handler(update, context, *args)``. Префикс сравнивается без учёта
+    регистра, аргументы — как есть.
+    """
+
+    def __init__(self) -> None:
+        # head -> Route | {sub -> Route}
+        self._tree: Dict[str, Union[Route, Dict[str, Route]]] = {}
+
+    def add(self, path: str, handler: Handler, *converters: Converter, rest: bool = False) -> None:
+        """Регистрирует хендлер. rest=True — последний аргумент забирает хвост целиком."""
+        key = str(getattr(path, "value", path)).lower()
+        head, _, sub = key.partition(SEP)
+        if SEP in sub:
+            raise ValueError(f"route {key!r}: at most two prefix segments are supported")
+
+        node = self._tree.get(head)
+        if sub:
+            if isinstance(node, Route):
+                raise ValueError(f"route {key!r} conflicts with {node.path!r}")
+            node = self._tree.setdefault(head, {})
+            route = node.get(sub)
+            if route is None:
+                route = node[sub] = Route(key, tuple(converters), rest)
+        else:
+            if isinstance(node, dict):
+                raise ValueError(f"route {key!r} conflicts with nested routes")
+            route = node
+            if route is None:
+                route = self._tree[head] = Route(key, tuple(converters), rest)
+
+        if route.converters != tuple(converters) or route.rest != rest:
+            raise ValueError(f"route {key!r} already registered with another signature")
+        route.handlers.append(handler)
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, str]]:
+        head, _, tail = data.partition(SEP)
+        node = self._tree.get(head)
+        if node is None:
+            node = self._tree.get(head.lower())
+            if node is None:
+                return None
+        if isinstance(node, dict):
+            sub, _, tail = tail.partition(SEP)
+            node = node.get(sub) or node.get(sub.lower())
+            if node is None:
+                return None
+        return node, tail
+
+    def matches(self, data: object) -> bool:
+        return isinstance(data, str) and self.resolve(data) is not None
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        q = update.callback_query
+        found = self.resolve(q.data or "")
+        if found is None:
+            return
+        route, tail = found
+        try:
+            args = route.parse(tail)
+        except (ValueError, TypeError) as e:
+            logger.warning("callback %r: bad payload: %s", q.data, e)
+            await q.answer()
+            return
+        for handler in route.handlers:
+            await handler(update, context, *args)
+
+    def handler(self, **kwargs: Any) -> CallbackQueryHandler:
+        return CallbackQueryHandler(self.dispatch, pattern=self.matches, **kwargs)
+
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Ключ сериализации: апдейты одного чата/пользователя идут строго по порядку."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class _KeySlot:
+    __slots__ = ("lock", "waiting")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с упорядочиванием внутри одного ключа.
+
+    Разные пользователи обрабатываются одновременно (не больше
+    max_concurrent_updates), апдейты одного пользователя — последовательно.
+
+    Лимит — семафор базового ``process_update`` (PTB), своего нет. Упорядочивание
+    по ключу делается уже внутри слота, в ``do_process_update``, поэтому апдейт,
+    ждущий своей очереди в том же чате, тоже держит слот: «шумный» чат из N
+    апдейтов занимает до N слотов. Их видно в ``waiting_for_key`` /
+    ``max_key_depth`` в /metrics; если они сравнимы с ``limit``, стоит поднять
+    BOT_CONCURRENT_UPDATES: ожидающий своей очереди апдейт не нагружает
+    ни БД, ни Telegram.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._slots: Dict[Hashable, _KeySlot] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._max_waiting = 0
+        self._max_key_depth = 0
+        self._processed = 0
+        self._failed = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _KeySlot()
+        slot.waiting += 1
+        self._max_key_depth = max(self._max_key_depth, slot.waiting)
+        try:
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+            try:
+                await slot.lock.acquire()
+            finally:
+                self._waiting -= 1
+            try:
+                await self._run(coroutine)
+            finally:
+                slot.lock.release()
+        finally:
+            slot.waiting -= 1
+            if slot.waiting == 0:
+                self._slots.pop(key, None)
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        self._in_flight += 1
+        try:
+            await coroutine
+            self._processed += 1
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.max_concurrent_updates,
+            "in_flight": self._in_flight,
+            "waiting_for_key": self._waiting,
+            "max_waiting_for_key": self._max_waiting,
+            "active_keys": len(self._slots),
+            "max_key_depth": self._max_key_depth,
+            "processed": self._processed,
+            "failed": self._failed,
+        }
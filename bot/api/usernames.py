@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes, TypeHandler
+
+from bot.db.usernames import mark_checked, save_usernames, stale_usernames
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class UsernameTracker:
+    """Кэш ников пользователей в users.username.
+
+    * пред-хендлер (group=-2) смотрит на effective_user каждого апдейта и
+      запоминает ник, если он изменился; в БД изменения уходят пачкой
+      (``flush()``), а не запросом на каждый апдейт;
+    * ``refresh_stale(bot)`` добирает ники тех, кто давно не писал боту, через
+      get_chat — не больше ``batch`` пользователей за раз и не больше
+      ``concurrency`` запросов одновременно.
+    """
+
+    def __init__(self, *, batch: int = 50, concurrency: int = 3, max_age_days: int = 30, max_known: int = 100_000):
+        self.batch = batch
+        self.concurrency = concurrency
+        self.max_age_days = max_age_days
+        self.max_known = max_known
+        self._known: "OrderedDict[int, Optional[str]]" = OrderedDict()  # uid -> последний записанный ник
+        self._dirty: Dict[int, Optional[str]] = {}
+        self.seen = 0
+        self.written = 0
+        self.refreshed = 0
+        self.refresh_failed = 0
+
+    def handler(self) -> TypeHandler:
+        return TypeHandler(Update, self.observe, block=True)
+
+    async def observe(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user = update.effective_user
+        if not user or user.is_bot:
+            return
+        self.seen += 1
+        self._remember(user.id, user.username)
+
+    def _remember(self, uid: int, username: Optional[str]) -> None:
+        if self._known.get(uid, _UNSET) == username:
+            self._known.move_to_end(uid)
+            return
+        self._known[uid] = username
+        self._known.move_to_end(uid)
+        self._dirty[uid] = username
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(save_usernames, dirty.items())
+            self.written += len(dirty)
+        except sqlite3.Error as e:
+            logger.error("usernames: write of %d rows failed: %s", len(dirty), e)
+            for uid in dirty:
+                self._known.pop(uid, None)   # повторим при следующем апдейте
+
+    async def refresh_stale(self, bot: Bot) -> None:
+        uids = await asyncio.to_thread(stale_usernames, self.batch, self.max_age_days)
+        if not uids:
+            return
+        sem = asyncio.Semaphore(self.concurrency)
+        failed = []
+
+        async def one(uid: int) -> None:
+            async with sem:
+                try:
+                    chat = await bot.get_chat(uid)
+                except TelegramError as e:
+                    logger.debug("usernames: get_chat %s failed: %s", uid, e)
+                    failed.append(uid)
+                    return
+                self._remember(uid, chat.username)
+                self._dirty[uid] = chat.username   # даже без изменений: обновить username_checked_at
+
+        await asyncio.gather(*(one(uid) for uid in uids))
+        self.refreshed += len(uids) - len(failed)
+        self.refresh_failed += len(failed)
+        if failed:
+            await asyncio.to_thread(mark_checked, failed)
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "seen": self.seen,
+            "written": self.written,
+            "pending": len(self._dirty),
+            "refreshed": self.refreshed,
+            "refresh_failed": self.refresh_failed,
+        }
@@ -19,6 +19,9 @@ class CallbackData(str, Enum):
     WANT_JOIN = "want_join"   
     ABOUT     = "about"       
 
+# Состояния диалога /reel_new (здесь, чтобы main.py не импортировал reels_admin при старте)
+REEL_VIDEO, REEL_PREVIEW, REEL_CAPTION, REEL_CONFIRM = range(4)
+
 IMAGE_FILE_IDS: List[str] = [
     "AgACAgIAAxkDAANhaHL6D6ottuienNw3_MHYheuHs1gAAu8EMhsC0phLe3Xuf69LDzcBAAMCAAN3AAM2BA",
     "AgACAgIAAxkDAANiaHL6DwnIm9XCAAG2sfPEWPZlR0dNAALwBDIbAtKYS4KD2bYx6_7ZAQADAgADdwADNgQ",
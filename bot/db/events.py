@@ -0,0 +1,55 @@
+# bot/db/events.py
+from __future__ import annotations
+
+import sqlite3
+from enum import IntEnum
+from typing import Iterable, Optional, Tuple
+
+from bot.db.connection import get_conn
+
+
+class EventKind(IntEnum):
+    """Шаги воронки. Значения хранятся в events.kind — не переиспользовать и не менять."""
+    START = 1
+    INTRO_DONE = 2
+    WANT_JOIN = 3
+    ROLE = 4            # arg: 1 — «Новичок», 2 — «Старичок»
+    TRIAL_START = 5
+    PRICE_SET = 6       # arg: сумма, ₽
+    PAID = 7            # arg: сумма, ₽ (если известна)
+
+
+ROLE_NEW, ROLE_OLD = 1, 2
+
+# (ts, user_id, kind, arg)
+EventRow = Tuple[int, int, int, Optional[int]]
+
+
+def ensure_events_schema(conn: sqlite3.Connection) -> None:
+    """Журнал событий: только INSERT, строки из целых чисел (unix-время, id, код шага)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            ts       INTEGER NOT NULL,
+            user_id  INTEGER NOT NULL,
+            kind     INTEGER NOT NULL,
+            arg      INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_events_ts ON events(ts)")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_events_no_update BEFORE UPDATE ON events
+        BEGIN SELECT RAISE(ABORT, 'events is append-only'); END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_events_no_delete BEFORE DELETE ON events
+        BEGIN SELECT RAISE(ABORT, 'events is append-only'); END
+    """)
+
+
+def append_events(rows: Iterable[EventRow]) -> None:
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany("INSERT INTO events(ts, user_id, kind, arg) VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
@@ -0,0 +1,188 @@
+# bot/db/outbox.py
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bot.db.connection import get_conn
+
+# Очередь побочных эффектов (отправки в Telegram и т.п.). Строка пишется
+# в той же транзакции, что и изменение данных, а выполняет её воркер
+# (bot/domain/services/outbox.py) уже после коммита — сеть никогда не
+# держит блокировку записи SQLite. Доставка «хотя бы один раз».
+#
+# status: PENDING -> DONE | DEAD (исчерпаны попытки)
+
+# Виды эффектов; обработчики регистрирует воркер.
+INSTRUCTIONS = "instructions"   # пакет инструкций после активации подписки
+NOTICE = "notice"               # текстовое сообщение: payload {"text": ..., "lane": ..., "then": вид следующего шага}
+LAVA_PAYMENT = "lava_payment"   # принятый вебхук Lava: payload {"key": ключ события, "event": тело вебхука}
+
+# (id, kind, user_id, payload, attempts, created_at)
+OutboxRow = Tuple[int, str, Optional[int], Dict[str, Any], int, int]
+
+
+def ensure_outbox_schema(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id          INTEGER PRIMARY KEY,
+            kind        TEXT    NOT NULL,
+            user_id     INTEGER,
+            payload     TEXT,
+            batch       TEXT,
+            status      TEXT    NOT NULL DEFAULT 'PENDING',
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            next_at     INTEGER NOT NULL,
+            created_at  INTEGER NOT NULL,
+            done_at     INTEGER,
+            last_error  TEXT
+        )
+    """)
+    # Воркер читает только ожидающие — частичный индекс остаётся маленьким.
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_due ON outbox(next_at) WHERE status = 'PENDING'")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_outbox_batch ON outbox(batch, status) WHERE batch IS NOT NULL")
+
+
+def enqueue(
+    conn: sqlite3.Connection,
+    kind: str,
+    user_id: Optional[int] = None,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    batch: Optional[str] = None,
+) -> None:
+    """Ставит эффект в очередь в транзакции вызывающего кода."""
+    now = int(time.time())
+    conn.execute(
+        "INSERT INTO outbox(kind, user_id, payload, batch, next_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (kind, user_id, json.dumps(payload, ensure_ascii=False) if payload else None, batch, now, now),
+    )
+
+
+def push(kind: str, user_id: Optional[int] = None, payload: Optional[Dict[str, Any]] = None) -> None:
+    """enqueue в своей транзакции — для эффекта, который ставит следующий шаг цепочки."""
+    conn = get_conn()
+    try:
+        with conn:
+            enqueue(conn, kind, user_id, payload)
+    finally:
+        conn.close()
+
+
+def enqueue_many(
+    conn: sqlite3.Connection,
+    kind: str,
+    items: Iterable[Tuple[Optional[int], Optional[Dict[str, Any]]]],
+    *,
+    batch: Optional[str] = None,
+) -> None:
+    now = int(time.time())
+    conn.executemany(
+        "INSERT INTO outbox(kind, user_id, payload, batch, next_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (kind, uid, json.dumps(payload, ensure_ascii=False) if payload else None, batch, now, now)
+            for uid, payload in items
+        ),
+    )
+
+
+def claim_due(limit: int, kinds: Sequence[str], lease: int = 300) -> List[OutboxRow]:
+    """Забирает до ``limit`` готовых строк нужных видов, сдвигая их next_at на ``lease`` секунд.
+
+    Так несколько воркеров (бот и backend) не возьмут одну строку дважды,
+    а строка воркера, упавшего посреди выполнения, вернётся в очередь после lease.
+    """
+    if not kinds:
+        return []
+    now = int(time.time())
+    marks = ",".join("?" * len(kinds))
+    conn = get_conn()
+    try:
+        with conn:
+            rows = conn.execute(
+                f"""
+                UPDATE outbox SET next_at = ?
+                 WHERE id IN (
+                       SELECT id FROM outbox
+                        WHERE status = 'PENDING' AND next_at <= ? AND kind IN ({marks})
+                        ORDER BY next_at, id
+                        LIMIT ?)
+                RETURNING id, kind, user_id, payload, attempts, created_at
+                """,
+                (now + lease, now, *kinds, limit),
+            ).fetchall()
+        rows.sort(key=lambda r: r[0])
+        return [(r[0], r[1], r[2], json.loads(r[3]) if r[3] else {}, r[4], r[5]) for r in rows]
+    finally:
+        conn.close()
+
+
+def next_due_at() -> Optional[int]:
+    conn = get_conn()
+    try:
+        row = conn.execute("SELECT MIN(next_at) FROM outbox WHERE status = 'PENDING'").fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+
+def settle(done: Iterable[int], failed: Iterable[Tuple[int, str, int, bool]], max_attempts: int) -> int:
+    """Итог пачки одной транзакцией.
+
+    failed: (id, ошибка, задержка до повтора в секундах, повтор бесполезен).
+    Возвращает число эффектов, переведённых в DEAD.
+    """
+    now = int(time.time())
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE outbox SET status = 'DONE', done_at = ?, attempts = attempts + 1 WHERE id = ?",
+                ((now, i) for i in done),
+            )
+            dead = 0
+            for i, error, delay, final in failed:
+                row = conn.execute(
+                    """
+                    UPDATE outbox
+                       SET attempts   = attempts + 1,
+                           last_error = ?1,
+                           next_at    = ?2,
+                           status     = CASE WHEN ?3 OR attempts + 1 >= ?4 THEN 'DEAD' ELSE 'PENDING' END,
+                           done_at    = CASE WHEN ?3 OR attempts + 1 >= ?4 THEN ?5 END
+                     WHERE id = ?6
+                    RETURNING status
+                    """,
+                    (error[:500], now + delay, final, max_attempts, now, i),
+                ).fetchone()
+                dead += bool(row and row[0] == "DEAD")
+        return dead
+    finally:
+        conn.close()
+
+
+def batch_progress(batch: str) -> Dict[str, int]:
+    """{'PENDING': n, 'DONE': n, 'DEAD': n} по эффектам одной массовой операции."""
+    conn = get_conn()
+    try:
+        rows = conn.execute("SELECT status, COUNT(*) FROM outbox WHERE batch = ? GROUP BY status", (batch,))
+        counts = {"PENDING": 0, "DONE": 0, "DEAD": 0}
+        counts.update({r[0]: r[1] for r in rows})
+        return counts
+    finally:
+        conn.close()
+
+
+def purge_done(older_than_days: int) -> int:
+    conn = get_conn()
+    try:
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM outbox WHERE status = 'DONE' AND done_at < ?",
+                (int(time.time()) - older_than_days * 86400,),
+            )
+        return cur.rowcount
+    finally:
+        conn.close()
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import telegram
+from telegram.ext import Application, BasePersistence, ContextTypes, PersistenceInput
+
+from bot.db.connection import get_conn
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+CHAT = "chat"
+
+Owner = Tuple[str, int]
+ConversationKey = Tuple[Union[int, str], ...]
+ConversationDict = Dict[ConversationKey, object]
+
+
+def ensure_state_schema() -> None:
+    conn = get_conn()
+    try:
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state_kv (
+                    scope       TEXT    NOT NULL,
+                    owner_id    INTEGER NOT NULL,
+                    key         TEXT    NOT NULL,
+                    value       TEXT    NOT NULL,
+                    updated_at  TEXT    NOT NULL DEFAULT (datetime('now')),
+                    PRIMARY KEY (scope, owner_id, key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state_conversations (
+                    name   TEXT NOT NULL,
+                    key    TEXT NOT NULL,
+                    state  TEXT NOT NULL,
+                    PRIMARY KEY (name, key)
+                ) WITHOUT ROWID
+            """)
+    finally:
+        conn.close()
+
+
+def _ptb_data_stores(application: Application) -> Optional[Dict[str, Dict[int, Any]]]:
+    """Внутренние словари user_data/chat_data приложения PTB или None.
+
+    Публичного способа выгрузить данные из памяти, не удаляя их из персистенции
+    (drop_*), в PTB нет, поэтому используются приватные ``Application._user_data``
+    и ``Application._chat_data`` (defaultdict по id; так в python-telegram-bot
+    20.x–21.x). На других версиях или без этих атрибутов возвращает None.
+    """
+    if not (20, 0) <= telegram.__version_info__[:2] < (22, 0):
+        return None
+    user_data = getattr(application, "_user_data", None)
+    chat_data = getattr(application, "_chat_data", None)
+    if not isinstance(user_data, dict) or not isinstance(chat_data, dict):
+        return None
+    return {USER: user_data, CHAT: chat_data}
+
+
+def _dumps(value: Any) -> Optional[str]:
+    try:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+
+class SqlitePersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    """Персистенция user_data/chat_data/диалогов в SQLite.
+
+    * данные пользователя/чата подгружаются лениво — при первом апдейте от него
+      (refresh_*), а не целиком на старте;
+    * пишутся только изменившиеся ключи, пачкой в одной транзакции;
+    * неактивные дольше ``ttl`` записи выгружаются из памяти (в БД остаются).
+
+    Значения хранятся как JSON; несериализуемые ключи пропускаются с предупреждением.
+    bot_data и callback_data не сохраняются: там живут сервисы и прочие объекты.
+    """
+
+    def __init__(self, *, ttl: float = 6 * 3600, update_interval: float = 30):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.ttl = ttl
+        self._application: Optional[Application] = None
+        self._snapshots: Dict[Owner, Dict[str, str]] = {}
+        self._last_access: Dict[Owner, float] = {}
+        self._pending: Dict[Tuple[str, int, str], Optional[str]] = {}
+        self._pending_conv: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._evicted = 0
+        self._evict_unsupported = False
+        ensure_state_schema()
+
+    # ── жизненный цикл ─────────────────────────────────────────────────────────
+
+    def attach(self, application: Application) -> None:
+        """Запоминает Application и ставит периодическую выгрузку неактивных записей."""
+        self._application = application
+        application.job_queue.run_repeating(
+            self._evict_job, interval=max(60.0, self.ttl / 4), first=self.ttl, name="state_evict",
+        )
+
+    async def _evict_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        self.evict_idle()
+
+    def evict_idle(self) -> int:
+        if self._application is None:
+            return 0
+        stores = _ptb_data_stores(self._application)
+        if stores is None:
+            # Без словарей PTB выгружать нечего: снимок без данных в памяти
+            # только сломал бы учёт удалённых ключей.
+            if not self._evict_unsupported:
+                self._evict_unsupported = True
+                logger.warning("state: eviction disabled, unsupported PTB %s", telegram.__version__)
+            return 0
+        self._write_pending()
+        deadline = time.monotonic() - self.ttl
+        idle = [owner for owner, ts in self._last_access.items() if ts < deadline]
+        for owner in idle:
+            self._snapshots.pop(owner, None)
+            self._last_access.pop(owner, None)
+            stores[owner[0]].pop(owner[1], None)
+        self._evicted += len(idle)
+        if idle:
+            logger.info("state: evicted %s idle entries", len(idle))
+        return len(idle)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "loaded": len(self._snapshots),
+            "pending_writes": len(self._pending) + len(self._pending_conv),
+            "evicted": self._evicted,
+        }
+
+    # ── загрузка ───────────────────────────────────────────────────────────────
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> ConversationDict:
+        conn = get_conn()
+        try:
+            rows = conn.execute(
+                "SELECT key, state FROM state_conversations WHERE name=?", (name,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return {tuple(json.loads(r["key"])): json.loads(r["state"]) for r in rows}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        await self._load((USER, user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        await self._load((CHAT, chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def _load(self, owner: Owner, data: Dict[Any, Any]) -> None:
+        self._last_access[owner] = time.monotonic()
+        if owner in self._snapshots:
+            return
+        rows = await asyncio.to_thread(self._fetch, owner)
+        # Пока шёл запрос, запись мог загрузить/изменить параллельный апдейт
+        # (пользователь пишет в двух чатах) — дополняем, не перетирая.
+        snapshot = self._snapshots.setdefault(owner, {})
+        for key, value in rows:
+            snapshot.setdefault(key, value)
+            data.setdefault(key, json.loads(value))
+
+    @staticmethod
+    def _fetch(owner: Owner) -> List[Tuple[str, str]]:
+        conn = get_conn()
+        try:
+            return [
+                (r["key"], r["value"])
+                for r in conn.execute(
+                    "SELECT key, value FROM state_kv WHERE scope=? AND owner_id=?", owner
+                )
+            ]
+        finally:
+            conn.close()
+
+    # ── запись ─────────────────────────────────────────────────────────────────
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._diff((USER, user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._diff((CHAT, chat_id), data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        self._pending_conv[(name, json.dumps(list(key)))] = None if new_state is None else _dumps(new_state)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._drop((USER, user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._drop((CHAT, chat_id))
+
+    async def flush(self) -> None:
+        self._write_pending()
+
+    def _diff(self, owner: Owner, data: Dict[Any, Any]) -> None:
+        snapshot = self._snapshots.get(owner)
+        if snapshot is None:
+            # Запись не загружалась (или уже выгружена): только дописываем непустое,
+            # ничего не удаляя, чтобы не затереть сохранённое ранее.
+            if not data:
+                return
+            snapshot = {}
+
+        changed = False
+        for key, value in data.items():
+            if not isinstance(key, str):
+                logger.warning("state %s: non-string key %r skipped", owner, key)
+                continue
+            encoded = _dumps(value)
+            if encoded is None:
+                logger.warning("state %s: value for %r is not JSON-serializable", owner, key)
+                continue
+            if snapshot.get(key) != encoded:
+                snapshot[key] = encoded
+                self._pending[(*owner, key)] = encoded
+                changed = True
+
+        if owner in self._snapshots:
+            for key in [k for k in snapshot if k not in data]:
+                del snapshot[key]
+                self._pending[(*owner, key)] = None
+                changed = True
+
+        if changed:
+            self._schedule_flush()
+
+    def _drop(self, owner: Owner) -> None:
+        self._snapshots.pop(owner, None)
+        self._last_access.pop(owner, None)
+        self._pending = {k: v for k, v in self._pending.items() if k[:2] != owner}
+        conn = get_conn()
+        try:
+            with conn:
+                conn.execute("DELETE FROM state_kv WHERE scope=? AND owner_id=?", owner)
+        finally:
+            conn.close()
+
+    def _schedule_flush(self) -> None:
+        # PTB вызывает update_* пачкой через gather — пишем всё одной транзакцией
+        # после того, как отработают все корутины текущей пачки.
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(0)
+        self._write_pending()
+
+    def _write_pending(self) -> None:
+        if not self._pending and not self._pending_conv:
+            return
+        pending, self._pending = self._pending, {}
+        pending_conv, self._pending_conv = self._pending_conv, {}
+
+        upserts = [(s, o, k, v) for (s, o, k), v in pending.items() if v is not None]
+        deletes = [(s, o, k) for (s, o, k), v in pending.items() if v is None]
+        conv_upserts = [(n, k, v) for (n, k), v in pending_conv.items() if v is not None]
+        conv_deletes = [(n, k) for (n, k), v in pending_conv.items() if v is None]
+
+        conn = get_conn()
+        try:
+            with conn:
+                if upserts:
+                    conn.executemany(
+                        """
+                        INSERT INTO state_kv (scope, owner_id, key, value) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(scope, owner_id, key) DO UPDATE SET
+                          value = excluded.value,
+                          updated_at = datetime('now')
+                        """,
+                        upserts,
+                    )
+                if deletes:
+                    conn.executemany(
+                        "DELETE FROM state_kv WHERE scope=? AND owner_id=? AND key=?", deletes
+                    )
+                if conv_upserts:
+                    conn.executemany(
+                        """
+                        INSERT INTO state_conversations (name, key, state) VALUES (?, ?, ?)
+                        ON CONFLICT(name, key) DO UPDATE SET state = excluded.state
+                        """,
+                        conv_upserts,
+                    )
+                if conv_deletes:
+                    conn.executemany(
+                        "DELETE FROM state_conversations WHERE name=? AND key=?", conv_deletes
+                    )
+        except Exception:
+            # Вернём несохранённое в очередь — попробуем при следующем сбросе.
+            for k, v in pending.items():
+                self._pending.setdefault(k, v)
+            for k, v in pending_conv.items():
+                self._pending_conv.setdefault(k, v)
+            logger.exception("state: batch write failed")
+            return
+        logger.debug("state: wrote %s keys, %s conversations", len(pending), len(pending_conv))
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 import sqlite3
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, Collection, List, Tuple
 from bot.db.connection import get_conn
 
 
@@ -49,6 +49,35 @@ def ensure_reels_schema() -> None:
             """)
             conn.execute("CREATE INDEX IF NOT EXISTS ix_reel_deliveries_user ON reel_deliveries(tg_user_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS ix_reel_deliveries_reel ON reel_deliveries(reel_id)")
+            # Статистика доставок по рилсам (ведёт рассылка пачками, см. flush_reel_stats)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reel_stats (
+                    reel_id               INTEGER PRIMARY KEY,
+                    sends                 INTEGER NOT NULL DEFAULT 0,
+                    failures              INTEGER NOT NULL DEFAULT 0,
+                    consecutive_failures  INTEGER NOT NULL DEFAULT 0,
+                    last_sent_at          TEXT,
+                    last_error            TEXT,
+                    deactivated_at        TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reel_failures (
+                    reel_id      INTEGER NOT NULL,
+                    error_class  TEXT    NOT NULL,
+                    cnt          INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (reel_id, error_class)
+                ) WITHOUT ROWID
+            """)
+            # Полный круг по каталогу: от первой доставки до сброса прогресса
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reel_cycles (
+                    tg_user_id          INTEGER PRIMARY KEY,
+                    cycles              INTEGER NOT NULL DEFAULT 0,
+                    last_cycle_seconds  INTEGER,
+                    total_seconds       INTEGER NOT NULL DEFAULT 0
+                )
+            """)
     finally:
         conn.close()
 
@@ -105,8 +134,11 @@ def list_reels(limit: int = 20, offset: int = 0) -> List[sqlite3.Row]:
         cur = conn.execute(
             """
             SELECT r.id, r.title, r.is_active, r.created_at,
-                   (SELECT COUNT(*) FROM reel_assets a WHERE a.reel_id=r.id) AS assets
+                   (SELECT COUNT(*) FROM reel_assets a WHERE a.reel_id=r.id) AS assets,
+                   COALESCE(st.sends, 0) AS sends, COALESCE(st.failures, 0) AS failures,
+                   st.last_sent_at, st.deactivated_at
             FROM reels r
+            LEFT JOIN reel_stats st ON st.reel_id = r.id
             ORDER BY r.id DESC
             LIMIT ? OFFSET ?
             """,
@@ -128,9 +160,11 @@ def get_reel(reel_id: int) -> Dict[str, Any] | None:
             "SELECT kind, tg_chat_id, tg_message_id, tg_file_id, tg_file_unique_id, text FROM reel_assets WHERE reel_id=?",
             (reel_id,),
         ).fetchall()
+        st = conn.execute("SELECT * FROM reel_stats WHERE reel_id=?", (reel_id,)).fetchone()
         return {
             "reel": dict(reel),
             "assets": {row["kind"]: dict(row) for row in assets},
+            "stats": dict(st) if st else None,
         }
     finally:
         conn.close()
@@ -142,6 +176,11 @@ def set_reel_active(reel_id: int, active: bool) -> None:
     try:
         with conn:
             conn.execute("UPDATE reels SET is_active=? WHERE id=?", (1 if active else 0, reel_id))
+            if active:
+                # Включили вручную — серия ошибок начинается заново
+                conn.execute(
+                    "UPDATE reel_stats SET consecutive_failures=0, deactivated_at=NULL WHERE reel_id=?", (reel_id,)
+                )
     finally:
         conn.close()
 
@@ -152,26 +191,31 @@ def delete_reel(reel_id: int) -> None:
     try:
         with conn:
             conn.execute("DELETE FROM reels WHERE id=?", (reel_id,))
+            conn.execute("DELETE FROM reel_stats WHERE reel_id=?", (reel_id,))
+            conn.execute("DELETE FROM reel_failures WHERE reel_id=?", (reel_id,))
     finally:
         conn.close()
 
 
-def pick_next_reel_id_for_user(tg_user_id: int) -> Optional[int]:
+def pick_next_reel_id_for_user(tg_user_id: int, exclude: Collection[int] = ()) -> Optional[int]:
+    """Случайный активный рилс, которого у пользователя ещё не было (кроме ``exclude``)."""
     ensure_reels_schema()
+    skip = f"AND r.id NOT IN ({','.join('?' * len(exclude))})" if exclude else ""
     conn = get_conn()
     try:
         row = conn.execute(
-            """
+            f"""
             SELECT r.id
             FROM reels r
             LEFT JOIN reel_deliveries d
               ON d.reel_id = r.id AND d.tg_user_id = ?
             WHERE r.is_active = 1
               AND d.id IS NULL
+              {skip}
             ORDER BY RANDOM()
             LIMIT 1
             """,
-            (tg_user_id,),
+            (tg_user_id, *exclude),
         ).fetchone()
         return int(row[0]) if row else None
     finally:
@@ -200,6 +244,15 @@ def reset_user_reel_progress(tg_user_id: int) -> int:
     conn = get_conn()
     try:
         with conn:
+            first = conn.execute(
+                """
+                SELECT CAST(strftime('%s','now') - strftime('%s', MIN(sent_at)) AS INTEGER)
+                  FROM reel_deliveries
+                 WHERE tg_user_id = ?
+                   AND reel_id IN (SELECT id FROM reels WHERE is_active = 1)
+                """,
+                (tg_user_id,),
+            ).fetchone()[0]
             cur = conn.execute(
                 """
                 DELETE FROM reel_deliveries
@@ -208,6 +261,18 @@ def reset_user_reel_progress(tg_user_id: int) -> int:
                 """,
                 (tg_user_id,),
             )
+            if first is not None:
+                conn.execute(
+                    """
+                    INSERT INTO reel_cycles (tg_user_id, cycles, last_cycle_seconds, total_seconds)
+                    VALUES (?1, 1, ?2, ?2)
+                    ON CONFLICT(tg_user_id) DO UPDATE SET
+                        cycles             = cycles + 1,
+                        last_cycle_seconds = excluded.last_cycle_seconds,
+                        total_seconds      = total_seconds + excluded.total_seconds
+                    """,
+                    (tg_user_id, first),
+                )
             return cur.rowcount if cur.rowcount is not None else 0
     finally:
         conn.close()
@@ -220,3 +285,98 @@ def any_active_reels() -> bool:
         return bool(row)
     finally:
         conn.close()
+
+
+# (reel_id, отправок, ошибок, серия ошибок в конце пачки, был ли успех в пачке, последняя ошибка)
+ReelStatRow = Tuple[int, int, int, int, bool, Optional[str]]
+
+
+def flush_reel_stats(
+    stats: List[ReelStatRow],
+    failures: List[Tuple[int, str, int]],
+    fail_threshold: int,
+) -> List[int]:
+    """Итоги пачки доставок одной транзакцией.
+
+    Серия ошибок продолжается, если в пачке не было успешной отправки рилса,
+    иначе начинается с ошибок после последнего успеха. Рилсы, у которых серия
+    дошла до ``fail_threshold``, выключаются; возвращаются их id.
+    """
+    ensure_reels_schema()
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO reel_stats(reel_id) VALUES (?)", ((r[0],) for r in stats))
+            conn.executemany(
+                """
+                UPDATE reel_stats
+                   SET sends                = sends + ?2,
+                       failures             = failures + ?3,
+                       consecutive_failures = CASE WHEN ?5 THEN ?4 ELSE consecutive_failures + ?4 END,
+                       last_sent_at         = CASE WHEN ?2 > 0 THEN datetime('now') ELSE last_sent_at END,
+                       last_error           = COALESCE(?6, last_error)
+                 WHERE reel_id = ?1
+                """,
+                stats,
+            )
+            conn.executemany(
+                """
+                INSERT INTO reel_failures(reel_id, error_class, cnt) VALUES (?, ?, ?)
+                ON CONFLICT(reel_id, error_class) DO UPDATE SET cnt = cnt + excluded.cnt
+                """,
+                failures,
+            )
+            rows = conn.execute(
+                """
+                UPDATE reels SET is_active = 0
+                 WHERE is_active = 1
+                   AND id IN (SELECT reel_id FROM reel_stats WHERE consecutive_failures >= ?)
+                RETURNING id
+                """,
+                (fail_threshold,),
+            ).fetchall()
+            off = [r[0] for r in rows]
+            conn.executemany(
+                "UPDATE reel_stats SET deactivated_at = datetime('now') WHERE reel_id = ?", ((i,) for i in off)
+            )
+            return off
+    finally:
+        conn.close()
+
+
+def reel_stats_report(limit: int = 20) -> Dict[str, Any]:
+    """Данные для /reel_stats: рилсы по числу отправок, ошибки по классам, круги по каталогу."""
+    ensure_reels_schema()
+    conn = get_conn()
+    try:
+        reels = conn.execute(
+            """
+            SELECT r.id, r.title, r.is_active, COALESCE(st.sends, 0) AS sends,
+                   COALESCE(st.failures, 0) AS failures, st.consecutive_failures,
+                   st.last_sent_at, st.last_error, st.deactivated_at
+              FROM reels r
+              LEFT JOIN reel_stats st ON st.reel_id = r.id
+             ORDER BY sends DESC, r.id
+             LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        by_class = conn.execute(
+            "SELECT error_class, SUM(cnt) AS cnt FROM reel_failures GROUP BY error_class ORDER BY cnt DESC"
+        ).fetchall()
+        cycles = conn.execute(
+            """
+            SELECT COUNT(*) AS users, COALESCE(SUM(cycles), 0) AS cycles,
+                   CAST(SUM(total_seconds) AS REAL) / NULLIF(SUM(cycles), 0) AS avg_seconds
+              FROM reel_cycles
+            """
+        ).fetchone()
+        catalog = conn.execute("SELECT COUNT(*) FROM reels WHERE is_active = 1").fetchone()[0]
+        return {
+            "reels": [dict(r) for r in reels],
+            "by_class": [(r["error_class"], r["cnt"]) for r in by_class],
+            "cycles": dict(cycles),
+            "active": catalog,
+        }
+    finally:
+        conn.close()
@@ -0,0 +1,218 @@
+# bot/db/referrals.py
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from bot.db.connection import get_conn
+
+# Реферальное дерево как closure table: referral_tree хранит пару
+# (предок, потомок, глубина) для каждого пути, включая (u, u, 0).
+# Таблица ведётся триггерами на users (referrer_id и удаление), поверх неё — счётчики:
+#
+#   referral_depth_counts(ancestor, depth, cnt) — потомков на каждой глубине
+#   referral_downline(ancestor, total)           — всего потомков, индекс по total
+#
+# Сводка по пользователю и топ лидеров — чтения по первичному ключу/индексу,
+# без обхода дерева и без сортировки всех пользователей.
+
+MAX_DEPTH = 64  # защита от циклов в старых данных при первичном заполнении
+
+# Ссылка, которая замкнула бы цикл (реферер — сам пользователь или его потомок), игнорируется.
+_CYCLE = """
+    NEW.referrer_id = NEW.tg_user_id
+    OR EXISTS (SELECT 1 FROM referral_tree WHERE ancestor = NEW.tg_user_id AND descendant = NEW.referrer_id)
+"""
+
+_LINK = """
+    INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth) VALUES (NEW.tg_user_id, NEW.tg_user_id, 0);
+    INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth)
+    SELECT NEW.referrer_id, NEW.referrer_id, 0 WHERE NEW.referrer_id IS NOT NULL;
+    INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth)
+    SELECT p.ancestor, c.descendant, p.depth + c.depth + 1
+      FROM referral_tree p, referral_tree c
+     WHERE p.descendant = NEW.referrer_id AND c.ancestor = NEW.tg_user_id;
+"""
+
+_UNLINK = """
+    DELETE FROM referral_tree
+     WHERE descendant IN (SELECT descendant FROM referral_tree WHERE ancestor = OLD.tg_user_id)
+       AND ancestor IN (SELECT ancestor FROM referral_tree WHERE descendant = OLD.tg_user_id AND depth > 0);
+"""
+
+_TRIGGERS = {
+    "trg_reftree_users_ai": """
+        AFTER INSERT ON users BEGIN
+          INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth) VALUES (NEW.tg_user_id, NEW.tg_user_id, 0);
+        END""",
+    "trg_reftree_users_ai_link": f"""
+        AFTER INSERT ON users
+        WHEN NEW.referrer_id IS NOT NULL AND NOT ({_CYCLE}) BEGIN
+          {_LINK}
+        END""",
+    # Отклоняется только сам запрос со ссылкой-циклом; set_referrer() такую
+    # ссылку не пишет, поэтому обычные обновления users сюда не попадают.
+    "trg_reftree_users_bu": f"""
+        BEFORE UPDATE OF referrer_id ON users
+        WHEN NEW.referrer_id IS NOT NULL AND ({_CYCLE}) BEGIN
+          SELECT RAISE(ABORT, 'referral cycle');
+        END""",
+    "trg_reftree_users_au": f"""
+        AFTER UPDATE OF referrer_id ON users
+        WHEN OLD.referrer_id IS NOT NEW.referrer_id BEGIN
+          {_UNLINK}
+          {_LINK}
+        END""",
+    # Удалённый пользователь пропадает из дерева вместе со всеми путями через
+    # него: у его рефералов referrer_id обнуляется (они становятся корнями своих
+    # поддеревьев), у его предков уменьшается downline.
+    "trg_reftree_users_ad": """
+        AFTER DELETE ON users BEGIN
+          UPDATE users SET referrer_id = NULL WHERE referrer_id = OLD.tg_user_id;
+          DELETE FROM referral_tree
+           WHERE descendant IN (SELECT descendant FROM referral_tree WHERE ancestor = OLD.tg_user_id)
+             AND ancestor IN (SELECT ancestor FROM referral_tree WHERE descendant = OLD.tg_user_id);
+        END""",
+    "trg_reftree_path_ai": """
+        AFTER INSERT ON referral_tree WHEN NEW.depth > 0 BEGIN
+          INSERT OR IGNORE INTO referral_depth_counts(ancestor, depth, cnt) VALUES (NEW.ancestor, NEW.depth, 0);
+          UPDATE referral_depth_counts SET cnt = cnt + 1 WHERE ancestor = NEW.ancestor AND depth = NEW.depth;
+          INSERT OR IGNORE INTO referral_downline(ancestor, total) VALUES (NEW.ancestor, 0);
+          UPDATE referral_downline SET total = total + 1 WHERE ancestor = NEW.ancestor;
+        END""",
+    "trg_reftree_path_ad": """
+        AFTER DELETE ON referral_tree WHEN OLD.depth > 0 BEGIN
+          UPDATE referral_depth_counts SET cnt = cnt - 1 WHERE ancestor = OLD.ancestor AND depth = OLD.depth;
+          DELETE FROM referral_depth_counts WHERE ancestor = OLD.ancestor AND depth = OLD.depth AND cnt <= 0;
+          UPDATE referral_downline SET total = total - 1 WHERE ancestor = OLD.ancestor;
+          DELETE FROM referral_downline WHERE ancestor = OLD.ancestor AND total <= 0;
+        END""",
+}
+
+
+def _rebuild(conn: sqlite3.Connection) -> None:
+    """Заполнение дерева с нуля по users.referrer_id (счётчики ведут триггеры на referral_tree)."""
+    conn.execute("DELETE FROM referral_tree")
+    conn.execute("DELETE FROM referral_depth_counts")
+    conn.execute("DELETE FROM referral_downline")
+    conn.execute("""
+        INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth)
+        SELECT tg_user_id, tg_user_id, 0 FROM users
+        UNION ALL
+        SELECT DISTINCT referrer_id, referrer_id, 0 FROM users WHERE referrer_id IS NOT NULL
+    """)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO referral_tree(ancestor, descendant, depth)
+        WITH RECURSIVE up(ancestor, descendant, depth) AS (
+            SELECT referrer_id, tg_user_id, 1 FROM users
+             WHERE referrer_id IS NOT NULL AND referrer_id <> tg_user_id
+            UNION ALL
+            SELECT u.referrer_id, up.descendant, up.depth + 1
+              FROM up JOIN users u ON u.tg_user_id = up.ancestor
+             WHERE u.referrer_id IS NOT NULL AND u.referrer_id <> up.descendant AND up.depth < {MAX_DEPTH}
+        )
+        SELECT ancestor, descendant, MIN(depth) FROM up GROUP BY ancestor, descendant
+    """)
+
+
+def ensure_referrals_schema(conn: sqlite3.Connection) -> None:
+    """Closure table и счётчики. Вызывается из init_db после схемы users."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_tree (
+            ancestor    INTEGER NOT NULL,
+            descendant  INTEGER NOT NULL,
+            depth       INTEGER NOT NULL,
+            PRIMARY KEY (ancestor, descendant)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_referral_tree_desc ON referral_tree(descendant, depth)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_depth_counts (
+            ancestor  INTEGER NOT NULL,
+            depth     INTEGER NOT NULL,
+            cnt       INTEGER NOT NULL,
+            PRIMARY KEY (ancestor, depth)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_downline (
+            ancestor  INTEGER PRIMARY KEY,
+            total     INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_referral_downline_total ON referral_downline(total DESC, ancestor)")
+
+    existing = {
+        r[0]: r[1]
+        for r in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_reftree_%'")
+    }
+    missing = False
+    for name, body in _TRIGGERS.items():
+        sql = f"CREATE TRIGGER {name} {body}"
+        if existing.get(name) == sql:
+            continue
+        missing = missing or name not in existing
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")   # тело триггера изменилось
+        conn.execute(sql)
+    if missing:
+        _rebuild(conn)
+
+
+def set_referrer(conn: sqlite3.Connection, tg_user_id: int, referrer_id: int) -> bool:
+    """Записывает реферера, если его ещё нет и ссылка не замыкает цикл. True — записан."""
+    cur = conn.execute(
+        """
+        UPDATE users SET referrer_id = ?2
+         WHERE tg_user_id = ?1
+           AND referrer_id IS NULL
+           AND ?1 <> ?2
+           AND NOT EXISTS (SELECT 1 FROM referral_tree WHERE ancestor = ?1 AND descendant = ?2)
+        """,
+        (tg_user_id, referrer_id),
+    )
+    return cur.rowcount > 0
+
+
+@dataclass(slots=True)
+class TreeSummary:
+    tg_user_id: int
+    upline: List[int] = field(default_factory=list)            # от прямого реферера вверх
+    downline_total: int = 0
+    by_depth: List[Tuple[int, int]] = field(default_factory=list)  # (глубина, число)
+    direct: List[int] = field(default_factory=list)             # первые прямые рефералы
+
+
+def tree_summary(tg_user_id: int, *, direct_limit: int = 20) -> Optional[TreeSummary]:
+    conn = get_conn()
+    try:
+        if not conn.execute(
+            "SELECT 1 FROM referral_tree WHERE ancestor = ? AND descendant = ?", (tg_user_id, tg_user_id)
+        ).fetchone():
+            return None
+        s = TreeSummary(tg_user_id)
+        s.upline = [r[0] for r in conn.execute(
+            "SELECT ancestor FROM referral_tree WHERE descendant = ? AND depth > 0 ORDER BY depth", (tg_user_id,)
+        )]
+        row = conn.execute("SELECT total FROM referral_downline WHERE ancestor = ?", (tg_user_id,)).fetchone()
+        s.downline_total = row[0] if row else 0
+        s.by_depth = [(r[0], r[1]) for r in conn.execute(
+            "SELECT depth, cnt FROM referral_depth_counts WHERE ancestor = ? ORDER BY depth", (tg_user_id,)
+        )]
+        s.direct = [r[0] for r in conn.execute(
+            "SELECT descendant FROM referral_tree WHERE ancestor = ? AND depth = 1 LIMIT ?", (tg_user_id, direct_limit)
+        )]
+        return s
+    finally:
+        conn.close()
+
+
+def top_downline(n: int = 10) -> List[Tuple[int, int]]:
+    conn = get_conn()
+    try:
+        rows = conn.execute(
+            "SELECT ancestor, total FROM referral_downline ORDER BY total DESC, ancestor LIMIT ?", (n,)
+        ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+    finally:
+        conn.close()
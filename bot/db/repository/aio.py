@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import aiosqlite
+
+# Общее долгоживущее aiosqlite-соединение для репозиториев backend
+# (SubscriptionRepo, WebhookEventRepo): один поток SQLite на процесс вместо
+# нового потока и файла на каждый запрос, подготовленные выражения
+# переиспользуются из кэша соединения.
+
+BUSY_TIMEOUT_MS = 5000
+
+
+async def connect(db_path: str) -> aiosqlite.Connection:
+    # isolation_level=None: каждый запрос — своя транзакция, запросы разных
+    # корутин на одном соединении не попадают в чужой commit.
+    db = await aiosqlite.connect(db_path, isolation_level=None)
+    try:
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        await db.execute("PRAGMA synchronous=NORMAL")
+    except BaseException:
+        await db.close()   # поток aiosqlite не должен пережить ошибку открытия
+        raise
+    return db
@@ -1,32 +1,22 @@
 import logging, sqlite3
-from datetime import datetime
 from typing import Tuple
-from bot.db.session import get_conn
+from bot.db import stats
+from bot.db.revenue import SOURCE_ADMIN, record_payment
 
 logger = logging.getLogger(__name__)
 
 class PaymentRepository:
-    def store(self, tg_id: int, amount: int) -> None:
+    def store(self, tg_id: int, amount: int, **kw) -> None:
+        kw.setdefault("source", SOURCE_ADMIN)
         try:
-            with get_conn() as con:
-                con.execute(
-                    "INSERT INTO payments(tg_id, amount, paid_at) VALUES (?, ?, ?)",
-                    (tg_id, amount, datetime.utcnow().isoformat()),
-                )
+            record_payment(tg_id, amount, **kw)
         except sqlite3.Error as e:
             logger.error("store payment %s %s", tg_id, e)
 
     def global_stats(self) -> Tuple[int, int, int]:
         try:
-            with get_conn() as con:
-                cur = con.cursor()
-                cur.execute("SELECT COUNT(*) FROM users")
-                total = cur.fetchone()[0]
-                cur.execute("SELECT COUNT(*) FROM users WHERE paid=1")
-                paid = cur.fetchone()[0]
-                cur.execute("SELECT COALESCE(SUM(amount),0) FROM payments")
-                money = cur.fetchone()[0]
-                return total, paid, money
+            c = stats.global_stats()
+            return c["users_total"], c["active_paid"], c.get(f"{stats.REVENUE_PREFIX}RUB", 0)   # сумма в рублях
         except sqlite3.Error as e:
             logger.error("global stats %s", e)
         return 0, 0, 0
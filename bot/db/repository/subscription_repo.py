@@ -3,16 +3,26 @@ import aiosqlite
 from datetime import date
 from typing import Optional
 
+from bot.db.repository.aio import connect
+
 
 class SubscriptionRepo:
+    """Подписки Lava (счета и оплаты) на одном долгоживущем соединении.
+
+    ``open()`` открывает соединение (WAL, busy_timeout), ``close()`` — закрывает;
+    соединение можно передать другим репозиториям backend через ``db``.
+    Запросы по пользователю идут по индексу (user_id, status).
+    """
 
-    def __init__(self, db_path: str = "data/bot.sqlite3"):
+    def __init__(self, db: aiosqlite.Connection, db_path: str = "data/bot.sqlite3"):
+        self.db = db
         self.db_path = db_path
 
     @classmethod
     async def open(cls, db_path: str = "data/bot.sqlite3") -> SubscriptionRepo:
-        self = cls(db_path)
-        async with aiosqlite.connect(self.db_path) as db:
+        self = cls(await connect(db_path), db_path)
+        db = self.db
+        try:
             await db.execute(
                 """
                 CREATE TABLE IF NOT EXISTS subscriptions (
@@ -23,13 +33,30 @@ class SubscriptionRepo:
                     periodicity  TEXT,
                     started_at   DATE,
                     expired_at   DATE,
-                    payment_url  TEXT NOT NULL
+                    payment_url  TEXT NOT NULL,
+                    offer_id     TEXT,
+                    currency     TEXT,
+                    created_at   TEXT
                 );
                 """
             )
-            await db.commit()
+            cursor = await db.execute("PRAGMA table_info(subscriptions)")
+            cols = {r[1] for r in await cursor.fetchall()}
+            for col in ("offer_id", "currency", "created_at"):
+                if col not in cols:
+                    await db.execute(f"ALTER TABLE subscriptions ADD COLUMN {col} TEXT")
+            # Поиск неоплаченного счёта, подтверждение оплаты и активная подписка — по индексу.
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS ix_subscriptions_user_status ON subscriptions(user_id, status)"
+            )
+        except BaseException:
+            await db.close()   # иначе поток aiosqlite не даст процессу завершиться
+            raise
         return self
 
+    async def close(self) -> None:
+        await self.db.close()
+
     async def create_pending(
         self,
         *,
@@ -37,17 +64,45 @@ class SubscriptionRepo:
         email: str,
         payment_url: str,
         periodicity: Optional[str] = None,
+        offer_id: Optional[str] = None,
+        currency: Optional[str] = None,
     ) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                INSERT INTO subscriptions (
-                    user_id, email, status, periodicity, payment_url
-                ) VALUES (?, ?, 'pending', ?, ?)
-                """,
-                (user_id, email, periodicity, payment_url),
-            )
-            await db.commit()
+        await self.db.execute(
+            """
+            INSERT INTO subscriptions (
+                user_id, email, status, periodicity, payment_url, offer_id, currency, created_at
+            ) VALUES (?, ?, 'pending', ?, ?, ?, ?, datetime('now'))
+            """,
+            (user_id, email, periodicity, payment_url, offer_id, currency),
+        )
+
+    async def find_pending(
+        self,
+        *,
+        user_id: int,
+        offer_id: str,
+        currency: str,
+        periodicity: Optional[str],
+        max_age_seconds: int,
+    ) -> Optional[str]:
+        """payment_url последнего неоплаченного счёта на тот же тариф, созданного не раньше max_age_seconds назад."""
+        cursor = await self.db.execute(
+            """
+            SELECT payment_url FROM subscriptions
+             WHERE user_id     = ?
+               AND status      = 'pending'
+               AND offer_id    = ?
+               AND currency    = ?
+               AND periodicity IS ?
+               AND created_at >= datetime('now', ?)
+             ORDER BY id DESC
+             LIMIT 1
+            """,
+            (user_id, offer_id, currency, periodicity, f"-{int(max_age_seconds)} seconds"),
+        )
+        row = await cursor.fetchone()
+        await cursor.close()
+        return row[0] if row else None
 
     async def mark_paid(
         self,
@@ -56,32 +111,31 @@ class SubscriptionRepo:
         started_at: date,
         expired_at: Optional[date] = None,
     ) -> None:
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                UPDATE subscriptions
-                   SET status      = 'paid',
-                       started_at  = ?,
-                       expired_at  = ?
-                 WHERE user_id     = ?
-                   AND status      = 'pending'
-                """,
-                (started_at, expired_at, user_id),
-            )
-            await db.commit()
+        await self.db.execute(
+            """
+            UPDATE subscriptions
+               SET status      = 'paid',
+                   started_at  = ?,
+                   expired_at  = ?
+             WHERE user_id     = ?
+               AND status      = 'pending'
+            """,
+            (started_at, expired_at, user_id),
+        )
 
     async def get_active(self, user_id: int) -> Optional[dict]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                """
-                SELECT * FROM subscriptions
-                 WHERE user_id = ?
-                   AND status  = 'paid'
-                   AND (expired_at IS NULL OR expired_at >= DATE('now'))
-                 LIMIT 1
-                """,
-                (user_id,),
-            )
-            row = await cursor.fetchone()
-            return dict(row) if row else None
+        cursor = await self.db.execute(
+            """
+            SELECT * FROM subscriptions
+             WHERE user_id = ?
+               AND status  = 'paid'
+               AND (expired_at IS NULL OR expired_at >= DATE('now'))
+             LIMIT 1
+            """,
+            (user_id,),
+        )
+        row = await cursor.fetchone()
+        names = [d[0] for d in cursor.description]
+        await cursor.close()
+        return dict(zip(names, row)) if row else None
+
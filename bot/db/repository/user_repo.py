@@ -5,6 +5,8 @@ from typing import Optional, List, Tuple, Dict
 
 from bot.constants import Role
 from bot.db.session import get_conn  
+from bot.db import stats
+from bot.db.referrals import set_referrer
 
 logger = logging.getLogger(__name__)
 
@@ -29,33 +31,28 @@ def _now_iso() -> str:
     return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
 class UserRepository:
-    def upsert(self, tg_user_id: int, ref_code: Optional[str] = None) -> None:
+    def upsert(self, tg_user_id: int, ref_code: Optional[str] = None, username: Optional[str] = None) -> None:
         try:
             with get_conn() as con:
                 _ensure_user_columns(con)
 
                 con.execute(
                     """
-                    INSERT INTO users (tg_user_id, role, created_at, updated_at, last_seen)
-                    VALUES (?, ?, datetime('now'), datetime('now'), datetime('now'))
+                    INSERT INTO users (tg_user_id, username, role, created_at, updated_at, last_seen, username_checked_at)
+                    VALUES (?, ?, ?, datetime('now'), datetime('now'), datetime('now'), datetime('now'))
                     ON CONFLICT(tg_user_id) DO UPDATE SET
+                      username   = excluded.username,
+                      username_checked_at = datetime('now'),
                       last_seen  = datetime('now'),
                       updated_at = datetime('now')
                     """,
-                    (tg_user_id, _role_to_value(Role.UNREGISTERED)),
+                    (tg_user_id, username, _role_to_value(Role.UNREGISTERED)),
                 )
 
                 if ref_code and ref_code.isdigit():
                     referrer_id = int(ref_code)
                     if referrer_id != tg_user_id:
-                        con.execute(
-                            """
-                            UPDATE users
-                               SET referrer_id = COALESCE(referrer_id, ?)
-                             WHERE tg_user_id = ?
-                            """,
-                            (referrer_id, tg_user_id),
-                        )
+                        set_referrer(con, tg_user_id, referrer_id)
         except sqlite3.Error as e:
             logger.error("user_repo.upsert tg_user_id=%s error=%s", tg_user_id, e)
 
@@ -119,6 +116,7 @@ class UserRepository:
                     """
                     SELECT
                       u.tg_user_id                                                   AS tg_id,
+                      u.username                                                     AS username,
                       u.role                                                         AS role,
                       CASE
                         WHEN UPPER(COALESCE(s.status,'NONE')) = 'ACTIVE'
@@ -128,9 +126,11 @@ class UserRepository:
                       u.price_offer                                                  AS price,
                       u.referrer_id                                                  AS parent,
                       u.inst_nick                                                    AS inst,
+                      COALESCE(rc.cnt, 0)                                            AS refs,
                       COALESCE(u.created_at, u.updated_at, datetime('now'))          AS joined_at
                     FROM users u
                     LEFT JOIN subscriptions s ON s.tg_user_id = u.tg_user_id
+                    LEFT JOIN referral_counts rc ON rc.referrer_id = u.tg_user_id
                     ORDER BY joined_at DESC
                     LIMIT ? OFFSET ?
                     """,
@@ -156,18 +156,14 @@ class UserRepository:
 
     def referral_counts(self) -> Dict[int, int]:
         try:
-            with get_conn() as con:
-                _ensure_user_columns(con)
-                cur = con.execute(
-                    """
-                    SELECT referrer_id AS uid, COUNT(*) AS cnt
-                    FROM users
-                    WHERE referrer_id IS NOT NULL
-                    GROUP BY referrer_id
-                    ORDER BY cnt DESC
-                    """
-                )
-                return {uid: cnt for uid, cnt in cur.fetchall()}
+            return stats.referral_counts()
         except sqlite3.Error as e:
             logger.error("user_repo.referral_counts error=%s", e)
         return {}
+
+    def top_referrers(self, n: int = 5) -> List[Tuple[int, int]]:
+        try:
+            return stats.top_referrers(n)
+        except sqlite3.Error as e:
+            logger.error("user_repo.top_referrers error=%s", e)
+        return []
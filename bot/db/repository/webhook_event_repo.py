@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+import aiosqlite
+
+from bot.db.repository.aio import connect
+
+# Принятые вебхуки платёжного провайдера: ключ события -> состояние обработки.
+#   processing — обработка идёт (или процесс упал посреди неё)
+#   done       — обработан, повтор с тем же ключом игнорируется
+
+
+class WebhookEventRepo:
+
+    def __init__(self, db: aiosqlite.Connection, *, owned: bool = True):
+        self.db = db
+        self.owned = owned
+
+    @classmethod
+    async def open(cls, db_path: str = "data/bot.sqlite3", *, db: Optional[aiosqlite.Connection] = None) -> WebhookEventRepo:
+        """Своё соединение с db_path или общее ``db`` (например, SubscriptionRepo.db)."""
+        self = cls(db or await connect(db_path), owned=db is None)
+        try:
+            await self.db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS webhook_events (
+                    event_key     TEXT PRIMARY KEY,
+                    provider      TEXT NOT NULL,
+                    status        TEXT NOT NULL,
+                    received_at   INTEGER NOT NULL,
+                    processed_at  INTEGER
+                ) WITHOUT ROWID
+                """
+            )
+        except BaseException:
+            await self.close()   # своё соединение; общее закрывает владелец
+            raise
+        return self
+
+    async def close(self) -> None:
+        if self.owned:
+            await self.db.close()
+
+    async def claim(self, event_key: str, provider: str, *, stale_after: int = 600) -> Optional[str]:
+        """Забирает событие в обработку: None — забрано, иначе текущий статус события.
+
+        Зависшая (дольше ``stale_after`` секунд) обработка считается упавшей
+        и может быть забрана повторно.
+        """
+        now = int(time.time())
+        # fetchall: в режиме автокоммита запись фиксируется, когда выражение дочитано
+        rows = await self.db.execute_fetchall(
+            """
+            INSERT INTO webhook_events (event_key, provider, status, received_at)
+            VALUES (?, ?, 'processing', ?)
+            ON CONFLICT(event_key) DO UPDATE SET received_at = excluded.received_at
+             WHERE webhook_events.status = 'processing'
+               AND webhook_events.received_at < ?
+            RETURNING event_key
+            """,
+            (event_key, provider, now, now - stale_after),
+        )
+        if rows:
+            return None
+        rows = await self.db.execute_fetchall("SELECT status FROM webhook_events WHERE event_key = ?", (event_key,))
+        return rows[0][0] if rows else "processing"
+
+    async def complete(self, event_key: str) -> None:
+        await self.db.execute(
+            "UPDATE webhook_events SET status = 'done', processed_at = ? WHERE event_key = ?",
+            (int(time.time()), event_key),
+        )
+
+    async def release(self, event_key: str) -> None:
+        """Обработка не удалась — повтор от провайдера должен пройти заново."""
+        await self.db.execute(
+            "DELETE FROM webhook_events WHERE event_key = ? AND status = 'processing'", (event_key,)
+        )
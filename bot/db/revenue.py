@@ -0,0 +1,170 @@
+# bot/db/revenue.py
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bot.db.connection import get_conn
+
+# Выручка по дням: каждая строка payments (оплата через Lava или активация
+# админом) триггером прибавляется к корзине
+#
+#   revenue_daily(day, offer_id, periodicity, source, currency) -> payments, amount
+#
+# Отчёт за N дней читает не больше N * (число корзин в день) строк
+# по первичному ключу и не зависит от размера payments.
+# Пустые offer_id/periodicity хранятся как '' — колонки входят в первичный ключ.
+
+SOURCE_LAVA = "lava"
+SOURCE_ADMIN = "admin"
+
+_PAYMENT_COLUMNS = {
+    "offer_id": "TEXT",
+    "periodicity": "TEXT",
+    "source": "TEXT",
+    "currency": "TEXT NOT NULL DEFAULT 'RUB'",
+    "ext_id": "TEXT",   # id платежа у провайдера — повторный вебхук не задваивает выручку
+}
+
+_KEY = """
+    date(NEW.paid_at), COALESCE(NEW.offer_id, ''), COALESCE(NEW.periodicity, ''),
+    COALESCE(NEW.source, ''), COALESCE(NEW.currency, 'RUB')
+"""
+_MATCH = """
+    day = date({row}.paid_at) AND offer_id = COALESCE({row}.offer_id, '')
+    AND periodicity = COALESCE({row}.periodicity, '') AND source = COALESCE({row}.source, '')
+    AND currency = COALESCE({row}.currency, 'RUB')
+"""
+
+_TRIGGERS = {
+    "trg_revenue_payments_ai": f"""
+        AFTER INSERT ON payments BEGIN
+          INSERT OR IGNORE INTO revenue_daily(day, offer_id, periodicity, source, currency, payments, amount)
+          VALUES ({_KEY}, 0, 0);
+          UPDATE revenue_daily SET payments = payments + 1, amount = amount + NEW.amount
+           WHERE {_MATCH.format(row="NEW")};
+        END""",
+    "trg_revenue_payments_ad": f"""
+        AFTER DELETE ON payments BEGIN
+          UPDATE revenue_daily SET payments = payments - 1, amount = amount - OLD.amount
+           WHERE {_MATCH.format(row="OLD")};
+          DELETE FROM revenue_daily WHERE {_MATCH.format(row="OLD")} AND payments <= 0;
+        END""",
+}
+
+
+def _rebuild(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM revenue_daily")
+    conn.execute("""
+        INSERT INTO revenue_daily(day, offer_id, periodicity, source, currency, payments, amount)
+        SELECT date(paid_at), COALESCE(offer_id, ''), COALESCE(periodicity, ''),
+               COALESCE(source, ''), COALESCE(currency, 'RUB'), COUNT(*), SUM(amount)
+          FROM payments
+         GROUP BY 1, 2, 3, 4, 5
+    """)
+
+
+def ensure_revenue_schema(conn: sqlite3.Connection) -> None:
+    """Колонки разреза в payments, rollup и триггеры. Вызывается из init_db после ensure_stats_schema."""
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(payments)")}
+    for name, ddl in _PAYMENT_COLUMNS.items():
+        if name not in cols:
+            conn.execute(f"ALTER TABLE payments ADD COLUMN {name} {ddl}")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_payments_ext ON payments(source, ext_id) WHERE ext_id IS NOT NULL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS revenue_daily (
+            day          TEXT    NOT NULL,
+            offer_id     TEXT    NOT NULL,
+            periodicity  TEXT    NOT NULL,
+            source       TEXT    NOT NULL,
+            currency     TEXT    NOT NULL,
+            payments     INTEGER NOT NULL,
+            amount       INTEGER NOT NULL,
+            PRIMARY KEY (day, offer_id, periodicity, source, currency)
+        ) WITHOUT ROWID
+    """)
+
+    existing = {
+        r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_revenue_%'")
+    }
+    for name, body in _TRIGGERS.items():
+        if name not in existing:
+            conn.execute(f"CREATE TRIGGER {name} {body}")
+    if len(existing) < len(_TRIGGERS):
+        _rebuild(conn)
+
+
+def insert_payment(
+    conn: sqlite3.Connection,
+    tg_id: int,
+    amount: int,
+    *,
+    source: str,
+    offer_id: Optional[str] = None,
+    periodicity: Optional[str] = None,
+    currency: str = "RUB",
+    ext_id: Optional[str] = None,
+) -> bool:
+    """Платёж в транзакции вызывающего кода. False — такой ext_id уже записан."""
+    cur = conn.execute(
+        """
+        INSERT OR IGNORE INTO payments(tg_id, amount, paid_at, offer_id, periodicity, source, currency, ext_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (tg_id, amount, datetime.utcnow().isoformat(), offer_id, periodicity, source, currency, ext_id),
+    )
+    return cur.rowcount == 1
+
+
+def record_payment(tg_id: int, amount: int, **kw) -> bool:
+    conn = get_conn()
+    try:
+        with conn:
+            return insert_payment(conn, tg_id, amount, **kw)
+    finally:
+        conn.close()
+
+
+@dataclass(slots=True)
+class RevenueReport:
+    days: int
+    # валюта -> (платежей, сумма)
+    total: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    # (день, валюта, платежей, сумма), от новых к старым
+    by_day: List[Tuple[str, str, int, int]] = field(default_factory=list)
+    # разрез -> [(значение, валюта, платежей, сумма)] по убыванию суммы
+    by_offer: List[Tuple[str, str, int, int]] = field(default_factory=list)
+    by_periodicity: List[Tuple[str, str, int, int]] = field(default_factory=list)
+    by_source: List[Tuple[str, str, int, int]] = field(default_factory=list)
+
+
+def revenue_report(days: int) -> RevenueReport:
+    """Сводка за последние ``days`` дней (включая сегодня, UTC) из revenue_daily."""
+    rep = RevenueReport(days)
+    since = f"-{max(days, 1) - 1} days"
+    conn = get_conn()
+    try:
+        def grouped(col: str) -> List[Tuple[str, str, int, int]]:
+            rows = conn.execute(
+                f"""
+                SELECT {col}, currency, SUM(payments), SUM(amount) FROM revenue_daily
+                 WHERE day >= date('now', ?)
+                 GROUP BY {col}, currency
+                 ORDER BY SUM(amount) DESC
+                """,
+                (since,),
+            ).fetchall()
+            return [(r[0], r[1], r[2], r[3]) for r in rows]
+
+        rep.by_day = sorted(grouped("day"), reverse=True)
+        rep.by_offer = grouped("offer_id")
+        rep.by_periodicity = grouped("periodicity")
+        rep.by_source = grouped("source")
+        for _, cur, n, amount in rep.by_day:
+            cnt, total = rep.total.get(cur, (0, 0))
+            rep.total[cur] = (cnt + n, total + amount)
+        return rep
+    finally:
+        conn.close()
@@ -0,0 +1,129 @@
+# bot/db/search.py
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+from typing import List, Tuple
+
+from bot.db.connection import get_conn
+
+logger = logging.getLogger(__name__)
+
+# Полнотекстовый поиск пользователей для админа: users_fts — contentless FTS5
+# (content=''), rowid = tg_user_id, колонки — username, inst_nick и id строкой.
+# Индекс ведут триггеры на users; сами значения читаются из users по rowid.
+# unicode61 режет ники по «_» и «.», поэтому «petrov» находит «ivan_petrov»,
+# а prefix='2 3' ускоряет короткие префиксные запросы вида «iv*».
+
+_TRIGGERS = {
+    "trg_users_fts_ai": """
+        AFTER INSERT ON users BEGIN
+          INSERT INTO users_fts(rowid, username, inst_nick, uid)
+          VALUES (NEW.tg_user_id, NEW.username, NEW.inst_nick, NEW.tg_user_id);
+        END""",
+    "trg_users_fts_au": """
+        AFTER UPDATE OF username, inst_nick ON users
+        WHEN OLD.username IS NOT NEW.username OR OLD.inst_nick IS NOT NEW.inst_nick BEGIN
+          INSERT INTO users_fts(users_fts, rowid, username, inst_nick, uid)
+          VALUES ('delete', OLD.tg_user_id, OLD.username, OLD.inst_nick, OLD.tg_user_id);
+          INSERT INTO users_fts(rowid, username, inst_nick, uid)
+          VALUES (NEW.tg_user_id, NEW.username, NEW.inst_nick, NEW.tg_user_id);
+        END""",
+    "trg_users_fts_ad": """
+        AFTER DELETE ON users BEGIN
+          INSERT INTO users_fts(users_fts, rowid, username, inst_nick, uid)
+          VALUES ('delete', OLD.tg_user_id, OLD.username, OLD.inst_nick, OLD.tg_user_id);
+        END""",
+}
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def ensure_search_schema(conn: sqlite3.Connection) -> None:
+    """users_fts и триггеры. Без FTS5 в сборке SQLite поиск работает через LIKE."""
+    # whois: точное совпадение без учёта регистра по индексу, а не LOWER() по всей таблице
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_users_username_nocase ON users(username COLLATE NOCASE)")
+
+    existing = {
+        r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_users_fts_%'")
+    }
+    if len(existing) == len(_TRIGGERS):
+        return
+    # Триггеров нет (первый запуск или users пересоздана миграцией) — индекс
+    # мог разойтись с таблицей, строим заново.
+    for name in existing:
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TABLE IF EXISTS users_fts")
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE users_fts USING fts5(
+                username, inst_nick, uid,
+                content = '',
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logger.warning("search: FTS5 unavailable (%s), /find falls back to LIKE", e)
+        return
+    conn.execute("""
+        INSERT INTO users_fts(rowid, username, inst_nick, uid)
+        SELECT tg_user_id, username, inst_nick, tg_user_id FROM users
+    """)
+    for name, body in _TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER {name} {body}")
+
+
+def _fts_query(text: str) -> str:
+    """«@Ivan pet» -> '"ivan"* "pet"*': каждое слово — префикс, все слова обязательны."""
+    return " ".join(f'"{t}"*' for t in _TOKEN.findall(text.lower()))
+
+
+def _has_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone() is not None
+
+
+def find_users(text: str, limit: int = 10) -> List[Tuple[int, str | None, str | None, str | None]]:
+    """(tg_user_id, username, inst_nick, role) по убыванию релевантности (bm25)."""
+    query = _fts_query(text)
+    if not query:
+        return []
+    conn = get_conn()
+    try:
+        if _has_fts(conn):
+            rows = conn.execute(
+                """
+                SELECT u.tg_user_id, u.username, u.inst_nick, u.role
+                  FROM users_fts f
+                  JOIN users u ON u.tg_user_id = f.rowid
+                 WHERE users_fts MATCH ?
+                 ORDER BY f.rank
+                 LIMIT ?
+                """,
+                (query, limit),
+            ).fetchall()
+        else:
+            like = text.strip().lstrip("@") + "%"
+            rows = conn.execute(
+                """
+                SELECT tg_user_id, username, inst_nick, role FROM users
+                 WHERE username LIKE ?1 OR inst_nick LIKE ?1 OR CAST(tg_user_id AS TEXT) LIKE ?1
+                 LIMIT ?2
+                """,
+                (like, limit),
+            ).fetchall()
+        return [tuple(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def find_by_username(username: str) -> int | None:
+    conn = get_conn()
+    try:
+        row = conn.execute(
+            "SELECT tg_user_id FROM users WHERE username = ? COLLATE NOCASE LIMIT 1", (username,)
+        ).fetchone()
+        return row[0] if row else None
+    finally:
+        conn.close()
@@ -0,0 +1,239 @@
+# bot/db/stats.py
+from __future__ import annotations
+
+import sqlite3
+from typing import Dict, List, Tuple
+
+from bot.db.connection import get_conn
+
+# Счётчики для /stats поддерживаются триггерами прямо в транзакции, которая
+# меняет данные, поэтому чтение — несколько строк по первичному ключу.
+#
+#   users_total   — строк в users
+#   active_paid   — подписок в статусе ACTIVE
+#   active_trials — фритрайлов в статусе ACTIVE
+#   revenue:<валюта> — сумма payments.amount в этой валюте (RUB, USD, ...)
+#   referral_counts(referrer_id, cnt) — приглашённых на каждого реферера
+#
+# «Активность» по времени (paid_until / trial_expires_at в прошлом) триггер
+# увидеть не может: это делает expire_lapsed(), переводя такие строки в EXPIRED
+# (вызывается периодической задачей бота).
+
+COUNTERS = ("users_total", "active_paid", "active_trials")
+REVENUE_PREFIX = "revenue:"
+
+_ACTIVE = "(UPPER(COALESCE({row}.status,'')) = 'ACTIVE')"
+
+
+def _bump(name: str, delta: str) -> str:
+    return f"UPDATE stats_counters SET value = value + ({delta}) WHERE name = '{name}';"
+
+
+def _revenue(row: str, sign: str) -> str:
+    name = f"'{REVENUE_PREFIX}' || COALESCE({row}.currency, 'RUB')"
+    return (
+        f"INSERT OR IGNORE INTO stats_counters(name, value) VALUES ({name}, 0);"
+        f"UPDATE stats_counters SET value = value {sign} {row}.amount WHERE name = {name};"
+    )
+
+
+def _ref_inc(ref: str) -> str:
+    return (
+        f"INSERT OR IGNORE INTO referral_counts(referrer_id, cnt) SELECT {ref}, 0 WHERE {ref} IS NOT NULL;"
+        f"UPDATE referral_counts SET cnt = cnt + 1 WHERE referrer_id = {ref};"
+    )
+
+
+def _ref_dec(ref: str) -> str:
+    return (
+        f"UPDATE referral_counts SET cnt = cnt - 1 WHERE referrer_id = {ref};"
+        f"DELETE FROM referral_counts WHERE referrer_id = {ref} AND cnt <= 0;"
+    )
+
+
+_TRIGGERS = {
+    "trg_stats_users_ai": f"""
+        AFTER INSERT ON users BEGIN
+          {_bump("users_total", "1")}
+          {_ref_inc("NEW.referrer_id")}
+        END""",
+    "trg_stats_users_ad": f"""
+        AFTER DELETE ON users BEGIN
+          {_bump("users_total", "-1")}
+          {_ref_dec("OLD.referrer_id")}
+        END""",
+    "trg_stats_users_ref": f"""
+        AFTER UPDATE OF referrer_id ON users
+        WHEN OLD.referrer_id IS NOT NEW.referrer_id BEGIN
+          {_ref_dec("OLD.referrer_id")}
+          {_ref_inc("NEW.referrer_id")}
+        END""",
+    "trg_stats_subs_ai": f"""
+        AFTER INSERT ON subscriptions BEGIN
+          {_bump("active_paid", _ACTIVE.format(row="NEW"))}
+        END""",
+    "trg_stats_subs_au": f"""
+        AFTER UPDATE OF status ON subscriptions BEGIN
+          {_bump("active_paid", _ACTIVE.format(row="NEW") + " - " + _ACTIVE.format(row="OLD"))}
+        END""",
+    "trg_stats_subs_ad": f"""
+        AFTER DELETE ON subscriptions BEGIN
+          {_bump("active_paid", "-" + _ACTIVE.format(row="OLD"))}
+        END""",
+    "trg_stats_trials_ai": f"""
+        AFTER INSERT ON free_trials BEGIN
+          {_bump("active_trials", _ACTIVE.format(row="NEW"))}
+        END""",
+    "trg_stats_trials_au": f"""
+        AFTER UPDATE OF status ON free_trials BEGIN
+          {_bump("active_trials", _ACTIVE.format(row="NEW") + " - " + _ACTIVE.format(row="OLD"))}
+        END""",
+    "trg_stats_trials_ad": f"""
+        AFTER DELETE ON free_trials BEGIN
+          {_bump("active_trials", "-" + _ACTIVE.format(row="OLD"))}
+        END""",
+    "trg_stats_payments_ai": f"""
+        AFTER INSERT ON payments BEGIN
+          {_revenue("NEW", "+")}
+        END""",
+    "trg_stats_payments_ad": f"""
+        AFTER DELETE ON payments BEGIN
+          {_revenue("OLD", "-")}
+        END""",
+}
+
+
+def _rebuild(conn: sqlite3.Connection) -> None:
+    """Пересчёт всех счётчиков с нуля (первый запуск или ручная сверка)."""
+    conn.execute("DELETE FROM stats_counters")
+    conn.execute("""
+        INSERT INTO stats_counters(name, value)
+        SELECT 'users_total',   (SELECT COUNT(*) FROM users)
+        UNION ALL
+        SELECT 'active_paid',   (SELECT COUNT(*) FROM subscriptions WHERE UPPER(COALESCE(status,'')) = 'ACTIVE')
+        UNION ALL
+        SELECT 'active_trials', (SELECT COUNT(*) FROM free_trials   WHERE UPPER(COALESCE(status,'')) = 'ACTIVE')
+    """)
+    # currency добавляет ensure_revenue_schema — при первой сборке её может ещё не быть
+    currency = "COALESCE(currency, 'RUB')" if "currency" in {
+        r[1] for r in conn.execute("PRAGMA table_info(payments)")
+    } else "'RUB'"
+    conn.execute(f"""
+        INSERT INTO stats_counters(name, value)
+        SELECT '{REVENUE_PREFIX}' || {currency}, SUM(amount) FROM payments GROUP BY {currency}
+    """)
+    conn.execute("DELETE FROM referral_counts")
+    conn.execute("""
+        INSERT INTO referral_counts(referrer_id, cnt)
+        SELECT referrer_id, COUNT(*) FROM users WHERE referrer_id IS NOT NULL GROUP BY referrer_id
+    """)
+
+
+def ensure_stats_schema(conn: sqlite3.Connection) -> None:
+    """Таблицы счётчиков и триггеры. Вызывается из init_db после схем users/subscriptions/free_trials."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id       INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id    INTEGER NOT NULL,
+            amount   INTEGER NOT NULL,
+            paid_at  TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_payments_tg ON payments(tg_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_users_referrer ON users(referrer_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name   TEXT PRIMARY KEY,
+            value  INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS referral_counts (
+            referrer_id  INTEGER PRIMARY KEY,
+            cnt          INTEGER NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_referral_counts_cnt ON referral_counts(cnt DESC, referrer_id)")
+
+    existing = {
+        r[0]: r[1]
+        for r in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE 'trg_stats_%'")
+    }
+    changed = False
+    for name, body in _TRIGGERS.items():
+        sql = f"CREATE TRIGGER {name} {body}"
+        if existing.get(name) != sql:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")   # новый триггер или изменилось тело
+            conn.execute(sql)
+            changed = True
+
+    # Счётчики заполняются один раз (и после смены триггеров); дальше их ведут триггеры.
+    have = conn.execute(
+        f"SELECT COUNT(*) FROM stats_counters WHERE name IN ({','.join('?' * len(COUNTERS))})", COUNTERS
+    ).fetchone()[0]
+    if changed or have < len(COUNTERS):
+        _rebuild(conn)
+
+
+def rebuild_stats() -> None:
+    conn = get_conn()
+    try:
+        with conn:
+            _rebuild(conn)
+    finally:
+        conn.close()
+
+
+def expire_lapsed() -> Tuple[int, int]:
+    """Переводит просроченные ACTIVE-подписки и фритрайлы в EXPIRED (триггеры поправят счётчики)."""
+    conn = get_conn()
+    try:
+        with conn:
+            subs = conn.execute("""
+                UPDATE subscriptions SET status = 'EXPIRED'
+                 WHERE UPPER(COALESCE(status,'')) = 'ACTIVE'
+                   AND paid_until IS NOT NULL AND paid_until < datetime('now')
+            """).rowcount
+            trials = conn.execute("""
+                UPDATE free_trials SET status = 'EXPIRED'
+                 WHERE UPPER(COALESCE(status,'')) = 'ACTIVE'
+                   AND datetime(trial_expires_at) < datetime('now')
+            """).rowcount
+        return subs, trials
+    finally:
+        conn.close()
+
+
+def global_stats() -> Dict[str, int]:
+    """Счётчики по имени; выручка — ключи ``revenue:<валюта>``."""
+    conn = get_conn()
+    try:
+        rows = conn.execute("SELECT name, value FROM stats_counters").fetchall()
+        return {name: 0 for name in COUNTERS} | {r["name"]: r["value"] for r in rows}
+    finally:
+        conn.close()
+
+
+def revenue_by_currency(counters: Dict[str, int]) -> List[Tuple[str, int]]:
+    """[(валюта, сумма)] из global_stats(): RUB первой, остальные по алфавиту."""
+    items = [(k.removeprefix(REVENUE_PREFIX), v) for k, v in counters.items() if k.startswith(REVENUE_PREFIX) and v]
+    return sorted(items, key=lambda cv: (cv[0] != "RUB", cv[0]))
+
+
+def top_referrers(n: int = 5) -> List[Tuple[int, int]]:
+    conn = get_conn()
+    try:
+        rows = conn.execute(
+            "SELECT referrer_id, cnt FROM referral_counts ORDER BY cnt DESC, referrer_id LIMIT ?", (n,)
+        ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+    finally:
+        conn.close()
+
+
+def referral_counts() -> Dict[int, int]:
+    conn = get_conn()
+    try:
+        return {r[0]: r[1] for r in conn.execute("SELECT referrer_id, cnt FROM referral_counts")}
+    finally:
+        conn.close()
@@ -1,6 +1,12 @@
 from __future__ import annotations
 
 from bot.db.connection import get_conn
+from bot.db.stats import ensure_stats_schema
+from bot.db.revenue import ensure_revenue_schema
+from bot.db.events import ensure_events_schema
+from bot.db.referrals import ensure_referrals_schema
+from bot.db.search import ensure_search_schema
+from bot.db.outbox import ensure_outbox_schema
 from contextlib import closing
 from typing import Optional, Literal
 
@@ -70,6 +76,14 @@ def _ensure_users_schema(conn: sqlite3.Connection) -> None:
         _ensure_column(conn, "users", "last_seen",
                        "ALTER TABLE users ADD COLUMN last_seen TEXT DEFAULT (datetime('now'));")
 
+    _ensure_column(conn, "users", "referrer_id", "ALTER TABLE users ADD COLUMN referrer_id INTEGER;")
+    _ensure_column(conn, "users", "inst_nick", "ALTER TABLE users ADD COLUMN inst_nick TEXT;")
+    _ensure_column(conn, "users", "price_offer", "ALTER TABLE users ADD COLUMN price_offer INTEGER;")
+    _ensure_column(conn, "users", "username_checked_at", "ALTER TABLE users ADD COLUMN username_checked_at TEXT;")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_users_username_checked ON users(username_checked_at);")
+    # Роль хранится в нижнем регистре (значения Role); раньше админка писала 'OLD'.
+    conn.execute("UPDATE users SET role = LOWER(role) WHERE role IS NOT NULL AND role <> LOWER(role);")
+
 def _ensure_free_trials_schema(conn: sqlite3.Connection) -> None:
     if not _table_exists(conn, "free_trials"):
         conn.execute("""
@@ -137,6 +151,12 @@ def init_db() -> None:
         _ensure_users_schema(conn)
         _ensure_free_trials_schema(conn)
         _ensure_subscriptions_schema(conn)
+        ensure_stats_schema(conn)
+        ensure_revenue_schema(conn)
+        ensure_referrals_schema(conn)
+        ensure_events_schema(conn)
+        ensure_search_schema(conn)
+        ensure_outbox_schema(conn)
         conn.commit()
     finally:
         conn.close()
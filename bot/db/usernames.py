@@ -0,0 +1,58 @@
+# bot/db/usernames.py
+from __future__ import annotations
+
+from typing import Iterable, List, Optional, Tuple
+
+from bot.db.connection import get_conn
+
+# users.username обновляется из входящих апдейтов (см. bot/api/usernames.py);
+# username_checked_at — когда ник последний раз подтверждён (апдейтом или get_chat).
+
+
+def save_usernames(rows: Iterable[Tuple[int, Optional[str]]]) -> None:
+    """Пачка (tg_user_id, username): одна транзакция, только для существующих пользователей."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany(
+                """
+                UPDATE users
+                   SET username = ?2, username_checked_at = datetime('now')
+                 WHERE tg_user_id = ?1
+                """,
+                rows,
+            )
+    finally:
+        conn.close()
+
+
+def stale_usernames(limit: int, max_age_days: int) -> List[int]:
+    """Пользователи, чей ник давно не подтверждался (или не подтверждался никогда)."""
+    conn = get_conn()
+    try:
+        rows = conn.execute(
+            """
+            SELECT tg_user_id FROM users
+             WHERE username_checked_at IS NULL
+                OR username_checked_at < datetime('now', ?)
+             ORDER BY username_checked_at IS NOT NULL, username_checked_at
+             LIMIT ?
+            """,
+            (f"-{max_age_days} days", limit),
+        ).fetchall()
+        return [r[0] for r in rows]
+    finally:
+        conn.close()
+
+
+def mark_checked(user_ids: Iterable[int]) -> None:
+    """Ник получить не удалось (бот заблокирован и т.п.) — не пытаться снова до следующего срока."""
+    conn = get_conn()
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE users SET username_checked_at = datetime('now') WHERE tg_user_id = ?",
+                ((uid,) for uid in user_ids),
+            )
+    finally:
+        conn.close()
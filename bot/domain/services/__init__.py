@@ -1,14 +1,32 @@
-from bot.db.repository.user_repo import UserRepository
-from bot.db.repository.payment_repo import PaymentRepository
-from .users import UserService
-from .payments import PaymentService
-from .referral import ReferralService
+from __future__ import annotations
 
-_user_repo = UserRepository()
-_payment_repo = PaymentRepository()
-
-user_service = UserService(_user_repo)
-payment_service = PaymentService(_payment_repo, _user_repo)
-referral_service = ReferralService(_user_repo)
+from typing import Any, Dict
 
 __all__ = ["user_service", "payment_service", "referral_service"]
+
+_services: Dict[str, Any] = {}
+
+
+def _build() -> None:
+    # Сервисы и репозитории создаются при первом обращении, а не при импорте пакета:
+    # импорт любого bot.domain.services.<модуль> не тянет за собой весь слой.
+    from bot.db.repository.user_repo import UserRepository
+    from bot.db.repository.payment_repo import PaymentRepository
+    from .users import UserService
+    from .payments import PaymentService
+    from .referral import ReferralService
+
+    user_repo = UserRepository()
+    _services.update(
+        user_service=UserService(user_repo),
+        payment_service=PaymentService(PaymentRepository(), user_repo),
+        referral_service=ReferralService(user_repo),
+    )
+
+
+def __getattr__(name: str) -> Any:
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if not _services:
+        _build()
+    return _services[name]
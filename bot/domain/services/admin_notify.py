@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import TelegramError
+
+from bot.integration.telegram.outbound import TRANSACTIONAL_ARGS
+
+logger = logging.getLogger(__name__)
+
+MODERATION = "moderation"
+SUPPORT = "support"
+PAYMENT = "payment"
+REELS = "reels"
+
+_TITLES = {
+    MODERATION: "👤 <b>На модерации</b>",
+    SUPPORT: "💬 <b>Обращения в поддержку</b>",
+    PAYMENT: "✅ <b>Подтверждённые платежи</b>",
+    REELS: "🎬 <b>Рилсы</b>",
+}
+
+# Лимиты Telegram на одно сообщение и его inline-клавиатуру.
+MAX_MESSAGE_CHARS = 4096
+MAX_BUTTONS = 100
+MAX_ROW_BUTTONS = 8
+# Длиннее пункт сводки обрезается (без HTML-разметки, чтобы не порвать теги).
+MAX_ITEM_CHARS = 600
+# После стольких неудачных отправок событие выбрасывается, чтобы битый пункт
+# не блокировал сводку навсегда.
+MAX_SEND_ATTEMPTS = 5
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+@dataclass(slots=True)
+class AdminEvent:
+    text: str                                    # одна строка HTML
+    buttons: List[InlineKeyboardButton] = field(default_factory=list)
+    attempts: int = 0
+
+
+def _clip(text: str) -> str:
+    if len(text) <= MAX_ITEM_CHARS:
+        return text
+    plain = html.unescape(_TAG.sub("", text))
+    return html.escape(plain[:MAX_ITEM_CHARS - 1]) + "…"
+
+
+def card_button(uid: int) -> InlineKeyboardButton:
+    return InlineKeyboardButton("👤 Карточка", callback_data=f"adm:{uid}:open")
+
+
+def price_buttons(uid: int, amounts: Sequence[int]) -> List[InlineKeyboardButton]:
+    """Кнопки-ярлыки для /price <uid> <amount>."""
+    return [InlineKeyboardButton(f"{a}₽", callback_data=f"price:{uid}:{a}") for a in amounts]
+
+
+class AdminNotifier:
+    """Сводки для админа: события одного вида копятся и уходят одним сообщением
+    раз в ``interval`` секунд, с кнопками действий под каждым пунктом.
+
+    Так админ-чат получает одно сообщение на вид событий за интервал,
+    а не по 2–4 сообщения на каждое событие.
+    """
+
+    def __init__(self, *, interval: float = 30.0):
+        self.interval = interval
+        self._bot: Optional[Bot] = None
+        self._chat_id: Optional[int] = None
+        self._pending: Dict[str, List[AdminEvent]] = defaultdict(list)
+        self._task: Optional[asyncio.Task] = None
+        self.events = 0
+        self.digests = 0
+        self.dropped = 0
+
+    def start(self, bot: Bot, chat_id: int) -> None:
+        self._bot, self._chat_id = bot, chat_id
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop(), name="admin_digest")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def notify(self, kind: str, text: str, buttons: Sequence[InlineKeyboardButton] = ()) -> None:
+        self._pending[kind].append(AdminEvent(_clip(text), list(buttons)))
+        self.events += 1
+        if self.interval <= 0 and self._bot is not None:
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("admin digest: flush failed")
+
+    async def flush(self) -> None:
+        if self._bot is None or not self._chat_id or not self._pending:
+            return
+        pending, self._pending = self._pending, defaultdict(list)
+        failed: Dict[str, List[AdminEvent]] = {}
+        for kind, items in pending.items():
+            offset = 0
+            for chunk in self._chunks(kind, items):
+                if failed or not await self._send(kind, chunk, offset):
+                    failed.setdefault(kind, []).extend(chunk)
+                offset += len(chunk)
+        if failed:
+            self._requeue(failed)
+
+    def _chunks(self, kind: str, items: List[AdminEvent]) -> List[List[AdminEvent]]:
+        """Режет пункты на сообщения по длине текста и числу кнопок."""
+        chunks: List[List[AdminEvent]] = []
+        chunk: List[AdminEvent] = []
+        size = len(_TITLES.get(kind, kind)) + 16
+        buttons = 0
+        for i, item in enumerate(items, start=1):
+            line = len(item.text) + len(str(i)) + 3
+            if chunk and (size + line > MAX_MESSAGE_CHARS or buttons + len(item.buttons) > MAX_BUTTONS):
+                chunks.append(chunk)
+                chunk, size, buttons = [], len(_TITLES.get(kind, kind)) + 16, 0
+            chunk.append(item)
+            size += line
+            buttons += len(item.buttons)
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _requeue(self, failed: Dict[str, List[AdminEvent]]) -> None:
+        # Неотправленные пункты возвращаются в начало очереди и уйдут
+        # следующей сводкой перед событиями, пришедшими за это время.
+        for kind, items in failed.items():
+            keep = []
+            for item in items:
+                item.attempts += 1
+                if item.attempts < MAX_SEND_ATTEMPTS:
+                    keep.append(item)
+            self.dropped += len(items) - len(keep)
+            if len(keep) < len(items):
+                logger.error("admin digest %s: dropped %d events after %d attempts",
+                             kind, len(items) - len(keep), MAX_SEND_ATTEMPTS)
+            if keep:
+                self._pending[kind][:0] = keep
+
+    async def _send(self, kind: str, items: List[AdminEvent], offset: int) -> bool:
+        lines = [_TITLES.get(kind, f"<b>{kind}</b>")]
+        rows: List[List[InlineKeyboardButton]] = []
+        for i, item in enumerate(items, start=offset + 1):
+            lines.append(f"{i}. {item.text}")
+            buttons = [
+                InlineKeyboardButton(f"{i}. {b.text}", callback_data=b.callback_data, url=b.url)
+                for b in item.buttons
+            ]
+            rows.extend(buttons[j:j + MAX_ROW_BUTTONS] for j in range(0, len(buttons), MAX_ROW_BUTTONS))
+        try:
+            await self._bot.send_message(
+                self._chat_id,
+                "\n".join(lines),
+                parse_mode=ParseMode.HTML,
+                reply_markup=InlineKeyboardMarkup(rows) if rows else None,
+                rate_limit_args=TRANSACTIONAL_ARGS,
+            )
+            self.digests += 1
+            return True
+        except TelegramError as e:
+            logger.error("admin digest %s: send failed (%d events kept): %s", kind, len(items), e)
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "events": self.events,
+            "digests_sent": self.digests,
+            "dropped": self.dropped,
+            "pending": sum(len(v) for v in self._pending.values()),
+        }
+
+
+admin_notifier = AdminNotifier(interval=float(os.getenv("ADMIN_DIGEST_SECONDS", "30")))
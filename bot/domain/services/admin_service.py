@@ -1,16 +1,29 @@
 # bot/domain/services/admin_service.py
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+import logging
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton, Bot
 
 from bot.db.subscriptions import (
     get_conn, is_paid, get_trial_info, has_active_trial, start_free_trial,
 )
-from bot.domain.services.onboarding_service import send_instruction_package
+from bot.domain.services import onboarding_fsm
+from bot.integration.telegram.outbound import BULK
+from bot.db import outbox as outbox_store
+from bot.db import revenue
+from bot.domain.services.outbox import outbox
+from bot.domain.services.event_log import event_log
+from bot.db.events import EventKind
+from bot.domain.services.export import ExportFilter
+
+logger = logging.getLogger(__name__)
 
 
 def _fmt_ddmmyyyy(dt_str: Optional[str]) -> str:
@@ -168,8 +181,8 @@ def _ensure_trial_row(conn, uid: int):
 async def exec_action(bot: Bot, action: str, uid: int) -> str:
     conn = get_conn()
     try:
-        with conn:
-            if action == "sub:activate:1m":
+        if action == "sub:activate:1m":
+            with conn:
                 _ensure_sub_row(conn, uid)
                 row = conn.execute("SELECT paid_until FROM subscriptions WHERE tg_user_id=?", (uid,)).fetchone()
                 new_until = _add_months(row["paid_until"] if row else None, 1)
@@ -178,18 +191,25 @@ async def exec_action(bot: Bot, action: str, uid: int) -> str:
                     "UPDATE subscriptions SET status='ACTIVE', paid_until=? WHERE tg_user_id=?",
                     (new_until, uid),
                 )
-                conn.execute(
-                    "UPDATE users SET role='OLD', updated_at=datetime('now') WHERE tg_user_id=?",
-                    (uid,),
-                ) 
+                onboarding_fsm.activate(conn, uid)
+                # Ручная активация — тоже платёж для выручки; сумма — назначенная цена, если есть.
+                price = conn.execute("SELECT price_offer FROM users WHERE tg_user_id=?", (uid,)).fetchone()
+                amount = int(price["price_offer"] or 0) if price else 0
+                revenue.insert_payment(conn, uid, amount, source=revenue.SOURCE_ADMIN, periodicity="PERIOD_30_DAYS")
 
                 _ensure_trial_row(conn, uid)
                 conn.execute("UPDATE free_trials SET status='USED' WHERE tg_user_id=?", (uid,))
 
-                await send_instruction_package(bot, uid)
+                # Отправка — после коммита, воркером outbox: загрузки в Telegram
+                # не держат блокировку записи БД и повторяются при сбое.
+                outbox_store.enqueue(conn, outbox_store.INSTRUCTIONS, uid)
 
-                return f"Подписка активирована до { _fmt_ddmmyyyy(new_until) }."
+            # Только после коммита: воркер увидит строку, а откат не оставит события.
+            event_log.record(uid, EventKind.PAID, amount or None)
+            outbox.wake()
+            return f"Подписка активирована до { _fmt_ddmmyyyy(new_until) }. Пакет инструкций отправляется."
 
+        with conn:
             if action == "sub:extend:1m":
                 _ensure_sub_row(conn, uid)
                 row = conn.execute("SELECT paid_until FROM subscriptions WHERE tg_user_id=?", (uid,)).fetchone()
@@ -200,10 +220,7 @@ async def exec_action(bot: Bot, action: str, uid: int) -> str:
                     "UPDATE subscriptions SET status='ACTIVE', paid_until=? WHERE tg_user_id=?",
                     (new_until, uid),
                 )
-                conn.execute(
-                    "UPDATE users SET role='OLD', updated_at=datetime('now') WHERE tg_user_id=?",
-                    (uid,),
-                )  
+                onboarding_fsm.activate(conn, uid)
 
                 return f"Подписка продлена до { _fmt_ddmmyyyy(new_until) }."
 
@@ -217,6 +234,7 @@ async def exec_action(bot: Bot, action: str, uid: int) -> str:
                     return "Нельзя запустить фритрайл: у пользователя активная платная подписка."
                 res = start_free_trial(uid, months=2)
                 if res == "STARTED":
+                    event_log.record(uid, EventKind.TRIAL_START)
                     info = get_trial_info(uid)
                     return f"Фритрайл запущен. Активен до: { _fmt_ddmmyyyy(info['trial_expires_at']) if info else '—' }."
                 if res == "ACTIVE_ALREADY":
@@ -241,3 +259,192 @@ async def exec_action(bot: Bot, action: str, uid: int) -> str:
         return "Неизвестное действие."
     finally:
         conn.close()
+
+
+
+# --- Массовые действия -------------------------------------------------------
+#
+# /bulk <действие> <id...|сегмент>: изменения для всех пользователей —
+# одна транзакция с set-based запросами по временной таблице целей;
+# уведомления ставятся в outbox в той же транзакции и уходят после коммита.
+
+BULK_ACTIONS = ("sub:extend:1m", "sub:cancel", "trial:start", "trial:expire")
+_BULK_ALIASES = {"sub:extend": "sub:extend:1m"}
+
+_SEGMENT_SQL = """
+    SELECT u.tg_user_id
+      FROM users u
+      LEFT JOIN subscriptions s ON s.tg_user_id = u.tg_user_id
+"""
+
+_BULK_NOTICE = {
+    "sub:extend:1m": "Твоя подписка продлена до {until} ✅",
+    "sub:cancel": "Твоя подписка отменена.",
+    "trial:start": "🎁 Тебе открыт фритрайл до {until}.",
+    "trial:expire": "Твой фритрайл завершён.",
+}
+
+
+@dataclass(slots=True)
+class BulkRequest:
+    action: str
+    ids: List[int] = field(default_factory=list)
+    segment: Optional[ExportFilter] = None   # None и нет ids — ошибка разбора
+    notify: bool = True
+
+    @classmethod
+    def parse(cls, args: List[str]) -> "BulkRequest":
+        """``<действие> (id id,id ... | all | role=.. paid=.. from=.. to=..) [silent]``."""
+        if not args:
+            raise ValueError("action")
+        action = _BULK_ALIASES.get(args[0].lower(), args[0].lower())
+        if action not in BULK_ACTIONS:
+            raise ValueError(args[0])
+        req, seg = cls(action), []
+        for arg in args[1:]:
+            for part in filter(None, arg.split(",")):
+                if part.isdigit():
+                    req.ids.append(int(part))
+                elif part.lower() == "silent":
+                    req.notify = False
+                elif part.lower() == "all":
+                    req.segment = ExportFilter()
+                elif "=" in part:
+                    seg.append(part)
+                else:
+                    raise ValueError(part)
+        if seg:
+            _, req.segment = ExportFilter.parse(seg)
+        if bool(req.ids) == (req.segment is not None):
+            raise ValueError("нужны либо id, либо сегмент")
+        return req
+
+
+@dataclass(slots=True)
+class BulkResult:
+    action: str
+    targets: int = 0
+    changed: List[Tuple[int, Optional[str]]] = field(default_factory=list)   # (uid, новая дата окончания)
+    skipped: Counter = field(default_factory=Counter)                        # причина -> число
+    batch: Optional[str] = None   # метка уведомлений в outbox, если они поставлены
+
+    def summary(self, progress: Optional[dict] = None) -> str:
+        lines = [f"<b>{self.action}</b>: целей {self.targets}, изменено {len(self.changed)}"]
+        lines += [f"• пропущено ({reason}): {n}" for reason, n in self.skipped.most_common()]
+        if progress:
+            lines.append(
+                f"Уведомления: доставлено {progress['DONE']}, в очереди {progress['PENDING']}, "
+                f"не доставлено {progress['DEAD']}"
+            )
+        return "\n".join(lines)
+
+
+def _load_targets(conn, req: BulkRequest) -> int:
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_targets (uid INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.bulk_targets")
+    if req.ids:
+        conn.executemany("INSERT OR IGNORE INTO temp.bulk_targets(uid) VALUES (?)", ((i,) for i in req.ids))
+        conn.execute("DELETE FROM temp.bulk_targets WHERE uid NOT IN (SELECT tg_user_id FROM users)")
+    else:
+        where, params = req.segment.where()
+        conn.execute(f"INSERT OR IGNORE INTO temp.bulk_targets(uid) {_SEGMENT_SQL}{where}", params)
+    return conn.execute("SELECT COUNT(*) FROM temp.bulk_targets").fetchone()[0]
+
+
+def count_bulk_targets(req: BulkRequest) -> int:
+    conn = get_conn()
+    try:
+        return _load_targets(conn, req)
+    finally:
+        conn.close()
+
+
+def apply_bulk(req: BulkRequest) -> BulkResult:
+    """Все изменения — одна транзакция; сеть здесь не трогается."""
+    res = BulkResult(req.action)
+    conn = get_conn()
+    try:
+        with conn:
+            res.targets = _load_targets(conn, req)
+            if req.ids and len(set(req.ids)) > res.targets:
+                res.skipped["нет в БД"] = len(set(req.ids)) - res.targets
+
+            if req.action == "sub:extend:1m":
+                conn.execute(
+                    "INSERT OR IGNORE INTO subscriptions (tg_user_id, status) SELECT uid, 'NONE' FROM temp.bulk_targets"
+                )
+                rows = conn.execute(
+                    "SELECT s.tg_user_id, s.paid_until FROM subscriptions s JOIN temp.bulk_targets b ON b.uid = s.tg_user_id"
+                ).fetchall()
+                res.changed = [(r[0], _add_months(r[1], 1)) for r in rows]
+                conn.executemany(
+                    "UPDATE subscriptions SET status='ACTIVE', paid_until=? WHERE tg_user_id=?",
+                    ((until, uid) for uid, until in res.changed),
+                )
+                onboarding_fsm.activate_many(conn, (uid for uid, _ in res.changed))
+
+            elif req.action == "sub:cancel":
+                rows = conn.execute("""
+                    UPDATE subscriptions SET status='CANCELED'
+                     WHERE tg_user_id IN (SELECT uid FROM temp.bulk_targets)
+                       AND UPPER(status) <> 'CANCELED'
+                    RETURNING tg_user_id
+                """).fetchall()
+                res.changed = [(r[0], None) for r in rows]
+                res.skipped["нет подписки или уже отменена"] = res.targets - len(res.changed)
+
+            elif req.action == "trial:start":
+                res.skipped["фритрайл уже был"] = conn.execute(
+                    "SELECT COUNT(*) FROM free_trials WHERE tg_user_id IN (SELECT uid FROM temp.bulk_targets)"
+                ).fetchone()[0]
+                rows = conn.execute("""
+                    INSERT INTO free_trials (tg_user_id, started_at, trial_expires_at, status)
+                    SELECT b.uid, datetime('now'), datetime('now', '+2 months'), 'ACTIVE'
+                      FROM temp.bulk_targets b
+                     WHERE NOT EXISTS (SELECT 1 FROM free_trials t WHERE t.tg_user_id = b.uid)
+                       AND NOT EXISTS (
+                           SELECT 1 FROM subscriptions s
+                            WHERE s.tg_user_id = b.uid
+                              AND UPPER(COALESCE(s.status,'NONE')) = 'ACTIVE'
+                              AND (s.paid_until IS NULL OR s.paid_until >= datetime('now')))
+                    RETURNING tg_user_id, trial_expires_at
+                """).fetchall()
+                res.changed = [(r[0], r[1]) for r in rows]
+                res.skipped["активная подписка"] = res.targets - len(res.changed) - res.skipped["фритрайл уже был"]
+
+            elif req.action == "trial:expire":
+                rows = conn.execute("""
+                    UPDATE free_trials SET status='EXPIRED', trial_expires_at=datetime('now')
+                     WHERE tg_user_id IN (SELECT uid FROM temp.bulk_targets)
+                       AND UPPER(status) = 'ACTIVE'
+                    RETURNING tg_user_id
+                """).fetchall()
+                res.changed = [(r[0], None) for r in rows]
+                res.skipped["нет активного фритрайла"] = res.targets - len(res.changed)
+
+            if req.notify and res.changed:
+                # Уведомления — в той же транзакции, но отправит их воркер outbox.
+                res.batch = f"bulk:{uuid.uuid4().hex[:12]}"
+                text = _BULK_NOTICE[req.action]
+                outbox_store.enqueue_many(
+                    conn,
+                    outbox_store.NOTICE,
+                    ((uid, {"text": text.format(until=_fmt_ddmmyyyy(until)), "lane": BULK}) for uid, until in res.changed),
+                    batch=res.batch,
+                )
+
+        res.skipped = +res.skipped   # убрать нулевые причины
+        logger.info("bulk %s: targets=%d changed=%d", req.action, res.targets, len(res.changed))
+        return res
+    finally:
+        conn.close()
+
+
+async def run_bulk(req: BulkRequest) -> BulkResult:
+    res = await asyncio.to_thread(apply_bulk, req)
+    if res.batch:
+        outbox.wake()
+    if req.action == "trial:start":
+        for uid, _ in res.changed:
+            event_log.record(uid, EventKind.TRIAL_START)
+    return res
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from bot.db.events import EventKind, EventRow, append_events
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+    """Буфер записи событий воронки.
+
+    ``record()`` только кладёт строку в память; в БД события уходят одной
+    пачкой раз в ``interval`` секунд или при накоплении ``max_batch`` штук,
+    запись выполняется в отдельном потоке и не держит event loop.
+    """
+
+    def __init__(self, *, interval: float = 5.0, max_batch: int = 500, max_pending: int = 50_000):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._buf: List[EventRow] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="event_log")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def record(self, user_id: int, kind: EventKind, arg: Optional[int] = None) -> None:
+        if len(self._buf) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._buf.append((int(time.time()), user_id, int(kind), arg))
+        self.recorded += 1
+        if len(self._buf) >= self.max_batch and self._task is not None and self._flushing is None:
+            self._flushing = asyncio.get_running_loop().create_task(self.flush())
+            self._flushing.add_done_callback(lambda _: setattr(self, "_flushing", None))
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buf:
+            return
+        batch, self._buf = self._buf, []
+        try:
+            await asyncio.to_thread(append_events, batch)
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            logger.error("event log: write of %d events failed: %s", len(batch), e)
+            self._buf[:0] = batch[: max(0, self.max_pending - len(self._buf))]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "recorded": self.recorded,
+            "written": self.written,
+            "pending": len(self._buf),
+            "dropped": self.dropped,
+        }
+
+
+event_log = EventLog(interval=float(os.getenv("EVENT_FLUSH_SECONDS", "5")))
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import csv
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Optional, Tuple
+
+from bot.db.connection import get_conn
+
+# Выгрузка пользователей в файл. Строки читаются курсором порциями и сразу
+# пишутся в файл, поэтому память не зависит от числа пользователей.
+
+COLUMNS = (
+    "tg_user_id", "username", "inst_nick", "role", "paid", "sub_status", "paid_until",
+    "trial_status", "trial_expires_at", "referrer_id", "refs", "price_offer", "created_at", "last_seen",
+)
+
+_PAID = """
+    (UPPER(COALESCE(s.status,'NONE')) = 'ACTIVE'
+     AND (s.paid_until IS NULL OR s.paid_until >= datetime('now')))
+"""
+
+_SQL = f"""
+    SELECT u.tg_user_id, u.username, u.inst_nick, u.role,
+           CASE WHEN {_PAID} THEN 1 ELSE 0 END,
+           s.status, s.paid_until, t.status, t.trial_expires_at,
+           u.referrer_id, COALESCE(rc.cnt, 0), u.price_offer, u.created_at, u.last_seen
+      FROM users u
+      LEFT JOIN subscriptions   s  ON s.tg_user_id   = u.tg_user_id
+      LEFT JOIN free_trials     t  ON t.tg_user_id   = u.tg_user_id
+      LEFT JOIN referral_counts rc ON rc.referrer_id = u.tg_user_id
+"""
+
+FETCH_SIZE = 1000
+
+
+@dataclass(slots=True)
+class ExportFilter:
+    role: Optional[str] = None
+    paid: Optional[bool] = None
+    date_from: Optional[str] = None   # YYYY-MM-DD, по created_at, включительно
+    date_to: Optional[str] = None
+
+    @classmethod
+    def parse(cls, args: List[str]) -> Tuple[str, "ExportFilter"]:
+        """``[csv|xlsx] [role=new] [paid=1] [from=2025-01-01] [to=2025-01-31]`` -> (формат, фильтр)."""
+        fmt, f = "csv", cls()
+        for arg in args:
+            key, sep, value = arg.partition("=")
+            key = key.lower()
+            if not sep and key in ("csv", "xlsx"):
+                fmt = key
+            elif key == "role":
+                f.role = value.lower()
+            elif key == "paid":
+                f.paid = value.lower() in ("1", "yes", "true", "да")
+            elif key == "from":
+                f.date_from = value
+            elif key == "to":
+                f.date_to = value
+            else:
+                raise ValueError(arg)
+        return fmt, f
+
+    def where(self) -> Tuple[str, List[Any]]:
+        cond, params = [], []
+        if self.role:
+            cond.append("LOWER(u.role) = ?")
+            params.append(self.role)
+        if self.paid is not None:
+            cond.append(_PAID if self.paid else f"NOT {_PAID}")
+        if self.date_from:
+            cond.append("u.created_at >= date(?)")
+            params.append(self.date_from)
+        if self.date_to:
+            cond.append("u.created_at < date(?, '+1 day')")
+            params.append(self.date_to)
+        return (" WHERE " + " AND ".join(cond) if cond else ""), params
+
+
+def _rows(f: ExportFilter) -> Iterator[tuple]:
+    where, params = f.where()
+    conn = get_conn()
+    try:
+        cur = conn.execute(_SQL + where + " ORDER BY u.tg_user_id", params)
+        while True:
+            chunk = cur.fetchmany(FETCH_SIZE)
+            if not chunk:
+                break
+            for row in chunk:
+                yield tuple(row)
+    finally:
+        conn.close()
+
+
+def write_csv(path: str, f: ExportFilter) -> int:
+    n = 0
+    # utf-8-sig — чтобы Excel сразу открывал кириллицу
+    with open(path, "w", newline="", encoding="utf-8-sig") as fh:
+        w = csv.writer(fh)
+        w.writerow(COLUMNS)
+        for row in _rows(f):
+            w.writerow(row)
+            n += 1
+    return n
+
+
+def write_xlsx(path: str, f: ExportFilter) -> int:
+    from openpyxl import Workbook   # только для XLSX-выгрузки
+
+    wb = Workbook(write_only=True)   # write_only: строки не держатся в памяти
+    ws = wb.create_sheet("users")
+    ws.append(COLUMNS)
+    n = 0
+    for row in _rows(f):
+        ws.append(row)
+        n += 1
+    wb.save(path)
+    return n
+
+
+def export_users(path: str, fmt: str, f: ExportFilter) -> int:
+    return write_xlsx(path, f) if fmt == "xlsx" else write_csv(path, f)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import html
+import multiprocessing
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from typing import Optional
+
+from bot.db.events import EventKind
+
+# Отчёт считается в отдельном процессе: pandas/numpy импортируются только там,
+# а сам расчёт не занимает event loop бота.
+
+# (шаг, подпись, предыдущий шаг) — после выбора роли воронка ветвится:
+# «Новичок» идёт в фритрайл, «Старичку» админ назначает цену.
+STEPS = (
+    (EventKind.START, "/start", None),
+    (EventKind.INTRO_DONE, "Ознакомился", EventKind.START),
+    (EventKind.WANT_JOIN, "Хочу к вам", EventKind.INTRO_DONE),
+    (EventKind.ROLE, "Выбрал роль", EventKind.WANT_JOIN),
+    (EventKind.TRIAL_START, "Фритрайл", EventKind.ROLE),
+    (EventKind.PRICE_SET, "Назначена цена", EventKind.ROLE),
+    (EventKind.PAID, "Оплата", EventKind.ROLE),
+)
+RETENTION_WEEKS = 6
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def compute_funnel(db_path: str, days: int) -> str:
+    """Воронка и недельное удержание для пользователей, сделавших /start за ``days`` дней."""
+    import numpy as np
+    import pandas as pd
+
+    since = int(time.time()) - days * 86400
+    with closing(sqlite3.connect(db_path)) as conn:
+        ev = pd.read_sql_query(
+            "SELECT ts, user_id, kind FROM events WHERE ts >= ?", conn, params=(since,)
+        )
+    if ev.empty:
+        return f"Событий за {days} дн. нет."
+
+    # Первое появление каждого шага у каждого пользователя: user_id x kind -> ts
+    first = ev.groupby(["user_id", "kind"])["ts"].min().unstack()
+    if EventKind.START not in first.columns:
+        return f"За {days} дн. не было ни одного /start."
+    first = first[first[EventKind.START].notna()]
+    start_ts = first[EventKind.START].to_numpy()
+    cohort = len(first)
+
+    lines = [
+        f"Воронка за {days} дн. (когорта /start: {cohort})",
+        "",
+        f"{'шаг':<15} {'польз.':>6}  {'от /start':>9}  {'от пред.':>8}",
+    ]
+    reached = {}
+    for kind, title, parent in STEPS:
+        n = int(np.count_nonzero(first[kind].to_numpy() >= start_ts)) if kind in first.columns else 0
+        reached[kind] = n
+        prev = reached[parent] if parent is not None else cohort
+        of_start = n / cohort * 100 if cohort else 0.0
+        of_prev = n / prev * 100 if prev else 0.0
+        lines.append(f"{title:<15} {n:>6}  {of_start:8.1f}%  {of_prev:7.1f}%")
+
+    # Удержание: доля когорты недели /start, у которой были события через k недель.
+    starts = pd.Series(start_ts, index=first.index, name="start")
+    ev = ev.join(starts, on="user_id", how="inner")
+    ev = ev[ev["ts"] >= ev["start"]].assign(week=lambda d: ((d["ts"] - d["start"]) // (7 * 86400)).astype(int))
+    ev = ev[ev["week"] < RETENTION_WEEKS].assign(
+        cohort=lambda d: pd.to_datetime(d["start"], unit="s").dt.to_period("W").dt.start_time
+    )
+
+    active = ev.groupby(["cohort", "week"])["user_id"].nunique().unstack(fill_value=0)
+    sizes = active[0]   # на неделе 0 у каждого есть сам /start
+    share = active.div(sizes, axis=0).reindex(columns=range(RETENTION_WEEKS), fill_value=0.0) * 100
+
+    lines += ["", "Удержание по неделям (% когорты)", "неделя   n   " + " ".join(f"w{k:<4}" for k in range(RETENTION_WEEKS))]
+    for week_start, row in share.sort_index().iterrows():
+        cells = " ".join(f"{v:5.0f}" for v in row.to_numpy())
+        lines.append(f"{week_start:%d.%m} {int(sizes[week_start]):>5}  {cells}")
+
+    return "\n".join(lines)
+
+
+async def funnel_report(db_path: str, days: int) -> str:
+    global _pool
+    if _pool is None:
+        # spawn: дочерний процесс не наследует потоки и event loop бота
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    text = await asyncio.get_running_loop().run_in_executor(_pool, compute_funnel, db_path, days)
+    return f"<pre>{html.escape(text)}</pre>"
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
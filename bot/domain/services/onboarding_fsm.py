@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from bot.constants import Role
+from bot.db.subscriptions import ensure_db, get_conn
+
+# Переходы ролей при онбординге (событие -> новая роль):
+#
+#   choose_new:  * -> NEW_PENDING        (если нет активной оплаты)
+#   choose_old:  * -> OLD_PENDING        (если нет активной оплаты)
+#   submit_nick: OLD_PENDING -> OLD_PENDING (+ inst_nick), из других ролей — отказ
+#   activate:    NEW_PENDING/NEW -> NEW, остальные -> OLD   (оплата/активация админом)
+#
+# У оплативших пользователей роль выбором кнопок не меняется.
+# Каждый переход — одна SQL-команда, которая сразу возвращает то, что нужно хендлеру.
+
+_PAID_SQL = """
+    EXISTS (
+        SELECT 1 FROM subscriptions s
+         WHERE s.tg_user_id = :uid
+           AND UPPER(COALESCE(s.status,'NONE')) = 'ACTIVE'
+           AND (s.paid_until IS NULL OR s.paid_until >= datetime('now'))
+    )
+"""
+
+_CHOOSE_SQL = f"""
+    INSERT INTO users (tg_user_id, username, role, created_at, updated_at, last_seen)
+    VALUES (:uid, :username, :role, datetime('now'), datetime('now'), datetime('now'))
+    ON CONFLICT(tg_user_id) DO UPDATE SET
+      username   = COALESCE(excluded.username, users.username),
+      last_seen  = datetime('now'),
+      updated_at = datetime('now'),
+      role       = CASE WHEN {_PAID_SQL}
+                        THEN LOWER(COALESCE(users.role, excluded.role))
+                        ELSE excluded.role END
+    RETURNING role, {_PAID_SQL} AS is_paid
+"""
+
+_ACTIVATE_SQL = """
+    UPDATE users
+       SET role = CASE WHEN LOWER(COALESCE(role,'')) IN ('new', 'new_pending') THEN 'new' ELSE 'old' END,
+           updated_at = datetime('now')
+     WHERE tg_user_id = ?
+"""
+
+
+@dataclass(slots=True)
+class RoleState:
+    role: Optional[Role]
+    is_paid: bool
+
+
+def _to_role(value: Optional[str]) -> Optional[Role]:
+    try:
+        return Role(str(value).lower()) if value else None
+    except ValueError:
+        return None
+
+
+def choose_role(tg_user_id: int, username: Optional[str], *, new: bool) -> RoleState:
+    """Выбор «Новичок»/«Старичок»: upsert пользователя + роль + признак оплаты за один запрос."""
+    ensure_db()
+    role = Role.NEW_PENDING if new else Role.OLD_PENDING
+    conn = get_conn()
+    try:
+        with conn:
+            row = conn.execute(
+                _CHOOSE_SQL, {"uid": tg_user_id, "username": username, "role": role.value}
+            ).fetchone()
+        return RoleState(role=_to_role(row["role"]), is_paid=bool(row["is_paid"]))
+    finally:
+        conn.close()
+
+
+def submit_nick(tg_user_id: int, nick: str) -> bool:
+    """Сохраняет ник Instagram, если пользователь ждёт модерации как «Старичок»."""
+    ensure_db()
+    conn = get_conn()
+    try:
+        with conn:
+            cur = conn.execute(
+                """
+                UPDATE users
+                   SET inst_nick = ?, updated_at = datetime('now')
+                 WHERE tg_user_id = ? AND role = ?
+                """,
+                (nick, tg_user_id, Role.OLD_PENDING.value),
+            )
+        return cur.rowcount == 1
+    finally:
+        conn.close()
+
+
+def activate(conn: sqlite3.Connection, tg_user_id: int) -> None:
+    """Переход после оплаты; выполняется в транзакции вызывающего кода."""
+    conn.execute(_ACTIVATE_SQL, (tg_user_id,))
+
+
+def activate_many(conn: sqlite3.Connection, tg_user_ids: Iterable[int]) -> None:
+    """То же для пачки пользователей (массовые действия админа)."""
+    conn.executemany(_ACTIVATE_SQL, ((uid,) for uid in tg_user_ids))
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Any, Dict, Optional
+
 from telegram import Bot
 
 from bot.constants import YELLOW_FILE_ID, VIDEO_FILE_ID
@@ -17,8 +19,10 @@ INSTRUCTION_TEXT: str = (
 )
 
 
-async def send_instruction_package(bot: Bot, user_id: int) -> None:
+async def send_instruction_package(
+    bot: Bot, user_id: int, rate_limit_args: Optional[Dict[str, Any]] = None
+) -> None:
 
-    await bot.send_photo(chat_id=user_id, photo=YELLOW_FILE_ID)
-    await bot.send_message(chat_id=user_id, text=INSTRUCTION_TEXT, reply_markup=MENU_KB)
-    await bot.send_video(chat_id=user_id, video=VIDEO_FILE_ID)
+    await bot.send_photo(chat_id=user_id, photo=YELLOW_FILE_ID, rate_limit_args=rate_limit_args)
+    await bot.send_message(chat_id=user_id, text=INSTRUCTION_TEXT, reply_markup=MENU_KB, rate_limit_args=rate_limit_args)
+    await bot.send_video(chat_id=user_id, video=VIDEO_FILE_ID, rate_limit_args=rate_limit_args)
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden
+
+from bot.db import outbox as store
+from bot.latency import StageLatency
+from bot.integration.telegram.outbound import TRANSACTIONAL, TRANSACTIONAL_ARGS
+
+logger = logging.getLogger(__name__)
+
+Effect = Callable[[Bot, Optional[int], Dict[str, Any]], Awaitable[None]]
+
+
+class OutboxWorker:
+    """Выполняет побочные эффекты из таблицы outbox.
+
+    Раз в ``interval`` секунд (или сразу после ``wake()``) берёт до ``batch``
+    готовых строк и выполняет их параллельно, не больше ``concurrency``
+    одновременно. Ошибка — повтор через ``base_delay * 2**attempts`` секунд
+    (но не больше ``max_delay``), после ``max_attempts`` попыток строка
+    становится DEAD. Forbidden/BadRequest (бот заблокирован, чата нет)
+    не повторяются. Выполненные строки старше ``keep_days`` дней удаляются
+    раз в час.
+
+    Воркер забирает только виды, для которых зарегистрирован эффект, поэтому
+    воркеры бота и backend могут работать с одной таблицей одновременно.
+    В ``stats()`` — время ожидания в очереди и выполнения по видам эффектов.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 5.0,
+        batch: int = 50,
+        concurrency: int = 5,
+        max_attempts: int = 6,
+        base_delay: int = 30,
+        max_delay: int = 3600,
+        keep_days: int = 14,
+    ):
+        self.interval = interval
+        self.batch = batch
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.keep_days = keep_days
+        self._effects: Dict[str, Effect] = {}
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.latency = StageLatency()
+        self.done = 0
+        self.failed = 0
+        self.dead = 0
+
+    def register(self, kind: str, effect: Effect) -> None:
+        self._effects[kind] = effect
+
+    def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._bot = bot
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop(), name="outbox")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Есть новые строки — не ждать следующего опроса."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        purge_at = loop.time()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while await self.run_once() == self.batch:
+                    pass
+                if loop.time() >= purge_at:
+                    purge_at = loop.time() + 3600
+                    await asyncio.to_thread(store.purge_done, self.keep_days)
+            except sqlite3.Error as e:
+                logger.error("outbox: %s", e)
+
+    async def run_once(self) -> int:
+        rows = await asyncio.to_thread(store.claim_due, self.batch, tuple(self._effects))
+        if not rows:
+            return 0
+        sem = asyncio.Semaphore(self.concurrency)
+        done: List[int] = []
+        failed: List[Tuple[int, str, int, bool]] = []
+
+        async def one(row: store.OutboxRow) -> None:
+            oid, kind, user_id, payload, attempts, created_at = row
+            effect = self._effects.get(kind)
+            async with sem:
+                if not attempts:
+                    self.latency.observe("queue_wait", max(0.0, time.time() - created_at))
+                started = time.perf_counter()
+                try:
+                    if effect is None:
+                        raise LookupError(f"no effect for kind {kind!r}")
+                    await effect(self._bot, user_id, payload)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    final = isinstance(e, (Forbidden, BadRequest, LookupError))
+                    delay = min(self.base_delay * 2 ** attempts, self.max_delay)
+                    logger.warning("outbox: %s #%d for %s failed (attempt %d): %s", kind, oid, user_id, attempts + 1, e)
+                    failed.append((oid, f"{type(e).__name__}: {e}", delay, final))
+                    return
+                finally:
+                    self.latency.observe(kind, time.perf_counter() - started)
+            done.append(oid)
+
+        try:
+            await asyncio.gather(*(one(r) for r in rows))
+        finally:
+            # и при отмене (остановка бота): уже выполненное не повторится
+            dead = await asyncio.shield(asyncio.to_thread(store.settle, done, failed, self.max_attempts))
+            self.done += len(done)
+            self.failed += len(failed)
+            self.dead += dead
+        return len(rows)
+
+    def stats(self) -> Dict[str, float]:
+        return {"done": self.done, "failed": self.failed, "dead": self.dead, **self.latency.stats()}
+
+
+async def _send_instructions(bot: Bot, user_id: Optional[int], payload: Dict[str, Any]) -> None:
+    from bot.domain.services.onboarding_service import send_instruction_package
+
+    await send_instruction_package(bot, user_id, rate_limit_args=TRANSACTIONAL_ARGS)
+
+
+async def _send_notice(bot: Bot, user_id: Optional[int], payload: Dict[str, Any]) -> None:
+    await bot.send_message(
+        user_id, payload["text"], parse_mode=payload.get("parse_mode"),
+        rate_limit_args={"lane": payload.get("lane", TRANSACTIONAL)},
+    )
+    # Следующий шаг ставится только после отправки: строки одного пакета
+    # выполняются параллельно, а так он не обгонит это сообщение.
+    if payload.get("then"):
+        await asyncio.to_thread(store.push, payload["then"], user_id)
+        outbox.wake()
+
+
+outbox = OutboxWorker(interval=float(os.getenv("OUTBOX_POLL_SECONDS", "5")))
+outbox.register(store.INSTRUCTIONS, _send_instructions)
+outbox.register(store.NOTICE, _send_notice)
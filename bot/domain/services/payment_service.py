@@ -1,14 +1,42 @@
+import asyncio
+import os
 from datetime import date, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 from bot.integration.lava.client import create_invoice
 from bot.db.repository.subscription_repo import SubscriptionRepo
+from bot.db.revenue import SOURCE_LAVA, record_payment
+
+
+# Сколько живёт неоплаченный счёт Lava, который можно отдать повторно.
+INVOICE_TTL_SECONDS = int(os.getenv("LAVA_INVOICE_TTL_SECONDS", "1800"))
+
+_InvoiceKey = Tuple[int, str, str, Optional[str]]
+
+
+class _KeySlot:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
 
 
 class PaymentService:
+    """Счета Lava и подтверждение оплаты.
+
+    Неоплаченный счёт на тот же (пользователь, тариф, валюта, периодичность)
+    моложе ``invoice_ttl`` отдаётся повторно — из строки 'pending' в
+    subscriptions, без запроса к Lava. Одновременные нажатия «оплатить» одного
+    пользователя ждут первый запрос, а не создают каждый свой счёт.
+    """
 
-    def __init__(self, repo: SubscriptionRepo):
+    def __init__(self, repo: SubscriptionRepo, *, invoice_ttl: int = INVOICE_TTL_SECONDS):
         self.repo = repo
+        self.invoice_ttl = invoice_ttl
+        self._slots: Dict[_InvoiceKey, _KeySlot] = {}
+        self.invoices_created = 0
+        self.invoices_reused = 0
 
     async def start_subscription(
         self,
@@ -19,6 +47,33 @@ class PaymentService:
         payment_method: Optional[str] = None,
         periodicity: Optional[str] = None,
     ) -> str:
+        key = (user_id, offer_id, currency, periodicity)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _KeySlot()
+        slot.users += 1
+        try:
+            async with slot.lock:
+                return await self._invoice(key, email, payment_method)
+        finally:
+            slot.users -= 1
+            if not slot.users:
+                del self._slots[key]
+
+    async def _invoice(self, key: _InvoiceKey, email: str, payment_method: Optional[str]) -> str:
+        user_id, offer_id, currency, periodicity = key
+        if self.invoice_ttl > 0:
+            payment_url = await self.repo.find_pending(
+                user_id=user_id,
+                offer_id=offer_id,
+                currency=currency,
+                periodicity=periodicity,
+                max_age_seconds=self.invoice_ttl,
+            )
+            if payment_url:
+                self.invoices_reused += 1
+                return payment_url
+
         payment_url = await create_invoice(
             email=email,
             offer_id=offer_id,
@@ -26,16 +81,24 @@ class PaymentService:
             payment_method=payment_method,
             periodicity=periodicity,
         )
+        self.invoices_created += 1
 
         await self.repo.create_pending(
             user_id=user_id,
             email=email,
             payment_url=payment_url,
             periodicity=periodicity,
+            offer_id=offer_id,
+            currency=currency,
         )
         return payment_url
 
-    async def confirm_payment(self, payload: dict) -> int:
+    async def confirm_payment(self, payload: dict, *, event_key: Optional[str] = None) -> int:
+        """Активирует подписку и записывает платёж.
+
+        ``event_key`` — ext_id платежа, если в теле нет contractId/id: тогда
+        повтор обработки того же события не запишет платёж второй раз.
+        """
         user_id = int(payload["metadata"]["tg_id"])
         started_at = date.today()
         expired_at: Optional[date] = None
@@ -50,4 +113,25 @@ class PaymentService:
             started_at=started_at,
             expired_at=expired_at,
         )
+        # Платёж — в payments: оттуда триггер обновляет revenue_daily и /stats.
+        await asyncio.to_thread(record_payment, user_id, **self.revenue_fields(payload, ext_id=event_key))
         return user_id
+
+    def stats(self) -> Dict[str, int]:
+        return {"invoices_created": self.invoices_created, "invoices_reused": self.invoices_reused}
+
+    @staticmethod
+    def revenue_fields(payload: dict, *, ext_id: Optional[str] = None) -> dict:
+        product = payload.get("product") or {}
+        try:
+            amount = int(round(float(payload.get("amount") or 0)))
+        except (TypeError, ValueError):
+            amount = 0
+        return {
+            "amount": amount,
+            "source": SOURCE_LAVA,
+            "offer_id": payload.get("offerId") or product.get("id"),
+            "periodicity": payload.get("periodicity"),
+            "currency": payload.get("currency") or "RUB",
+            "ext_id": payload.get("contractId") or payload.get("id") or ext_id,
+        }
@@ -2,13 +2,18 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from typing import List, Optional
+import os
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 from telegram import Bot
 from telegram.constants import ParseMode
-from telegram.error import TelegramError
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
 
 from bot.db.connection import get_conn
+from bot.integration.telegram.outbound import BULK_ARGS
+from bot.lifecycle import shutdown
 from bot.db.reels import (
     pick_next_reel_id_for_user,
     get_reel,
@@ -16,10 +21,88 @@ from bot.db.reels import (
     ensure_reels_schema,
     reset_user_reel_progress,
     any_active_reels,
+    flush_reel_stats,
 )
+from bot.domain.services.admin_notify import REELS, admin_notifier
 
 logger = logging.getLogger(__name__)
 
+# Сколько ошибок подряд по вине рилса (нет видео, битый file_id) — и он выключается.
+REEL_FAIL_THRESHOLD = int(os.getenv("REEL_FAIL_THRESHOLD", "3"))
+# Как часто (в пользователях) сбрасывать статистику в БД во время рассылки.
+REEL_STATS_FLUSH_EVERY = 200
+# Сколько рилсов пробовать одному пользователю, если рилс оказался битым.
+REEL_ATTEMPTS_PER_USER = 3
+
+# Классы ошибок, которые говорят о проблеме самого рилса, а не получателя.
+_REEL_FAULTS = frozenset({"no_video", "bad_file"})
+
+
+def _error_class(e: TelegramError) -> str:
+    if isinstance(e, Forbidden):
+        return "forbidden"
+    if isinstance(e, RetryAfter):
+        return "retry_after"
+    if isinstance(e, BadRequest):
+        msg = str(e).lower()
+        if "file" in msg or "http url" in msg or "web page content" in msg:
+            return "bad_file"
+        if "chat not found" in msg:
+            return "chat_not_found"
+        return "bad_request"
+    if isinstance(e, NetworkError):
+        return "network"
+    return "other"
+
+
+@dataclass
+class ReelTally:
+    """Итоги доставок в памяти; в БД уходят одной транзакцией (flush)."""
+    sends: Counter = field(default_factory=Counter)
+    failures: Dict[int, Counter] = field(default_factory=lambda: defaultdict(Counter))
+    streak: Counter = field(default_factory=Counter)      # ошибки по вине рилса после последнего успеха
+    succeeded: set = field(default_factory=set)
+    last_error: Dict[int, str] = field(default_factory=dict)
+
+    def sent(self, reel_id: int) -> None:
+        self.sends[reel_id] += 1
+        self.streak[reel_id] = 0
+        self.succeeded.add(reel_id)
+
+    def failed(self, reel_id: int, error_class: str, error: str) -> bool:
+        """True — ошибка по вине рилса (пользователю стоит предложить другой)."""
+        self.failures[reel_id][error_class] += 1
+        self.last_error[reel_id] = f"{error_class}: {error}"[:300]
+        if error_class in _REEL_FAULTS:
+            self.streak[reel_id] += 1
+            return True
+        return False
+
+    def __bool__(self) -> bool:
+        return bool(self.sends or self.failures)
+
+    async def flush(self) -> List[int]:
+        if not self:
+            return []
+        reel_ids = set(self.sends) | set(self.failures)
+        stats = [
+            (
+                rid, self.sends[rid], sum(self.failures[rid].values()) if rid in self.failures else 0,
+                self.streak[rid], rid in self.succeeded, self.last_error.get(rid),
+            )
+            for rid in reel_ids
+        ]
+        failures = [(rid, cls, n) for rid, by_cls in self.failures.items() for cls, n in by_cls.items()]
+        for part in (self.sends, self.failures, self.streak, self.succeeded, self.last_error):
+            part.clear()
+        off = await asyncio.to_thread(flush_reel_stats, stats, failures, REEL_FAIL_THRESHOLD)
+        for rid in off:
+            logger.warning("reels: reel %s deactivated after %d consecutive failures", rid, REEL_FAIL_THRESHOLD)
+            admin_notifier.notify(
+                REELS, f"Рилс ID <code>{rid}</code> выключен: {REEL_FAIL_THRESHOLD} ошибки доставки подряд (см. /reel_stats)"
+            )
+        return off
+
 
 def get_eligible_users() -> List[int]:
     ensure_reels_schema()
@@ -48,21 +131,47 @@ def get_eligible_users() -> List[int]:
         conn.close()
 
 
-async def deliver_reel_to_user(bot: Bot, tg_user_id: int) -> bool:
+async def deliver_reel_to_user(bot: Bot, tg_user_id: int, tally: Optional[ReelTally] = None) -> bool:
+    """Один рилс пользователю. Без ``tally`` статистика пишется сразу после доставки."""
+    if tally is None:
+        tally = ReelTally()
+        try:
+            return await deliver_reel_to_user(bot, tg_user_id, tally)
+        finally:
+            await asyncio.shield(tally.flush())
+
+    # Битый рилс (нет видео, file_id не принимается) — статистика сразу в БД,
+    # чтобы он выключился по REEL_FAIL_THRESHOLD, не дожидаясь конца пачки,
+    # а пользователь получает следующий рилс вместо пустого дня.
+    tried: List[int] = []
+    for _ in range(REEL_ATTEMPTS_PER_USER):
+        reel_id = _pick_reel(tg_user_id, tried)
+        if not reel_id:
+            return False
+        ok = await _send_reel(bot, tg_user_id, reel_id, tally)
+        if ok is not None:
+            return ok
+        tried.append(reel_id)
+        await tally.flush()
+    return False
+
 
+def _pick_reel(tg_user_id: int, tried: List[int]) -> Optional[int]:
     # 1) Пытаемся взять следующий «неполученный» активный рилс
-    reel_id = pick_next_reel_id_for_user(tg_user_id)
+    reel_id = pick_next_reel_id_for_user(tg_user_id, tried)
 
     # 2) Если нечего слать — сбрасываем прогресс по активным и пробуем ещё раз
-    if not reel_id:
+    if not reel_id and not tried:
         deleted = reset_user_reel_progress(tg_user_id)
         logger.info("reels: reset progress for user=%s, deleted=%s", tg_user_id, deleted)
         reel_id = pick_next_reel_id_for_user(tg_user_id)
-        if not reel_id:
-            if not any_active_reels():
-                logger.info("reels: no active reels at all; user=%s", tg_user_id)
-            return False
+        if not reel_id and not any_active_reels():
+            logger.info("reels: no active reels at all; user=%s", tg_user_id)
+    return reel_id
+
 
+async def _send_reel(bot: Bot, tg_user_id: int, reel_id: int, tally: ReelTally) -> Optional[bool]:
+    """True — доставлен, False — не доставлен, None — рилс битый, стоит взять другой."""
     data = get_reel(reel_id)
     if not data:
         logger.warning("reel %s not found while delivering to %s", reel_id, tg_user_id)
@@ -75,7 +184,8 @@ async def deliver_reel_to_user(bot: Bot, tg_user_id: int) -> bool:
 
     if not video or not video.get("tg_file_id"):
         logger.warning("reel %s has no video asset; skip", reel_id)
-        return False
+        tally.failed(reel_id, "no_video", "video asset is missing")
+        return None
 
     preview_msg_id = None
     video_msg_id = None
@@ -88,6 +198,7 @@ async def deliver_reel_to_user(bot: Bot, tg_user_id: int) -> bool:
                 chat_id=tg_user_id,
                 photo=preview["tg_file_id"],
                 disable_notification=True,
+                rate_limit_args=BULK_ARGS,
             )
             preview_msg_id = sent_preview.message_id
 
@@ -96,6 +207,7 @@ async def deliver_reel_to_user(bot: Bot, tg_user_id: int) -> bool:
             chat_id=tg_user_id,
             video=video["tg_file_id"],
             disable_notification=True,
+            rate_limit_args=BULK_ARGS,
         )
         video_msg_id = sent_video.message_id
 
@@ -107,16 +219,27 @@ async def deliver_reel_to_user(bot: Bot, tg_user_id: int) -> bool:
                 parse_mode=ParseMode.HTML,
                 disable_web_page_preview=True,
                 disable_notification=True,
+                rate_limit_args=BULK_ARGS,
             )
             caption_msg_id = sent_text.message_id
 
         # Зафиксируем доставку
         mark_reel_delivered(tg_user_id, reel_id, video_msg_id, caption_msg_id)
+        tally.sent(reel_id)
         return True
 
     except TelegramError as e:
-        logger.error("deliver reel to %s failed: %s", tg_user_id, e)
-        return False
+        logger.error("deliver reel %s to %s failed: %s", reel_id, tg_user_id, e)
+        return None if tally.failed(reel_id, _error_class(e), str(e)) else False
+
+    except asyncio.CancelledError:
+        # Остановка посреди доставки: если видео уже ушло, рилс считается
+        # доставленным, иначе пользователь получит его повторно.
+        if video_msg_id:
+            mark_reel_delivered(tg_user_id, reel_id, video_msg_id, caption_msg_id)
+            tally.sent(reel_id)
+            logger.warning("reels: delivery to %s interrupted after video; checkpointed", tg_user_id)
+        raise
 
 
 
@@ -127,13 +250,28 @@ async def deliver_reels_daily(bot: Bot) -> None:
         return
 
     sent = 0
-    for uid in users:
-        try:
-            ok = await deliver_reel_to_user(bot, uid)
-            if ok:
-                sent += 1
-        except Exception as e:
-            logger.exception("reels daily: user %s: %s", uid, e)
-        await asyncio.sleep(0.05)  # лёгкая рассинхронизация
-
-    logger.info("reels daily: processed users=%s, sent=%s", len(users), sent)
+    processed = 0
+    tally = ReelTally()
+    try:
+        for uid in users:
+            if not shutdown.accepting:
+                break
+            try:
+                ok = await shutdown.track(deliver_reel_to_user(bot, uid, tally), f"reel:{uid}")
+                if ok:
+                    sent += 1
+            except asyncio.CancelledError:
+                if shutdown.accepting:
+                    raise
+                processed += 1      # начата, но прервана — учтена в drain как abandoned
+                break
+            except Exception as e:
+                logger.exception("reels daily: user %s: %s", uid, e)
+            processed += 1
+            if processed % REEL_STATS_FLUSH_EVERY == 0:
+                await tally.flush()
+    finally:
+        await asyncio.shield(tally.flush())
+
+    shutdown.skipped("reels_daily", len(users) - processed)
+    logger.info("reels daily: processed users=%s/%s, sent=%s", processed, len(users), sent)
@@ -1,3 +1,6 @@
+from typing import Optional
+
+from bot.db import referrals
 from bot.db.repository.user_repo import UserRepository
 
 class ReferralService:
@@ -5,5 +8,11 @@ class ReferralService:
         self.repo = repo
 
     def top(self, n: int = 5) -> list[tuple[int, int]]:
-        data = self.repo.referral_counts()
-        return sorted(data.items(), key=lambda x: x[1], reverse=True)[:n]
+        return self.repo.top_referrers(n)
+
+    def top_downline(self, n: int = 10) -> list[tuple[int, int]]:
+        """Лидеры по размеру всей структуры (все уровни)."""
+        return referrals.top_downline(n)
+
+    def tree(self, tg_id: int) -> Optional[referrals.TreeSummary]:
+        return referrals.tree_summary(tg_id)
@@ -6,8 +6,8 @@ class UserService:
     def __init__(self, repo: UserRepository):
         self.repo = repo
 
-    def register(self, tg_id: int, ref_code: Optional[str] = None) -> None:
-        self.repo.upsert(tg_id, ref_code)
+    def register(self, tg_id: int, ref_code: Optional[str] = None, username: Optional[str] = None) -> None:
+        self.repo.upsert(tg_id, ref_code, username)
 
     def set_role(self, tg_id: int, role: Role) -> None:
         self.repo.update_role(tg_id, role)
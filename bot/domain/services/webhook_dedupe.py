@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from typing import Dict
+
+from bot.db.repository.webhook_event_repo import WebhookEventRepo
+
+
+def lava_event_key(payload: dict, body: bytes) -> str:
+    """Ключ события Lava: тип + id контракта; без них — хэш тела (повтор приходит тем же телом)."""
+    ref = payload.get("contractId") or payload.get("id")
+    if ref:
+        return f"{payload.get('eventType') or payload.get('status') or 'event'}:{ref}"
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+class WebhookDedupe:
+    """Отсев повторных вебхуков: LRU в памяти перед таблицей webhook_events.
+
+    Повтор уже обработанного события отсекается по LRU без обращения к БД;
+    после рестарта или вытеснения из LRU — по таблице. ``begin()`` атомарно
+    забирает событие в обработку, поэтому два одновременных повтора не
+    обработаются оба.
+    """
+
+    def __init__(self, repo: WebhookEventRepo, *, provider: str = "lava", max_keys: int = 10_000):
+        self.repo = repo
+        self.provider = provider
+        self.max_keys = max_keys
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self.accepted = 0
+        self.duplicates_mem = 0
+        self.duplicates_db = 0
+        self.released = 0
+
+    async def begin(self, key: str) -> bool:
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            self.duplicates_mem += 1
+            return False
+        existing = await self.repo.claim(key, self.provider)
+        if existing is not None:
+            if existing == "done":   # «processing» не запоминаем: если та обработка упадёт, повтор должен пройти
+                self._remember(key)
+            self.duplicates_db += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def done(self, key: str) -> None:
+        await self.repo.complete(key)
+        self._remember(key)
+
+    async def failed(self, key: str) -> None:
+        await self.repo.release(key)
+        self.released += 1
+
+    def _remember(self, key: str) -> None:
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "accepted": self.accepted,
+            "duplicates_mem": self.duplicates_mem,
+            "duplicates_db": self.duplicates_db,
+            "released": self.released,
+            "lru_size": len(self._seen),
+        }
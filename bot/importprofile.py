@@ -0,0 +1,79 @@
+"""Профиль времени импорта точки входа бота.
+
+    python -m bot.importprofile                    # топ модулей; exit 1, если дольше бюджета (400 мс)
+    python -m bot.importprofile --budget-ms 600    # другой бюджет (или IMPORT_BUDGET_MS); 0 — без проверки
+
+Импорт запускается в отдельном интерпретаторе с ``-X importtime``, поэтому
+замер не искажается уже загруженными модулями текущего процесса.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List
+
+DEFAULT_BUDGET_MS = 400
+
+# import time: self [us] | cumulative | imported package
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+@dataclass(slots=True)
+class ModuleTime:
+    name: str
+    self_ms: float
+    cumulative_ms: float
+    depth: int
+
+
+def profile(target: str = "bot.main") -> List[ModuleTime]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        tail = "\n".join(proc.stderr.splitlines()[-10:])
+        raise RuntimeError(f"import {target} failed:\n{tail}")
+
+    result = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            result.append(ModuleTime(name, int(self_us) / 1000, int(cum_us) / 1000, (len(indent) - 1) // 2))
+    return result
+
+
+def total_ms(modules: List[ModuleTime]) -> float:
+    # Время импорта — сумма cumulative по модулям верхнего уровня.
+    return sum(m.cumulative_ms for m in modules if m.depth == 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser("bot.importprofile")
+    parser.add_argument("--target", default="bot.main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    args = parser.parse_args()
+
+    modules = profile(args.target)
+    total = total_ms(modules)
+
+    print(f"{'self ms':>9} {'cum ms':>9}  module")
+    for m in sorted(modules, key=lambda m: m.cumulative_ms, reverse=True)[: args.top]:
+        print(f"{m.self_ms:9.1f} {m.cumulative_ms:9.1f}  {'  ' * m.depth}{m.name}")
+    print(f"\nimport {args.target}: {total:.1f} ms, {len(modules)} modules")
+
+    if args.budget_ms > 0 and total > args.budget_ms:
+        print(f"BUDGET EXCEEDED: {total:.1f} ms > {args.budget_ms:.0f} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
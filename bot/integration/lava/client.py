@@ -1,20 +1,17 @@
 from __future__ import annotations
-from dotenv import load_dotenv, find_dotenv
-load_dotenv(find_dotenv())
+import asyncio
+import importlib.util
 import os
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 
 import httpx
 from pydantic import BaseModel, EmailStr, Field, ValidationError, model_validator
 
 # ── Константы / конфиг ──────────────────────────────────────────────────────────
 LAVA_API_BASE = os.getenv("LAVA_API_BASE", "https://gate.lava.top").rstrip("/")
-API_KEY       = os.getenv("LAVA_SHOP_API_KEY", "")
 DEFAULT_LANG  = os.getenv("LAVA_LANG", "RU")
 DEFAULT_UTM   = {"utm_source": "telegram_bot"}
-
-if not API_KEY:
-    raise RuntimeError("LAVA_SHOP_API_KEY is not задан в .env")
+_HTTP2        = importlib.util.find_spec("h2") is not None   # httpx[http2]
 
 # ── Типы данных ─────────────────────────────────────────────────────────────────
 Currency      = Literal["RUB", "USD", "EUR"]
@@ -44,48 +41,153 @@ class InvoiceRequest(BaseModel):
         return values
 
 # ── Клиент ──────────────────────────────────────────────────────────────────────
-_headers = {
-    "X-Api-Key":   API_KEY,
-    "Content-Type": "application/json",
-    "Accept":       "application/json",
-}
-
-async def create_invoice(
-    *,
-    email: str,
-    offer_id: str,
-    currency: Currency = "RUB",
-    payment_method: Optional[PaymentMethod] = None,
-    buyer_language: str = DEFAULT_LANG,
-    periodicity: Optional[str] = None,
-    client_utm: Optional[dict[str, str]] = None,
-) -> str:
-    if payment_method is None:
-        payment_method = "BANK131" if currency == "RUB" else "UNLIMINT"
-
-    req = InvoiceRequest(
-        email=email,
-        offerId=offer_id,
-        currency=currency,
-        paymentMethod=payment_method,
-        buyerLanguage=buyer_language,
-        clientUTM=client_utm or DEFAULT_UTM,
-        periodicity=periodicity,
-    )
-
-    url = f"{LAVA_API_BASE}/api/v2/invoice"
-    async with httpx.AsyncClient(base_url=LAVA_API_BASE, timeout=10) as cli:
-        r = await cli.post(url, json=req.model_dump(exclude_none=True), headers=_headers)
-        r.raise_for_status()
+def _headers() -> dict[str, str]:
+    # Ключ читается при вызове, а не при импорте: .env к этому моменту уже
+    # загружен точкой входа (bot/__init__.py, backend), а импорт модуля не падает
+    # в окружениях, где Lava не нужна.
+    api_key = os.getenv("LAVA_SHOP_API_KEY", "")
+    if not api_key:
+        raise RuntimeError("LAVA_SHOP_API_KEY is not задан в .env")
+    return {
+        "X-Api-Key":   api_key,
+        "Content-Type": "application/json",
+        "Accept":       "application/json",
+    }
+
+class LavaClient:
+    """Долгоживущий клиент Lava API: один пул соединений на процесс.
+
+    Соединения (и TLS-сессии) переиспользуются между счетами, HTTP/2 — если
+    установлен пакет ``h2``. Запрос повторяется с экспоненциальной паузой
+    (не больше ``retries`` повторов) только если он не ушёл в Lava — ошибка
+    установки соединения или ожидания пула. После 5xx или обрыва ответа счёт
+    мог быть уже создан, и повтор создал бы второй.
+    Открывается и закрывается вместе с приложением (см. backend/app.py);
+    без явного ``open()`` пул создаётся при первом запросе.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LAVA_API_BASE,
+        *,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 10,
+        keepalive: int = 5,
+        retries: int = 2,
+        backoff: float = 0.5,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=keepalive)
+        self.retries = retries
+        self.backoff = backoff
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+
+    async def open(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=_HTTP2 and self._transport is None,
+                transport=self._transport,
+            )
 
+    async def close(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+
+    async def __aenter__(self) -> "LavaClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def _post(self, path: str, payload: dict) -> httpx.Response:
+        if self._client is None:
+            await self.open()
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                r = await self._client.post(path, json=payload, headers=_headers())
+                r.raise_for_status()
+                return r
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+                if attempt >= self.retries:
+                    self.failed += 1
+                    raise
+            except httpx.HTTPError:
+                self.failed += 1
+                raise
+            attempt += 1
+            self.retried += 1
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def create_invoice(
+        self,
+        *,
+        email: str,
+        offer_id: str,
+        currency: Currency = "RUB",
+        payment_method: Optional[PaymentMethod] = None,
+        buyer_language: str = DEFAULT_LANG,
+        periodicity: Optional[str] = None,
+        client_utm: Optional[dict[str, str]] = None,
+    ) -> str:
+        if payment_method is None:
+            payment_method = "BANK131" if currency == "RUB" else "UNLIMINT"
+
+        req = InvoiceRequest(
+            email=email,
+            offerId=offer_id,
+            currency=currency,
+            paymentMethod=payment_method,
+            buyerLanguage=buyer_language,
+            clientUTM=client_utm or DEFAULT_UTM,
+            periodicity=periodicity,
+        )
+
+        r = await self._post("/api/v2/invoice", req.model_dump(exclude_none=True))
         data = r.json()
         payment_url = data.get("paymentUrl") or data.get("payment_url")
         if not payment_url:
             raise RuntimeError("paymentUrl не найден в ответе Lava")
         return payment_url
 
+    def stats(self) -> dict[str, Any]:
+        return {
+            "open": self._client is not None,
+            "http2": _HTTP2,
+            "requests": self.requests,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+lava = LavaClient(
+    timeout=float(os.getenv("LAVA_TIMEOUT", "10")),
+    retries=int(os.getenv("LAVA_RETRIES", "2")),
+)
+
+
+async def create_invoice(**kwargs: Any) -> str:
+    """Совместимая обёртка: счёт через общий клиент ``lava``."""
+    return await lava.create_invoice(**kwargs)
+
+
 if __name__ == "__main__":
-    import asyncio, sys, textwrap, argparse
+    import sys, textwrap, argparse
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv())
 
     parser = argparse.ArgumentParser("Test Lava invoice creation")
     parser.add_argument("--email", required=True)
@@ -93,14 +195,12 @@ if __name__ == "__main__":
     parser.add_argument("--currency", default="RUB")
     args = parser.parse_args()
 
+    async def _one() -> str:
+        async with lava:
+            return await lava.create_invoice(email=args.email, offer_id=args.offer_id, currency=args.currency)
+
     try:
-        url = asyncio.run(
-            create_invoice(
-                email=args.email,
-                offer_id=args.offer_id,
-                currency=args.currency,
-            )
-        )
+        url = asyncio.run(_one())
         print("Payment URL:", url)
     except Exception as e:
         sys.exit(textwrap.fill(f"Ошибка: {e}", 80))
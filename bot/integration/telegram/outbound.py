@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Полосы приоритета: чем меньше число, тем раньше уходит запрос.
+INTERACTIVE = 0     # ответы пользователю на его действия
+TRANSACTIONAL = 1   # подтверждения оплаты, офферы, пакет инструкций
+BULK = 2            # ежедневная рассылка рилсов и прочие массовые отправки
+
+_LANE_NAMES = {INTERACTIVE: "interactive", TRANSACTIONAL: "transactional", BULK: "bulk"}
+
+# Готовые rate_limit_args для вызовов bot.send_*(..., rate_limit_args=...)
+TRANSACTIONAL_ARGS: Dict[str, Any] = {"lane": TRANSACTIONAL}
+BULK_ARGS: Dict[str, Any] = {"lane": BULK}
+
+# Эндпоинты, которые Telegram считает «сообщениями» и ограничивает по частоте.
+_LIMITED_ENDPOINTS = frozenset({
+    "sendMessage", "sendPhoto", "sendVideo", "sendMediaGroup", "sendDocument",
+    "sendAnimation", "sendAudio", "sendVoice", "sendVideoNote", "sendSticker",
+    "sendLocation", "sendContact", "sendPoll", "sendDice", "copyMessage",
+    "forwardMessage", "editMessageText", "editMessageCaption", "editMessageMedia",
+    "editMessageReplyMarkup",
+})
+
+JSONResult = Union[bool, Dict[str, Any], List[Dict[str, Any]]]
+
+
+class OutboundDispatcher(BaseRateLimiter[Dict[str, Any]]):
+    """Единая очередь исходящих сообщений бота с приоритетами.
+
+    Подключается как rate limiter к ExtBot, поэтому через неё проходят все
+    отправки — и ответы хендлеров, и рассылки, и уведомления из backend.
+    Полоса задаётся через ``rate_limit_args={"lane": ...}``, по умолчанию —
+    INTERACTIVE. Общий лимит — ``rate`` сообщений в секунду (token bucket),
+    для групп дополнительно выдерживается ``group_interval`` между сообщениями
+    в один чат. На RetryAfter очередь целиком ставится на паузу и запрос
+    повторяется (не больше ``max_retries`` раз).
+    """
+
+    def __init__(
+        self,
+        *,
+        rate: float = 25.0,
+        burst: int = 25,
+        group_interval: float = 3.0,
+        max_retries: int = 2,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._tokens = float(burst)
+        self._tokens_ts = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_next: Dict[Union[int, str], float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pump_task: Optional[asyncio.Task] = None
+        self.sent: Counter[str] = Counter()
+        self.retries = 0
+
+    async def initialize(self) -> None:
+        if self._pump_task is None:
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump(), name="outbound_pump")
+
+    async def shutdown(self) -> None:
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for _, _, fut in self._heap:
+            if not fut.done():
+                fut.cancel()
+        self._heap.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, JSONResult]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> JSONResult:
+        if endpoint not in _LIMITED_ENDPOINTS or self._pump_task is None:
+            return await callback(*args, **kwargs)
+
+        lane = (rate_limit_args or {}).get("lane", INTERACTIVE)
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(lane)
+            await self._chat_gap(chat_id)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self.retries += 1
+                logger.warning("outbound: RetryAfter %.1fs on %s (lane=%s)", delay, endpoint, _LANE_NAMES.get(lane, lane))
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.sent[_LANE_NAMES.get(lane, str(lane))] += 1
+            return result
+        raise RuntimeError("unreachable")
+
+    async def _acquire(self, lane: int) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (lane, next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+
+    async def _chat_gap(self, chat_id: Union[int, str, None]) -> None:
+        # Для групп Telegram ограничивает ~20 сообщений в минуту на чат.
+        if not isinstance(chat_id, int) or chat_id > 0 or self.group_interval <= 0:
+            return
+        now = time.monotonic()
+        at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = at + self.group_interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    async def _pump(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(float(self.burst), self._tokens + (now - self._tokens_ts) * self.rate)
+            self._tokens_ts = now
+            if self._tokens < 1.0:
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+                continue
+
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.cancelled():
+                continue
+            self._tokens -= 1.0
+            fut.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        queued = Counter(_LANE_NAMES.get(lane, str(lane)) for lane, _, _ in self._heap)
+        return {
+            **{f"queued_{name}": queued.get(name, 0) for name in _LANE_NAMES.values()},
+            **{f"sent_{name}": self.sent.get(name, 0) for name in _LANE_NAMES.values()},
+            "retry_after": self.retries,
+            "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+        }
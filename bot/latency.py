@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+
+class StageLatency:
+    """Задержки по этапам обработки: последние ``window`` замеров на этап.
+
+    ``stats()`` — плоский словарь ``<этап>_n / _p50_ms / _p95_ms / _max_ms``,
+    как у остальных источников /metrics.
+    """
+
+    def __init__(self, *, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._count: Dict[str, int] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._count[stage] = self._count.get(stage, 0) + 1
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for stage, samples in self._samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            out[f"{stage}_n"] = self._count[stage]
+            out[f"{stage}_p50_ms"] = round(ordered[n // 2] * 1000, 2)
+            out[f"{stage}_p95_ms"] = round(ordered[min(n - 1, int(n * 0.95))] * 1000, 2)
+            out[f"{stage}_max_ms"] = round(ordered[-1] * 1000, 2)
+        return out
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Tuple, TypeVar
+
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ShutdownCoordinator:
+    """Аккуратная остановка: новая массовая работа не начинается, текущие
+    доставки по пользователям дорабатывают (или сохраняют прогресс) до дедлайна,
+    затем сбрасываются буферы.
+
+    * ``track(coro, label)`` — запустить единицу работы (доставку одному
+      пользователю) так, чтобы отмена вызывающего цикла её не обрывала;
+    * ``accepting`` — массовые циклы проверяют флаг перед каждым пользователем;
+    * ``skipped(what, n)`` — цикл сообщает, сколько элементов не успел начать;
+    * ``on_drain(name, hook)`` — асинхронные хуки сброса буферов/закрытия соединений.
+    """
+
+    def __init__(self, *, deadline: float = 8.0):
+        self.deadline = deadline
+        self.accepting = True
+        self._inflight: Dict[asyncio.Task, str] = {}
+        self._hooks: List[Tuple[str, Callable[[], Awaitable[Any]]]] = []
+        self._skipped: Counter[str] = Counter()
+        self._drained = False
+
+    def track(self, coro: Coroutine[Any, Any, T], label: str) -> Awaitable[T]:
+        task = asyncio.ensure_future(coro)
+        self._inflight[task] = label
+        task.add_done_callback(lambda t: self._inflight.pop(t, None))
+        return asyncio.shield(task)
+
+    def skipped(self, what: str, n: int) -> None:
+        if n > 0:
+            self._skipped[what] += n
+
+    def on_drain(self, name: str, hook: Callable[[], Awaitable[Any]]) -> None:
+        self._hooks.append((name, hook))
+
+    async def drain(self) -> None:
+        if self._drained:
+            return
+        self._drained = True
+        self.accepting = False
+        started = time.monotonic()
+        deadline = started + self.deadline
+
+        finished, abandoned = 0, []
+        pending = set(self._inflight)
+        if pending:
+            logger.info("shutdown: waiting for %d in-flight deliveries (deadline %.1fs)", len(pending), self.deadline)
+            done, pending = await asyncio.wait(pending, timeout=self.deadline)
+            finished = len(done)
+            abandoned = sorted(self._inflight.get(t, "?") for t in pending)
+            for t in pending:
+                t.cancel()  # доставка сама фиксирует уже отправленное (см. deliver_reel_to_user)
+            if pending:
+                await asyncio.wait(pending, timeout=1.0)
+
+        for name, hook in self._hooks:
+            try:
+                await asyncio.wait_for(hook(), timeout=max(0.5, deadline - time.monotonic()))
+            except Exception:
+                logger.exception("shutdown: hook %s failed", name)
+
+        logger.info(
+            "shutdown: drained in %.2fs, finished=%d, abandoned=%d%s, not started=%s",
+            time.monotonic() - started,
+            finished,
+            len(abandoned),
+            f" {abandoned}" if abandoned else "",
+            dict(self._skipped) or 0,
+        )
+
+
+class DrainingApplication(Application):
+    """Application, которое перед штатной остановкой дожидается drain()."""
+
+    async def stop(self) -> None:
+        await shutdown.drain()
+        await super().stop()
+
+
+shutdown = ShutdownCoordinator(deadline=float(os.getenv("SHUTDOWN_DEADLINE_SECONDS", "8")))
@@ -5,16 +5,13 @@ load_dotenv(find_dotenv())
 
 import pytz
 from datetime import time as dtime
-from bot.domain.services.reel_delivery_service import deliver_reels_daily
-from bot.api.handlers.reels_admin import reels_send_now
-from bot.api.handlers.util_tools import chatid, whoami
 
 
 import logging
 import os
-import re
 from bot.db.subscriptions import init_db
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
@@ -23,112 +20,215 @@ from telegram.ext import (
     filters,
 )
 
-from bot.api.handlers.reels_admin import (
-    reel_new, reel_video, reel_preview, reel_caption, reel_confirm_cb, reel_cancel_command,
-    reels_list, reels_manage_cb,
-    VIDEO, PREVIEW, CAPTION, CONFIRM,   # ← импортируй константы состояний
-)
 from bot.config import settings
-from bot.constants import CallbackData
+from bot.constants import CallbackData, REEL_VIDEO, REEL_PREVIEW, REEL_CAPTION, REEL_CONFIRM
 from telegram.ext import ContextTypes
-from bot.api.handlers import admin_panel, common, onboarding, payments, admin, support
-from bot.api.handlers.admin_panel import whois, admin_open, admin_callbacks
 
-from bot.api.handlers import trial
-from bot.domain.services import user_service, payment_service, referral_service
+# Модули хендлеров импортируются при первом апдейте (см. bot/api/lazy.py),
+# чтобы рестарт контейнера быстрее доходил до polling.
+from bot.api.lazy import lazy, preload, resolve
+from bot.api.update_processor import KeyedUpdateProcessor
+from bot.api.router import CallbackRouter
+from bot.db.persistence import SqlitePersistence
+from bot.api.antiflood import AntiFlood
+from bot.api.usernames import UsernameTracker
+from bot.integration.telegram.outbound import OutboundDispatcher
+from bot.domain.services.admin_notify import admin_notifier
+from bot.domain.services.event_log import event_log
+from bot.domain.services.outbox import outbox
+from bot.lifecycle import DrainingApplication, shutdown
 
 logger = logging.getLogger(__name__)
 
 TZ = pytz.timezone("Europe/Amsterdam")
 HOUR = int(os.getenv("REELS_SEND_HOUR", "10"))
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "25"))
+ANTIFLOOD_RATE = float(os.getenv("ANTIFLOOD_RATE", "1"))
+ANTIFLOOD_BURST = int(os.getenv("ANTIFLOOD_BURST", "5"))
+ANTIFLOOD_DUP_WINDOW = float(os.getenv("ANTIFLOOD_DUP_WINDOW", "1.5"))
+STATE_TTL = float(os.getenv("STATE_TTL_SECONDS", str(6 * 3600)))
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_SECONDS", "30"))
+EXPIRE_SWEEP_INTERVAL = float(os.getenv("EXPIRE_SWEEP_SECONDS", "600"))
+USERNAME_FLUSH_INTERVAL = float(os.getenv("USERNAME_FLUSH_SECONDS", "15"))
+USERNAME_REFRESH_INTERVAL = float(os.getenv("USERNAME_REFRESH_SECONDS", "600"))
+USERNAME_REFRESH_BATCH = int(os.getenv("USERNAME_REFRESH_BATCH", "50"))
+LAZY_PRELOAD = os.getenv("LAZY_PRELOAD", "1") == "1"
+
+ADMIN = "bot.api.handlers.admin"
+ADMIN_PANEL = "bot.api.handlers.admin_panel"
+COMMON = "bot.api.handlers.common"
+ONBOARDING = "bot.api.handlers.onboarding"
+SUPPORT = "bot.api.handlers.support"
+TRIAL = "bot.api.handlers.trial"
+REELS = "bot.api.handlers.reels_admin"
+
+
+async def _expire_lapsed_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Просроченные подписки/фритрайлы -> EXPIRED, чтобы счётчики /stats оставались точными.
+    from bot.db.stats import expire_lapsed
+
+    subs, trials = expire_lapsed()
+    if subs or trials:
+        logger.info("stats: expired subscriptions=%s, trials=%s", subs, trials)
+
+
+async def _usernames_flush_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await context.application.bot_data["usernames"].flush()
+
+
+async def _usernames_refresh_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    await context.application.bot_data["usernames"].refresh_stale(context.bot)
 
 
 async def _reels_daily_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    deliver_reels_daily = resolve("bot.domain.services.reel_delivery_service:deliver_reels_daily")
     await deliver_reels_daily(context.application.bot)
 
-def _cbv(x) -> str:
-    return getattr(x, "value", x)
+def setup_handlers(app):
 
-def _exact(cb) -> str:
-    return rf"^{re.escape(_cbv(cb))}$"
+    # Ники из входящих апдейтов — раньше антифлуда, чтобы видеть все апдейты.
+    usernames = UsernameTracker(batch=USERNAME_REFRESH_BATCH)
+    app.bot_data["usernames"] = usernames
+    app.add_handler(usernames.handler(), group=-2)
+    shutdown.on_drain("usernames", usernames.flush)
+
+    antiflood = AntiFlood(
+        rate=ANTIFLOOD_RATE,
+        burst=ANTIFLOOD_BURST,
+        dup_window=ANTIFLOOD_DUP_WINDOW,
+        exempt=(settings.ADMIN_ID,),
+    )
+    app.bot_data["antiflood"] = antiflood
+    app.add_handler(antiflood.handler(), group=-1)
 
-def setup_handlers(app):
-        
-    app.add_handler(CommandHandler("start", common.start_handler))
+    app.add_handler(CommandHandler("start", lazy(f"{COMMON}:start_handler")))
 
     for h in [
-        CommandHandler("price", admin.price_command),
-        CommandHandler("stats", admin.stats_command),
-        CommandHandler("list", admin.list_users_command),
-        CommandHandler("reply", support.admin_reply),
-        CommandHandler("whois", whois),
-        CommandHandler("admin", admin_open),
+        CommandHandler("price", lazy(f"{ADMIN}:price_command")),
+        CommandHandler("stats", lazy(f"{ADMIN}:stats_command")),
+        CommandHandler("revenue", lazy(f"{ADMIN}:revenue_command")),
+        CommandHandler("list", lazy(f"{ADMIN}:list_users_command")),
+        CommandHandler("export", lazy(f"{ADMIN}:export_command")),
+        CommandHandler("reply", lazy(f"{SUPPORT}:admin_reply")),
+        CommandHandler("whois", lazy(f"{ADMIN_PANEL}:whois")),
+        CommandHandler("admin", lazy(f"{ADMIN_PANEL}:admin_open")),
+        CommandHandler("find", lazy(f"{ADMIN_PANEL}:find_command")),
+        CommandHandler("bulk", lazy(f"{ADMIN_PANEL}:bulk_command")),
+        CommandHandler("metrics", lazy(f"{ADMIN}:metrics_command")),
+        CommandHandler("funnel", lazy(f"{ADMIN}:funnel_command")),
+        CommandHandler("tree", lazy(f"{ADMIN}:tree_command")),
      ]:
         app.add_handler(h)
 
 
-    app.add_handler(CommandHandler("reels_send_now", reels_send_now))
-
-    app.add_handler(CallbackQueryHandler(admin_callbacks, pattern=r"^adm:"))
-    app.add_handler(CallbackQueryHandler(onboarding.intro_done, pattern=_exact(CallbackData.INTRO_DONE), block=True), group=0)
-    app.add_handler(CallbackQueryHandler(onboarding.want_join, pattern=_exact(CallbackData.WANT_JOIN), block=True), group=0)
-    app.add_handler(CallbackQueryHandler(onboarding.about_project, pattern=_exact(CallbackData.ABOUT), block=True), group=0)
-
-    app.add_handler(CallbackQueryHandler(trial.offer_after_new_role, pattern=r"(?i)^role_new(?:.*)$", block=False), group=0)
-    app.add_handler(CallbackQueryHandler(onboarding.role_choice, pattern=r"(?i)^role_(?:new|old)(?:.*)$", block=False), group=0)
-
-    app.add_handler(CallbackQueryHandler(trial.start_free_trial_cb, pattern=_exact(CallbackData.TRIAL_START), block=True), group=0)
-
-    app.add_handler(CallbackQueryHandler(trial.pay_now_fallback, pattern=_exact(CallbackData.PAY_NOW), block=True), group=0)
+    app.add_handler(CommandHandler("reels_send_now", lazy(f"{REELS}:reels_send_now")))
+
+    callbacks = CallbackRouter()
+    callbacks.add("adm", lazy(f"{ADMIN_PANEL}:admin_callbacks"), int, str, rest=True)
+    callbacks.add("price", lazy(f"{ADMIN}:price_cb"), int, int)
+    callbacks.add("bulk:run", lazy(f"{ADMIN_PANEL}:bulk_run_cb"))
+    callbacks.add("bulk:cancel", lazy(f"{ADMIN_PANEL}:bulk_cancel_cb"))
+    callbacks.add(CallbackData.INTRO_DONE, lazy(f"{ONBOARDING}:intro_done"))
+    callbacks.add(CallbackData.WANT_JOIN, lazy(f"{ONBOARDING}:want_join"))
+    callbacks.add(CallbackData.ABOUT, lazy(f"{ONBOARDING}:about_project"))
+    callbacks.add(CallbackData.ROLE_NEW, lazy(f"{ONBOARDING}:role_choice"))
+    callbacks.add(CallbackData.ROLE_OLD, lazy(f"{ONBOARDING}:role_choice"))
+    callbacks.add(CallbackData.TRIAL_START, lazy(f"{TRIAL}:start_free_trial_cb"))
+    callbacks.add(CallbackData.PAY_NOW, lazy(f"{TRIAL}:pay_now_fallback"))
+    callbacks.add("reel:activate", lazy(f"{REELS}:reel_activate_cb"), int)
+    callbacks.add("reel:deactivate", lazy(f"{REELS}:reel_deactivate_cb"), int)
+    callbacks.add("reel:delete", lazy(f"{REELS}:reel_delete_cb"), int)
+    callbacks.add("reel:show", lazy(f"{REELS}:reel_show_cb"), int)
+    app.add_handler(callbacks.handler(block=True), group=0)
 
     insta_regex = r"^(?:@)?[A-Za-z0-9._]{2,30}$"
-    app.add_handler(MessageHandler(filters.Regex(insta_regex), onboarding.handle_instagram_nick, block=True), group=1)
+    app.add_handler(MessageHandler(filters.Regex(insta_regex), lazy(f"{ONBOARDING}:handle_instagram_nick"), block=True), group=1)
 
-    app.add_handler(MessageHandler(filters.Regex("^(📞 Поддержка|👥 Реферальная ссылка|📊 Статистика)$"), common.menu_handler, block=True), group=1)
+    app.add_handler(MessageHandler(filters.Regex("^(📞 Поддержка|👥 Реферальная ссылка|📊 Статистика)$"), lazy(f"{COMMON}:menu_handler"), block=True), group=1)
 
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, support.support_message, block=True), group=1)
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lazy(f"{SUPPORT}:support_message"), block=True), group=1)
 
+    reel_confirm = CallbackQueryHandler(lazy(f"{REELS}:reel_confirm_cb"), pattern=r"^reel:(?:cancel|save:)")
     app.add_handler(ConversationHandler(
-    entry_points=[CommandHandler("reel_new", reel_new)],
+    entry_points=[CommandHandler("reel_new", lazy(f"{REELS}:reel_new"))],
     states={
-        VIDEO:   [MessageHandler(filters.VIDEO, reel_video),   CallbackQueryHandler(reel_confirm_cb, pattern=r"^reel:(?:cancel|save:)")],
-        PREVIEW: [MessageHandler(filters.PHOTO, reel_preview), CallbackQueryHandler(reel_confirm_cb, pattern=r"^reel:(?:cancel|save:)")],
-        CAPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, reel_caption), CallbackQueryHandler(reel_confirm_cb, pattern=r"^reel:(?:cancel|save:)")],
-        CONFIRM: [CallbackQueryHandler(reel_confirm_cb, pattern=r"^reel:(?:cancel|save:)")],
+        REEL_VIDEO:   [MessageHandler(filters.VIDEO, lazy(f"{REELS}:reel_video")),   reel_confirm],
+        REEL_PREVIEW: [MessageHandler(filters.PHOTO, lazy(f"{REELS}:reel_preview")), reel_confirm],
+        REEL_CAPTION: [MessageHandler(filters.TEXT & ~filters.COMMAND, lazy(f"{REELS}:reel_caption")), reel_confirm],
+        REEL_CONFIRM: [reel_confirm],
     },
-    fallbacks=[CommandHandler("reel_cancel", reel_cancel_command)],
+    fallbacks=[CommandHandler("reel_cancel", lazy(f"{REELS}:reel_cancel_command"))],
     allow_reentry=True,
+    name="reel_new",
+    persistent=True,
     #per_message=True,   
     ))
 
 
-    #app.add_handler(CommandHandler("chatid", chatid))
-    #app.add_handler(CommandHandler("whoami", whoami))
-    app.add_handler(CommandHandler("reels", reels_list))
-    app.add_handler(CallbackQueryHandler(reels_manage_cb, pattern=r"^reel:(?:activate|deactivate|delete|show):"))
+    #app.add_handler(CommandHandler("chatid", lazy("bot.api.handlers.util_tools:chatid")))
+    #app.add_handler(CommandHandler("whoami", lazy("bot.api.handlers.util_tools:whoami")))
+    app.add_handler(CommandHandler("reels", lazy(f"{REELS}:reels_list")))
+    app.add_handler(CommandHandler("reel_stats", lazy(f"{REELS}:reel_stats")))
 
     app.job_queue.run_daily(
     callback=_reels_daily_job,
     time=dtime(hour=HOUR, minute=0, tzinfo=TZ),
     name="reels_daily",
 )
-
-def main() -> None:
-    init_db()
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
-
-    application = ApplicationBuilder().token(settings.TOKEN).build()
-
-    application.bot_data.update(
-        user_service=user_service,
-        payment_service=payment_service,
-        referral_service=referral_service,
+    app.job_queue.run_repeating(_usernames_flush_job, interval=USERNAME_FLUSH_INTERVAL, name="usernames_flush")
+    app.job_queue.run_repeating(_usernames_refresh_job, interval=USERNAME_REFRESH_INTERVAL, first=60, name="usernames_refresh")
+    app.job_queue.run_repeating(_expire_lapsed_job, interval=EXPIRE_SWEEP_INTERVAL, first=10, name="expire_lapsed")
+
+async def _post_init(application: Application) -> None:
+    admin_notifier.start(application.bot, settings.ADMIN_ID)
+    event_log.start()
+    outbox.start(application.bot)
+    if LAZY_PRELOAD:
+        # Хендлеры догружаются в фоне, пока бот уже принимает апдейты.
+        application.create_task(preload(), name="lazy_preload")
+
+
+def build_application(*, polling: bool = True) -> Application:
+    """Собирает Application с хендлерами и сервисами.
+
+    polling=False — режим вебхука: Updater не создаётся, апдейты кладёт
+    в update_queue внешний HTTP-сервер (см. backend/app.py).
+    """
+    persistence = SqlitePersistence(ttl=STATE_TTL, update_interval=STATE_FLUSH_INTERVAL)
+    builder = (
+        ApplicationBuilder()
+        .token(settings.TOKEN)
+        .concurrent_updates(KeyedUpdateProcessor(CONCURRENT_UPDATES))
+        .persistence(persistence)
+        .rate_limiter(OutboundDispatcher(rate=OUTBOUND_RATE))
+        .application_class(DrainingApplication)
+        .post_init(_post_init)
     )
+    if not polling:
+        builder = builder.updater(None)
+    application = builder.build()
+    persistence.attach(application)
+    # Порядок остановки: доставки дорабатывают в drain(), затем сводка админу;
+    # состояние PTB сбрасывает сам в Application.shutdown().
+    shutdown.on_drain("admin_digest", admin_notifier.stop)
+    shutdown.on_drain("event_log", event_log.stop)
+    shutdown.on_drain("outbox", outbox.stop)
+    shutdown.on_drain("funnel_pool", lazy("bot.domain.services.funnel:close_pool"))
+
     fe = os.getenv("FRONTEND_URL")
     if fe:
         application.bot_data["FRONTEND_URL"] = fe
 
     setup_handlers(application)
+    return application
+
+
+def main() -> None:
+    init_db()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    application = build_application()
 
     logger.info("Bot started and polling…")
     application.run_polling()
@@ -1,4 +1,5 @@
 import logging
+import os
 from typing import List, Tuple
 from telegram import Bot
 from telegram.constants import ParseMode
@@ -16,6 +17,16 @@ async def send_long(bot: Bot, chat_id: int, text: str) -> None:
     if part:
         await bot.send_message(chat_id, part, parse_mode=ParseMode.HTML)
 
+def allowed_price_amounts() -> List[int]:
+    """Суммы, для которых в окружении задана ссылка LAVA_LINK_<amount>."""
+    amounts: List[int] = []
+    for key, val in os.environ.items():
+        if key.startswith("LAVA_LINK_") and val:
+            tail = key.removeprefix("LAVA_LINK_")
+            if tail.isdigit():
+                amounts.append(int(tail))
+    return sorted(set(amounts))
+
 def fmt_table(rows: List[Tuple], headers: List[str]) -> str:
     cols = list(zip(headers, *rows))
     widths = [max(len(str(v)) for v in col) for col in cols]
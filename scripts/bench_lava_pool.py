@@ -0,0 +1,57 @@
+"""Микробенчмарк пула соединений Lava: новый клиент на каждый счёт против
+общего ``LavaClient`` (без сети, через MockTransport).
+
+    python -m scripts.bench_lava_pool [N]
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+from bot.integration.lava.client import LavaClient
+
+
+async def bench(n: int, handshake: float, rtt: float) -> None:
+    """Счета подряд: новый клиент на каждый счёт (как было) vs общий пул.
+
+    MockTransport соединений не открывает, поэтому «рукопожатие» имитируется
+    задержкой на первом запросе каждого транспорта, то есть каждого клиента.
+    """
+    class _Transport(httpx.MockTransport):
+        def __init__(self) -> None:
+            self.connected = False
+            super().__init__(self.handle)
+
+        async def handle(self, request: httpx.Request) -> httpx.Response:
+            if not self.connected:
+                self.connected = True
+                await asyncio.sleep(handshake)
+            await asyncio.sleep(rtt)
+            return httpx.Response(200, json={"paymentUrl": "https://pay.example/x"})
+
+    kwargs = dict(email="bench@example.com", offer_id="offer", periodicity="PERIOD_30_DAYS")
+    os.environ.setdefault("LAVA_SHOP_API_KEY", "bench")
+
+    t = time.perf_counter()
+    for _ in range(n):
+        async with LavaClient(transport=_Transport()) as cli:
+            await cli.create_invoice(**kwargs)
+    per_call = (time.perf_counter() - t) / n
+
+    t = time.perf_counter()
+    async with LavaClient(transport=_Transport()) as cli:
+        for _ in range(n):
+            await cli.create_invoice(**kwargs)
+    pooled = (time.perf_counter() - t) / n
+
+    print(f"{n} счетов, рукопожатие {handshake * 1000:.0f} мс, RTT {rtt * 1000:.0f} мс")
+    print(f"клиент на каждый счёт: {per_call * 1000:7.2f} мс/счёт")
+    print(f"общий пул:             {pooled * 1000:7.2f} мс/счёт  (x{per_call / pooled:.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200, handshake=0.05, rtt=0.01))
@@ -0,0 +1,77 @@
+"""Микробенчмарк разбора callback_data: цепочка regex-хендлеров (как было
+в setup_handlers) против ``CallbackRouter``.
+
+    python -m scripts.bench_router
+"""
+from __future__ import annotations
+
+import re
+import timeit
+from typing import Any
+
+from bot.api.router import CallbackRouter
+
+
+def _exact(s: str) -> str:
+    return rf"^{re.escape(s)}$"
+
+
+# Паттерны хендлеров в порядке регистрации до перехода на роутер.
+CHAIN = [re.compile(p) for p in (
+    r"^adm:",
+    _exact("intro_done"),
+    _exact("want_join"),
+    _exact("about"),
+    r"(?i)^role_new(?:.*)$",
+    r"(?i)^role_(?:new|old)(?:.*)$",
+    _exact("trial_start"),
+    _exact("pay_now"),
+    r"^reel:(?:cancel|save:)",
+    r"^reel:(?:activate|deactivate|delete|show):",
+)]
+
+
+async def _noop(*_: Any) -> None:
+    pass
+
+
+def main() -> None:
+    router = CallbackRouter()
+    router.add("adm", _noop, int, str, rest=True)
+    for name in ("intro_done", "want_join", "about", "role_new", "role_old", "trial_start", "pay_now"):
+        router.add(name, _noop)
+    for action in ("activate", "deactivate", "delete", "show"):
+        router.add(f"reel:{action}", _noop, int)
+
+    payloads = [
+        "adm:123456789:sub:extend:1m", "intro_done", "want_join", "about", "role_new",
+        "role_old", "trial_start", "pay_now", "reel:show:42", "reel:delete:42", "unknown:1",
+    ]
+
+    def run_chain() -> None:
+        for data in payloads:
+            for rx in CHAIN:
+                if rx.match(data):
+                    break
+        # ручной разбор, как в admin_callbacks/reels_manage_cb
+        _, uid, *rest = payloads[0].split(":")
+        int(uid), ":".join(rest)
+        int(payloads[8].split(":")[2])
+
+    def run_router() -> None:
+        for data in payloads:
+            found = router.resolve(data)
+            if found:
+                found[0].parse(found[1])
+
+    n = 20000
+    t_chain = timeit.timeit(run_chain, number=n)
+    t_router = timeit.timeit(run_router, number=n)
+    per = n * len(payloads)
+    print(f"regex chain: {t_chain / per * 1e9:8.1f} ns/callback")
+    print(f"router:      {t_router / per * 1e9:8.1f} ns/callback")
+    print(f"speedup:     x{t_chain / t_router:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Микробенчмарк подтверждения оплат в ``SubscriptionRepo.mark_paid``.
+
+Меняется по одному фактору: соединение на вызов vs общее соединение
+(при одинаковом индексе) и индекс (user_id, status) vs без него (при
+одинаковом режиме соединения). Каждый вариант — на свежей копии одних и тех
+же данных, с одинаковыми PRAGMA (``bot.db.repository.aio.connect``).
+
+    python -m scripts.bench_subscription_repo [N]
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from bot.db.repository.aio import connect
+from bot.db.repository.subscription_repo import SubscriptionRepo
+
+HISTORY = 10   # оплаченных счетов у каждого пользователя до замера
+
+
+async def _prepare(path: str, n: int, index: bool) -> None:
+    repo = await SubscriptionRepo.open(path)
+    try:
+        if not index:
+            await repo.db.execute("DROP INDEX ix_subscriptions_user_status")
+        await repo.db.execute("BEGIN")
+        await repo.db.executemany(
+            "INSERT INTO subscriptions (user_id, email, status, payment_url) VALUES (?, 'b@example.com', 'paid', 'u')",
+            [(uid % n,) for uid in range(n * HISTORY)],
+        )
+        await repo.db.executemany(
+            "INSERT INTO subscriptions (user_id, email, status, payment_url) VALUES (?, 'b@example.com', 'pending', 'u')",
+            [(uid,) for uid in range(n)],
+        )
+        await repo.db.execute("COMMIT")
+    finally:
+        await repo.close()
+
+
+async def _run(path: str, n: int, reuse: bool) -> float:
+    today = date.today()
+    t = time.perf_counter()
+    if reuse:
+        repo = SubscriptionRepo(await connect(path), path)
+        try:
+            for uid in range(n):
+                await repo.mark_paid(user_id=uid, started_at=today)
+        finally:
+            await repo.close()
+    else:
+        for uid in range(n):
+            repo = SubscriptionRepo(await connect(path), path)
+            try:
+                await repo.mark_paid(user_id=uid, started_at=today)
+            finally:
+                await repo.close()
+    return n / (time.perf_counter() - t)
+
+
+async def bench(n: int) -> None:
+    tmp = tempfile.mkdtemp()
+    rate = {}
+    for reuse in (False, True):
+        for index in (False, True):
+            path = os.path.join(tmp, f"bench-{int(reuse)}{int(index)}.sqlite3")
+            await _prepare(path, n, index)
+            rate[reuse, index] = await _run(path, n, reuse)
+
+    print(f"{n} подтверждений, {n * (HISTORY + 1)} строк в subscriptions")
+    print(f"{'':24}{'без индекса':>14}{'индекс':>14}{'эффект индекса':>18}")
+    for reuse, title in ((False, "соединение на вызов"), (True, "общее соединение")):
+        off, on = rate[reuse, False], rate[reuse, True]
+        print(f"{title:24}{off:12.0f}/с{on:12.0f}/с{on / off:17.1f}x")
+    print(f"{'эффект общего соединения':24}"
+          f"{rate[True, False] / rate[False, False]:13.1f}x{rate[True, True] / rate[False, True]:13.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))